@@ -0,0 +1,54 @@
+"""
+Measures the Python overhead of dispatching a packet from a backend, with Pusher's HTTP calls stubbed out.
+
+    DJANGO_SETTINGS_MODULE=example.settings SECRET_KEY=x python benchmarks/bench_dispatch.py
+
+`direct` is the dispatch path used while only the default receivers are connected,
+`signal` sends the view_post_save signal to send_pusher_event as before it.
+"""
+import os
+import sys
+import timeit
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "example.settings")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import django  # noqa: E402
+
+django.setup()
+
+from drf_model_pusher.signals import view_post_save  # noqa: E402
+from example.pusher_backends import MyPublicModelPusherBackend  # noqa: E402
+
+NUMBER = 20000
+
+
+def main():
+    backend = MyPublicModelPusherBackend()
+    packet = (["my-channel"], "mypublicmodel.update", {"name": "Henry"})
+    kwargs = dict(
+        sender=backend.__class__,
+        instance=backend,
+        channels=packet[0],
+        event_name=packet[1],
+        data=packet[2],
+        socket_id=None,
+        provider_class=backend.provider_class,
+        priority=backend.get_event_priority("update"),
+    )
+
+    benchmarks = {
+        "direct": lambda: backend.push_packet("update", packet),
+        "signal": lambda: view_post_save.send(**kwargs),
+    }
+    with mock.patch("pusher.Pusher.trigger", new=lambda *args, **kwargs: None):
+        for name, func in benchmarks.items():
+            func()
+            best = min(timeit.repeat(func, number=NUMBER, repeat=5))
+            print("{0:<8} {1:8.2f} us/event".format(name, best / NUMBER * 1e6))
+
+
+if __name__ == "__main__":
+    main()
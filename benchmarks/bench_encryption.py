@@ -0,0 +1,59 @@
+"""
+Measures the cost of sending one event to many channels, with Pusher's HTTP requests stubbed out.
+
+    DJANGO_SETTINGS_MODULE=example.settings SECRET_KEY=x python benchmarks/bench_encryption.py
+
+`private` sends to private channels, `pusher-encrypted` to encrypted channels
+encrypted by Pusher's client, and `encrypted` to encrypted channels through
+EncryptedPusherProvider.
+"""
+import base64
+import os
+import sys
+import timeit
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "example.settings")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import override_settings  # noqa: E402
+
+from drf_model_pusher.encryption import EncryptedPusherProvider  # noqa: E402
+from drf_model_pusher.providers import PusherProvider  # noqa: E402
+
+NUMBER = 200
+CHANNELS = 100
+
+
+def main():
+    data = {"id": 1, "name": "Henry", "tags": ["tag-{0}".format(i) for i in range(50)], "notes": "x" * 500}
+    private = ["private-team-{0}".format(i) for i in range(CHANNELS)]
+    encrypted = ["private-encrypted-team-{0}".format(i) for i in range(CHANNELS)]
+
+    benchmarks = {
+        "private": (PusherProvider, private),
+        "pusher-encrypted": (PusherProvider, encrypted),
+        "encrypted": (EncryptedPusherProvider, encrypted),
+    }
+    master_key = base64.b64encode(os.urandom(32)).decode("ascii")
+    with override_settings(PUSHER_ENCRYPTION_MASTER_KEY_BASE64=master_key, DRF_MODEL_PUSHER_BATCH_SIZE=10):
+        with mock.patch("pusher.requests.RequestsBackend.send_request", new=lambda self, request: {}):
+            for name, (provider_class, channels) in benchmarks.items():
+                provider = provider_class()
+                provider.configure()
+
+                def func():
+                    provider.trigger_batch([(channels, "mymodel.update", data)])
+
+                func()
+                best = min(timeit.repeat(func, number=NUMBER, repeat=5))
+                print("{0:<18} {1:8.2f} us/event".format(name, best / NUMBER / CHANNELS * 1e6))
+
+
+if __name__ == "__main__":
+    main()
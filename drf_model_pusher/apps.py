@@ -1,27 +1,69 @@
 """AppConfig for drf_model_pusher"""
-import os
 from importlib import import_module
+from importlib.util import find_spec
 
 from django.apps import AppConfig
 from django.conf import settings
+from django.utils.module_loading import import_string
 
 
 class DrfModelPusherConfig(AppConfig):
     name = "drf_model_pusher"
 
     def ready(self):
-        """Attach receivers to Signals and import pusher backends."""
-        from drf_model_pusher.config import connect_pusher_views
+        """Attach receivers to Signals, import pusher backends and warm up channel occupancy."""
+        from drf_model_pusher.config import connect_pusher_models, connect_pusher_views
 
         connect_pusher_views()
 
-        pusher_backends_file = "pusher_backends.py"
+        from django.apps import apps
 
-        if hasattr(settings, "DRF_MODEL_PUSHER_BACKENDS_FILE"):
-            pusher_backends_file = settings.DRF_MODEL_PUSHER_BACKENDS_FILE
+        self.discover_backend_modules(apps.get_app_configs())
+        self.register_app_config_backends(apps.get_app_configs())
 
-        from django.apps import apps
+        pusher_models = getattr(settings, "DRF_MODEL_PUSHER_MODELS", [])
+        connect_pusher_models(*[apps.get_model(label) for label in pusher_models])
+
+        from drf_model_pusher.occupancy_sync import warm_up_occupancy
+
+        warm_up_occupancy()
+
+    def discover_backend_modules(self, app_configs):
+        """Import each app's pusher backends module, or defer it until the apps models are first pushed
+        when `DRF_MODEL_PUSHER_LAZY_BACKENDS` is enabled."""
+        from drf_model_pusher.backends import pusher_backend_registry
+
+        pusher_backends_file = getattr(settings, "DRF_MODEL_PUSHER_BACKENDS_FILE", "pusher_backends.py")
+        pusher_backends_module = (
+            pusher_backends_file[:-3] if pusher_backends_file.endswith(".py") else pusher_backends_file
+        )
+        lazy = getattr(settings, "DRF_MODEL_PUSHER_LAZY_BACKENDS", False)
+
+        for app_config in app_configs:
+            module_name = "{0}.{1}".format(app_config.name, pusher_backends_module)
+            try:
+                spec = find_spec(module_name)
+            except ImportError:
+                spec = None
+
+            if spec is None:
+                continue
+
+            if lazy:
+                pusher_backend_registry.add_lazy_module(app_config.label, module_name)
+            else:
+                import_module(module_name)
+
+    def register_app_config_backends(self, app_configs):
+        """Register backends declared on an AppConfig's `pusher_backends` attribute.
+
+        Entries may be backend classes or dotted paths, optionally paired with a model
+        as a `(backend, model)` tuple."""
+        from drf_model_pusher.backends import pusher_backend_registry
 
-        for app_config in apps.get_app_configs():
-            if os.path.exists(os.path.join(app_config.path, pusher_backends_file)):
-                import_module("{0}.pusher_backends".format(app_config.name))
+        for app_config in app_configs:
+            for entry in getattr(app_config, "pusher_backends", ()):
+                backend, model = entry if isinstance(entry, (list, tuple)) else (entry, None)
+                if isinstance(backend, str):
+                    backend = import_string(backend)
+                pusher_backend_registry.register(backend, model=model)
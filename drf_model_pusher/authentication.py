@@ -15,7 +15,9 @@ class PusherWebhookAuthentication(BaseAuthentication):
         :param request:
         :return:
         """
-        validated_data = PusherProvider().client.validate_webhook(
+        view = request.parser_context.get("view") if request.parser_context else None
+        provider = PusherProvider(app=getattr(view, "pusher_app", None))
+        validated_data = provider.client.validate_webhook(
             key=request.META.get("HTTP_X_PUSHER_KEY"),
             signature=request.META.get("HTTP_X_PUSHER_SIGNATURE"),
             body=json.dumps(request.data, separators=(',', ':'))
@@ -1,24 +1,159 @@
 """
 PusherBackend classes define how changes from a Model are serialized, and then which provider will send the message.
 """
+import threading
 from collections import defaultdict
+from importlib import import_module
 
 from django.conf import settings
-
+from django.db.models import prefetch_related_objects
+
+from drf_model_pusher.channel_cache import ChannelResolutionCache, get_resolver_name
+from drf_model_pusher.dispatch import (
+    ROUTE_DIRECT,
+    ROUTE_SIGNAL,
+    PusherBatch,
+    PusherPacket,
+    get_dispatcher,
+    get_signal_route,
+)
+from drf_model_pusher.encryption import ENCRYPTED_PREFIX, EncryptedPusherProvider
+from drf_model_pusher.exceptions import ModelPusherException
+from drf_model_pusher.idempotency import get_deduplicator, get_idempotency_key
+from drf_model_pusher.lanes import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL
 from drf_model_pusher.providers import PusherProvider
-from drf_model_pusher.signals import view_pre_destroy, view_post_save
+from drf_model_pusher.signals import view_pre_destroy, view_post_save, view_batch
+from drf_model_pusher.utils import chunked
+
+PUSH_CREATE = "create"
+PUSH_UPDATE = "update"
+PUSH_DELETE = "delete"
+
+
+def get_model_label(model):
+    """Return the lower cased "app_label.model_name" label for a model class or label string"""
+    if isinstance(model, str):
+        return model.lower()
+    return model._meta.label_lower
+
+
+class PusherBackendRegistry(object):
+    """
+    Registry of PusherBackend classes keyed by model label.
+
+    Lookups walk the model's MRO so proxy models and subclasses receive the
+    backends registered for their parents, the result is cached per model class.
+    Backend modules added with `add_lazy_module` are imported the first time one
+    of their app's models is looked up. Lookups which aren't cached are resolved one
+    at a time, so a lookup waits for a lazy import in progress in another thread.
+    """
+
+    def __init__(self):
+        self._registry = defaultdict(list)
+        self._resolved = {}
+        self._lazy_modules = {}
+        self._lock = threading.RLock()
+        self.version = 0
+
+    def add_lazy_module(self, app_label, module_name):
+        """Defer importing an app's backends module until one of its models is looked up"""
+        self._lazy_modules[app_label] = module_name
+
+    def register(self, backend_class, model=None):
+        """Register a backend class for a model, defaulting to the model of its serializer_class"""
+        if model is None:
+            model = backend_class.get_model()
+        backends = self._registry[get_model_label(model)]
+        if backend_class not in backends:
+            backends.append(backend_class)
+            self._invalidate()
+        return backend_class
+
+    def unregister(self, backend_class, model=None):
+        """Remove a backend class from a model, or from every model when no model is given"""
+        labels = [get_model_label(model)] if model is not None else list(self._registry)
+        for label in labels:
+            if backend_class in self._registry.get(label, []):
+                self._registry[label].remove(backend_class)
+        self._invalidate()
+
+    def get_backends(self, model):
+        """Return the backends registered for the model and any of its parent models"""
+        try:
+            return self._resolved[model]
+        except KeyError:
+            pass
+
+        with self._lock:
+            try:
+                return self._resolved[model]
+            except KeyError:
+                return self._resolve(model)
+
+    def _resolve(self, model):
+        metas = [
+            klass._meta for klass in model.__mro__
+            if getattr(getattr(klass, "_meta", None), "label_lower", None) is not None
+        ]
+
+        for meta in metas:
+            module_name = self._lazy_modules.pop(meta.app_label, None)
+            if module_name is not None:
+                import_module(module_name)
+
+        version = self.version
+        backends = []
+        for meta in metas:
+            for backend_class in self._registry.get(meta.label_lower, []):
+                if backend_class not in backends:
+                    backends.append(backend_class)
+
+        backends = tuple(backends)
+        # Backends registered meanwhile without the lock, e.g. by another thread, make the result stale
+        if self.version == version:
+            self._resolved[model] = backends
+        return backends
+
+    def clear(self):
+        """Remove every registered backend"""
+        self._registry.clear()
+        self._invalidate()
+
+    def __contains__(self, model):
+        return bool(self.get_backends(model))
+
+    def _invalidate(self):
+        self._resolved.clear()
+        self.version += 1
+
+
+pusher_backend_registry = PusherBackendRegistry()
+
+
+def register_pusher_backend(model=None):
+    """
+    Class decorator which registers a PusherBackend, for use with backends
+    declaring `Meta.auto_register = False` or to register against another model.
+    """
 
-pusher_backend_registry = defaultdict(list)
+    def decorator(backend_class):
+        return pusher_backend_registry.register(backend_class, model=model)
+
+    return decorator
 
 
 class PusherBackendMetaclass(type):
     """
     Register PusherBackend's with a registry for model lookups, supports
     "abstract" classes which are not registered but can extend functionality.
+
+    Set `auto_register = False` on the backends Meta to register it
+    explicitly with `register_pusher_backend` or an `AppConfig`.
     """
 
     def __new__(mcs, cls, bases, dicts):
-        if dicts.get("Meta") and hasattr(dicts.get("Meta"), "abstract"):
+        meta = dicts.get("Meta")
+        if meta and hasattr(meta, "abstract"):
             dicts["__metaclass__"] = mcs
             return super().__new__(mcs, cls, bases, dicts)
 
@@ -29,8 +164,8 @@ class PusherBackendMetaclass(type):
 
         final_cls = super().__new__(mcs, cls, bases, dicts)
 
-        model_name = dicts["serializer_class"].Meta.model.__name__.lower()
-        pusher_backend_registry[model_name].append(final_cls)
+        if getattr(meta, "auto_register", True):
+            pusher_backend_registry.register(final_cls)
         return final_cls
 
 
@@ -52,33 +187,132 @@ class PusherBackend(metaclass=PusherBackendMetaclass):
     packet_adapter_class = PacketAdapter
     provider_class = PusherProvider
 
-    def __init__(self, view):
+    # Related objects loaded when the instance is reloaded before serializing
+    select_related = ()
+    prefetch_related = ()
+
+    # Deletes send the primary key and these fields unless serialize_deletes is True
+    delete_key_fields = ()
+    serialize_deletes = False
+
+    # The dispatch lane of each event type, used when events are queued
+    event_priorities = {
+        PUSH_CREATE: PRIORITY_HIGH,
+        PUSH_DELETE: PRIORITY_HIGH,
+        PUSH_UPDATE: PRIORITY_LOW,
+    }
+
+    # Set to ChannelEventLog to record events so clients can catch up after reconnecting
+    event_log_class = None
+    sequence_key = "_seq"
+
+    # A field changing with every save, e.g. a version counter, identifying changes for deduplication.
+    # Without one changes are identified by their payload, for the deduplicator's shorter payload_ttl
+    idempotency_version_field = None
+
+    def __init__(self, view=None, channel_cache=None):
         self.view = view
+        self.channel_cache = channel_cache
         self.pusher_socket_id = self.get_pusher_socket(view)
         self.packet_adapter = PacketAdapter()
 
     def get_pusher_socket(self, view):
         """Return the socket from the request header."""
+        if view is None:
+            return None
         pusher_socket = view.request.META.get("HTTP_X_PUSHER_SOCKET_ID", None)
         return pusher_socket
 
     def push_change(self, event, instance=None, pre_destroy=False, ignore=True):
         """Send a signal to push the update"""
-        channels, event_name, data = self.get_packet(event, instance)
-        kwargs = dict(
-            sender=self.__class__,
-            instance=self,
-            channels=channels,
-            event_name=event_name,
-            data=data,
+        for packet in self.get_packets(event, instance):
+            self.push_packet(event, packet, pre_destroy=pre_destroy, ignore=ignore, instance=instance)
+
+    def push_packet(self, event, packet, pre_destroy=False, ignore=True, instance=None):
+        """Dispatch a (channels, event_name, data) packet for an event type on instance"""
+        channels, event_name, data = packet
+        packet = PusherPacket(
+            self.__class__,
+            self,
+            channels,
+            event_name,
+            data,
             socket_id=self.pusher_socket_id if ignore else None,
             provider_class=self.provider_class,
+            priority=self.get_event_priority(event),
+            idempotency_key=self.get_idempotency_key(event_name, data, instance),
         )
 
-        if pre_destroy:
-            view_pre_destroy.send(**kwargs)
-        else:
-            view_post_save.send(**kwargs)
+        signal = view_pre_destroy if pre_destroy else view_post_save
+        route = get_signal_route(signal)
+        if route == ROUTE_DIRECT:
+            get_dispatcher().dispatch(packet)
+        elif route == ROUTE_SIGNAL:
+            signal.send(**packet.as_signal_kwargs())
+
+    def push_changes(self, event, instances, pre_destroy=False, ignore=True, chunk_size=None):
+        """Send a signal to push the updates for many instances, one signal per chunk of packets
+
+        Instances are consumed lazily so an iterator can be streamed from the database."""
+        if chunk_size is None:
+            chunk_size = get_chunk_size()
+
+        for chunk in chunked(instances, chunk_size):
+            planned = [(packet, instance) for instance in chunk for packet in self.get_packets(event, instance)]
+            packets = [packet for packet, instance in planned]
+            idempotency_keys = None
+            if get_deduplicator() is not None:
+                idempotency_keys = [
+                    self.get_idempotency_key(event_name, data, instance)
+                    for (channels, event_name, data), instance in planned
+                ]
+            self.push_packets(
+                packets,
+                pre_destroy=pre_destroy,
+                ignore=ignore,
+                priority=self.get_event_priority(event),
+                idempotency_keys=idempotency_keys,
+            )
+
+    def push_packets(self, packets, pre_destroy=False, ignore=True, priority=None, idempotency_keys=None):
+        """Dispatch a batch of (channels, event_name, data) packets, with their idempotency keys if any"""
+        batch = PusherBatch(
+            self.__class__,
+            self,
+            packets,
+            socket_id=self.pusher_socket_id if ignore else None,
+            provider_class=self.provider_class,
+            pre_destroy=pre_destroy,
+            priority=priority,
+            idempotency_keys=idempotency_keys,
+        )
+
+        route = get_signal_route(view_batch)
+        if route == ROUTE_DIRECT:
+            get_dispatcher().dispatch_batch(batch)
+        elif route == ROUTE_SIGNAL:
+            view_batch.send(**batch.as_signal_kwargs())
+
+    def get_idempotency_key(self, event_name, data, instance=None):
+        """Return the key identifying the change for deduplication, or None when deduplication is disabled"""
+        if get_deduplicator() is None:
+            return None
+
+        version = None
+        if instance is not None and self.idempotency_version_field is not None:
+            version = str(getattr(instance, self.idempotency_version_field))
+        model = self.get_model() if instance is None else instance.__class__
+        pk = None if instance is None else instance.pk
+        return get_idempotency_key(get_model_label(model), pk, event_name, version, data)
+
+    def get_event_priority(self, event):
+        """Return the dispatch lane for an event type"""
+        return self.event_priorities.get(event, PRIORITY_NORMAL)
+
+    @classmethod
+    def get_model(cls):
+        """Return the model of the backends serializer_class"""
+        return cls.serializer_class.Meta.model
 
     def get_event_name(self, event_type):
         """Return the model name and the event_type separated by a dot"""
@@ -87,27 +321,91 @@ class PusherBackend(metaclass=PusherBackendMetaclass):
         return "{0}.{1}".format(model_class_name, event_type)
 
     def get_serializer_class(self):
-        """Return the views serializer class"""
+        """Return the views serializer class, or the backends when used without a view"""
+        if self.view is None:
+            return self.serializer_class
         return self.view.get_serializer_class()
 
     def get_serializer(self, view, *args, **kwargs):
         """Return the serializer initialized with the views serializer context"""
         serializer_class = self.get_serializer_class()
-        kwargs["context"] = view.get_serializer_context()
+        kwargs["context"] = view.get_serializer_context() if view is not None else {}
         return serializer_class(*args, **kwargs)
 
     def get_channels(self, instance=None):
         """Return the channel from the view or instance"""
+        if self.view is None:
+            if self.channel_cache is None:
+                return self.get_instance_channels(instance)
+            return self.channel_cache.resolve(
+                get_resolver_name(self.__class__.get_instance_channels),
+                instance,
+                lambda: self.get_instance_channels(instance),
+            )
+        if hasattr(self.view, "resolve_pusher_channels"):
+            return self.view.resolve_pusher_channels(instance=instance)
         channels = self.view.get_pusher_channels()
         return channels
 
+    def get_instance_channels(self, instance):
+        """Return the channels for an instance pushed without a view"""
+        if not hasattr(instance, "get_pusher_channels"):
+            raise ModelPusherException(
+                "{0} must implement the `get_pusher_channels` method or {1} must implement "
+                "`get_instance_channels` to push changes without a view".format(
+                    instance.__class__.__name__, self.__class__.__name__
+                )
+            )
+        return instance.get_pusher_channels()
+
     def get_packet(self, event, instance):
         """Return a tuple consisting of the channel, event name, and the JSON serializable data."""
         channels = self.get_channels(instance=instance)
         event_name = self.get_event_name(event)
-        data = self.get_serializer(self.view, instance=instance).data
-        channels, event_name, data = self.packet_adapter.parse_packet(channels, event_name, data)
-        return channels, event_name, data
+        if event == PUSH_DELETE and not self.serialize_deletes:
+            data = self.get_delete_data(instance)
+        else:
+            data = self.get_serializer(self.view, instance=instance).data
+        return self.packet_adapter.parse_packet(channels, event_name, data)
+
+    def get_packets(self, event, instance):
+        """Return the packets to send for an event, a packet per channel when the backend logs events"""
+        packet = self.get_packet(event, instance)
+        if self.event_log_class is None:
+            return [packet]
+        return self.log_packet(*packet)
+
+    def get_delete_data(self, instance):
+        """Return the lightweight representation of a deleted instance, its primary key and delete_key_fields"""
+        meta = instance._meta
+        data = {meta.pk.name: instance.pk}
+        for name in self.delete_key_fields:
+            data[name] = getattr(instance, meta.get_field(name).attname)
+
+        for name, value in data.items():
+            if not isinstance(value, (str, int, float, bool, type(None))):
+                data[name] = str(value)
+        return data
+
+    @classmethod
+    def get_delete_fields(cls):
+        """Return the fields needed to push a delete, or None when deletes are fully serialized"""
+        if cls.serialize_deletes:
+            return None
+        return ["pk"] + list(cls.delete_key_fields)
+
+    def log_packet(self, channels, event_name, data):
+        """
+        Record the event in each channel's event log, returning a packet per channel with its data
+        stamped with that channel's sequence number, so subscribers don't see other channels.
+        """
+        event_log = self.event_log_class()
+        packets = []
+        for channel in channels:
+            stamped = dict(data)
+            stamped[self.sequence_key] = {channel: event_log.append(channel, event_name, data)}
+            packets.append(([channel], event_name, stamped))
+        return packets
 
 
 class PrivatePusherBackend(PusherBackend):
@@ -136,6 +434,91 @@ class PresencePusherBackend(PusherBackend):
         return "presence-{channel}".format(channel=channel)
 
 
+class EncryptedPusherBackend(PusherBackend):
+    """EncryptedPusherBackend is the base class for implementing serializers
+    with Pusher's end to end encrypted channels, prefixing the channels with `private-encrypted-`."""
+
+    class Meta:
+        abstract = True
+
+    provider_class = EncryptedPusherProvider
+
+    def get_channels(self, instance=None):
+        """Return the channels prefixed with `private-encrypted-`"""
+        return [
+            channel if channel.startswith(ENCRYPTED_PREFIX) else "{0}{1}".format(ENCRYPTED_PREFIX, channel)
+            for channel in super().get_channels(instance=instance)
+        ]
+
+
 def get_models_pusher_backends(model):
     """Return the pusher backends registered for a model"""
-    return pusher_backend_registry.get(model.__name__.lower(), [])
+    return pusher_backend_registry.get_backends(model)
+
+
+def get_chunk_size():
+    """Return the number of instances serialized and sent per batch"""
+    return getattr(settings, "DRF_MODEL_PUSHER_CHUNK_SIZE", 100)
+
+
+def get_related_hints(backend_classes, event=None):
+    """Return the (select_related, prefetch_related) needed by backends to serialize an event"""
+    select_related, prefetch_related = [], []
+    for backend_class in backend_classes:
+        if event == PUSH_DELETE and not backend_class.serialize_deletes:
+            continue
+        select_related.extend(name for name in backend_class.select_related if name not in select_related)
+        prefetch_related.extend(name for name in backend_class.prefetch_related if name not in prefetch_related)
+    return select_related, prefetch_related
+
+
+def apply_related_hints(queryset, select_related, prefetch_related):
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
+
+
+def reload_instances(model, instances, select_related=(), prefetch_related=()):
+    """
+    Reload instances in a single query with their related objects, preserving their order.
+
+    Instances are reloaded from the database they were loaded from or saved to. Instances which
+    can't be reloaded, such as those from a bulk_create on a database which doesn't return primary
+    keys, have their related objects prefetched in place instead.
+    """
+    instances = list(instances)
+    if not select_related and not prefetch_related:
+        return instances
+
+    saved = [instance for instance in instances if instance.pk is not None]
+    reloaded = {}
+    if saved:
+        # Read from the database the instances came from, rather than the router's choice
+        queryset = model._base_manager.using(saved[0]._state.db).filter(pk__in=[instance.pk for instance in saved])
+        queryset = apply_related_hints(queryset, select_related, prefetch_related)
+        reloaded = {instance.pk: instance for instance in queryset}
+
+    missing = [instance for instance in instances if instance.pk not in reloaded]
+    if missing:
+        prefetch_related_objects(missing, *select_related, *prefetch_related)
+    return [reloaded.get(instance.pk, instance) for instance in instances]
+
+
+def push_model_changes(model, event, instances, pre_destroy=False, chunk_size=None, reload=True):
+    """Push changes for instances through every backend registered for the model, without a view
+
+    Instances are consumed one chunk at a time and each chunk is shared by all the backends.
+    With `reload`, each chunk is reloaded in one query with the related objects the backends declare."""
+    channel_cache = ChannelResolutionCache()
+    backend_classes = get_models_pusher_backends(model)
+    backends = [backend_class(channel_cache=channel_cache) for backend_class in backend_classes]
+    if not backends:
+        return
+
+    select_related, prefetch_related = get_related_hints(backend_classes, event) if reload else ((), ())
+    for chunk in chunked(instances, chunk_size or get_chunk_size()):
+        chunk = reload_instances(model, chunk, select_related, prefetch_related)
+        for backend in backends:
+            backend.push_changes(event, chunk, pre_destroy=pre_destroy, chunk_size=len(chunk))
@@ -0,0 +1,126 @@
+"""
+Signs subscriptions to private and presence channels, see ChannelAuthView.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.utils.encoders import JSONEncoder
+
+from drf_model_pusher.encryption import get_encryption_master_key, is_encrypted_channel
+from drf_model_pusher.providers import get_pusher_app_settings
+
+SOCKET_ID_RE = re.compile(r"^\d+\.\d+$")
+CHANNEL_NAME_RE = re.compile(r"^[a-zA-Z0-9_\-=@,.;]{1,200}$")
+BATCHED_CHANNEL_NAME_RE = re.compile(r"^channel_name\[(\d+)\]$")
+
+
+def get_channel_auth(socket_id, channel, channel_data=None, app=None):
+    """Return the auth for a subscription, signed with the app's secret without building a Pusher client"""
+    app_settings = get_pusher_app_settings(app)
+    string_to_sign = "{0}:{1}".format(socket_id, channel)
+    if channel_data is not None:
+        string_to_sign = "{0}:{1}".format(string_to_sign, channel_data)
+
+    signature = hmac.new(
+        app_settings["secret"].encode("utf-8"), string_to_sign.encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+    auth = {"auth": "{0}:{1}".format(app_settings["key"], signature)}
+    if channel_data is not None:
+        auth["channel_data"] = channel_data
+    if is_encrypted_channel(channel):
+        # Clients decrypt with the channel's key, sent only to the subscribers allowed to read it
+        shared_secret = hashlib.sha256(channel.encode("utf-8") + get_encryption_master_key(app)).digest()
+        auth["shared_secret"] = base64.b64encode(shared_secret).decode("ascii")
+    return auth
+
+
+class ChannelPermission(object):
+    """
+    Decides whether a user may subscribe to the channels matching `pattern`.
+
+    Decisions are cached for `cache_timeout` seconds per user and channel, so the
+    subscription storm of a reconnect checks each channel once.
+    """
+
+    pattern = None
+    cache_timeout = None
+
+    def __init__(self):
+        self.regex = re.compile(self.pattern)
+
+    def match(self, channel):
+        return self.regex.match(channel)
+
+    def get_cache_key(self, request, channel, match):
+        """Return the key caching the decision, or None to not cache it"""
+        if self.cache_timeout is None or not request.user.is_authenticated:
+            return None
+        # Keyed by the channel, not the matched groups, as has_permission may check other parts of its name
+        return "drf-model-pusher:channel-permission:{0}.{1}:{2}:{3}".format(
+            self.__class__.__module__, self.__class__.__qualname__, request.user.pk, channel
+        )
+
+    def has_permission(self, request, channel, match):
+        raise NotImplementedError
+
+
+class AuthenticatedChannelPermission(ChannelPermission):
+    """Allows any authenticated user to subscribe to any private and presence channel, opt in with care"""
+
+    pattern = r"^(private|presence)-"
+
+    def has_permission(self, request, channel, match):
+        return request.user.is_authenticated
+
+
+def check_channel_permissions(request, channels, permissions):
+    """
+    Return a dict of channel to whether the request may subscribe to it.
+
+    The first permission whose pattern matches a channel decides, channels without
+    a matching permission are denied. Cached decisions are fetched in one call.
+    """
+    matches = {}
+    for channel in channels:
+        for permission in permissions:
+            match = permission.match(channel)
+            if match is not None:
+                matches[channel] = (permission, match, permission.get_cache_key(request, channel, match))
+                break
+
+    cached = cache.get_many([key for permission, match, key in matches.values() if key is not None])
+    allowed, to_cache = {}, {}
+    for channel in channels:
+        if channel not in matches:
+            allowed[channel] = False
+            continue
+
+        permission, match, key = matches[channel]
+        if key in cached:
+            allowed[channel] = cached[key]
+        elif key in to_cache:
+            allowed[channel] = to_cache[key][0]
+        else:
+            allowed[channel] = bool(permission.has_permission(request, channel, match))
+            if key is not None:
+                to_cache[key] = (allowed[channel], permission.cache_timeout)
+
+    by_timeout = {}
+    for key, (value, timeout) in to_cache.items():
+        by_timeout.setdefault(timeout, {})[key] = value
+    for timeout, values in by_timeout.items():
+        cache.set_many(values, timeout=timeout)
+    return allowed
+
+
+def get_presence_channel_data(data):
+    return json.dumps(data, cls=JSONEncoder)
+
+
+def get_auth_max_channels():
+    return getattr(settings, "DRF_MODEL_PUSHER_AUTH_MAX_CHANNELS", 100)
@@ -0,0 +1,91 @@
+"""
+Memoizes channel resolution, per request and optionally across requests through the Django cache.
+"""
+import inspect
+
+from django.core.cache import cache
+
+_accepts_instance = {}
+
+
+def accepts_instance(method):
+    """Return whether a channel resolver method accepts an `instance` argument"""
+    func = getattr(method, "__func__", method)
+    try:
+        return _accepts_instance[func]
+    except KeyError:
+        result = _accepts_instance[func] = "instance" in inspect.signature(func).parameters
+        return result
+
+
+def get_resolver_name(func):
+    func = getattr(func, "__func__", func)
+    return "{0}.{1}".format(func.__module__, func.__qualname__)
+
+
+def get_channels_version_key(model, pk):
+    return "drf-model-pusher:channels-version:{0}:{1}".format(model._meta.label_lower, pk)
+
+
+def invalidate_pusher_channels(model, pk):
+    """Invalidate the channels cached across requests for an instance, for every resolver"""
+    key = get_channels_version_key(model, pk)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def invalidate_instance_pusher_channels(sender, instance, **kwargs):
+    """A signal receiver invalidating an instance's cached channels, e.g. on post_save or m2m_changed"""
+    invalidate_pusher_channels(instance.__class__, instance.pk)
+
+
+class ChannelResolutionCache(object):
+    """
+    Memoizes the channels returned by resolvers for instances.
+
+    Results are always kept for the lifetime of this object, which is a single
+    request or bulk push. When `timeout` is set they are also kept in the Django
+    cache keyed by (model, pk, resolver), so only use it with resolvers whose
+    channels depend on the instance alone.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._resolved = {}
+
+    def get_key(self, resolver_name, instance):
+        """Return the memoization key, or None for unsaved instances which can't be identified"""
+        if instance is None:
+            return (resolver_name, None)
+        if getattr(instance, "pk", None) is None:
+            return None
+        return (resolver_name, instance._meta.label_lower, instance.pk)
+
+    def resolve(self, resolver_name, instance, resolver):
+        """Return the channels for the instance, calling resolver() when they aren't cached"""
+        key = self.get_key(resolver_name, instance)
+        if key is None:
+            return list(resolver())
+
+        try:
+            return list(self._resolved[key])
+        except KeyError:
+            pass
+
+        cache_key = None
+        if self.timeout is not None and len(key) == 3:
+            version = cache.get(get_channels_version_key(instance.__class__, instance.pk), 0)
+            cache_key = "drf-model-pusher:channels:{0}:{1}:{2}:{3}".format(key[1], key[2], resolver_name, version)
+            channels = cache.get(cache_key)
+            if channels is not None:
+                self._resolved[key] = channels
+                return list(channels)
+
+        channels = list(resolver())
+        self._resolved[key] = channels
+        if cache_key is not None:
+            cache.set(cache_key, channels, timeout=self.timeout)
+        return list(channels)
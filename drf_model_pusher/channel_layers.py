@@ -0,0 +1,164 @@
+"""
+A provider which publishes to Django Channels groups through the channel layer, for self-hosted realtime traffic.
+
+Requires the optional `channels` dependency.
+"""
+import asyncio
+import hashlib
+import re
+
+from django.core.cache import cache
+
+from drf_model_pusher.occupancy import set_channels_occupancy
+from drf_model_pusher.providers import PusherProvider
+
+GROUP_NAME_RE = re.compile(r"^[a-zA-Z0-9\-_.]{1,99}$")
+
+
+def get_group_name(channel):
+    """Return the channel layer group for a channel, hashing names which aren't valid group names"""
+    if GROUP_NAME_RE.match(channel):
+        return channel
+    return "drf-model-pusher.{0}".format(hashlib.md5(channel.encode("utf-8")).hexdigest())
+
+
+def get_subscribers_cache_key(channel):
+    return "drf-model-pusher:subscribers:{}".format(channel)
+
+
+def channel_subscribed(channel):
+    """Record a subscription to the channel, marking it as occupied"""
+    key = get_subscribers_cache_key(channel)
+    cache.add(key, 0, timeout=None)
+    cache.incr(key)
+    set_channels_occupancy([channel], True, timeout=None)
+
+
+def channel_unsubscribed(channel):
+    """Record an unsubscription from the channel, marking it as vacated once it has no subscribers"""
+    key = get_subscribers_cache_key(channel)
+    try:
+        subscribers = cache.decr(key)
+    except ValueError:
+        subscribers = 0
+    if subscribers <= 0:
+        cache.delete(key)
+        set_channels_occupancy([channel], False, timeout=None)
+
+
+class ChannelLayerProvider(PusherProvider):
+    """
+    Sends events to the channel layer group of each channel with `group_send`.
+
+    Consumers using `PusherEventsConsumerMixin` relay the events to their
+    websocket, skipping events sent with their own socket id. When the occupied
+    channels optimisation is enabled, occupancy is tracked by the consumers
+    instead of Pusher's webhooks.
+    """
+
+    def configure(self):
+        from channels.layers import get_channel_layer
+
+        self._channel_layer = get_channel_layer()
+
+    @property
+    def channel_layer(self):
+        if getattr(self, "_channel_layer", None) is None:
+            self.configure()
+        return self._channel_layer
+
+    def trigger(self, channels, event_name, data, socket_id=None):
+        if not isinstance(channels, list):
+            raise TypeError("channels must be a list, received {0}".format(str(type(channels))))
+
+        self.trigger_batch([(channels, event_name, data)], socket_id)
+
+    def trigger_batch(self, packets, socket_id=None):
+        """Send the events for each group as a single message, with the groups sent concurrently"""
+        if self._disabled:
+            return
+
+        deliveries = []
+        for index, (channels, event_name, data) in enumerate(packets):
+            if not isinstance(channels, list):
+                raise TypeError("channels must be a list, received {0}".format(str(type(channels))))
+
+            valid_channels = self.get_occupied_channels(channels)
+            valid_channels = self.get_unthrottled_channels(valid_channels, event_name, data, socket_id)
+            idempotency_key = self.get_idempotency_key(index)
+            for channel in valid_channels:
+                deliveries.append((idempotency_key, channel, {"channel": channel, "event": event_name, "data": data}))
+
+        events, delivery_keys = self.deduplicate(deliveries)
+        group_events = {}
+        for event in events:
+            group_events.setdefault(event["channel"], []).append(event)
+
+        try:
+            self.send_group_events(group_events, socket_id)
+        except Exception:
+            self.release_deliveries(delivery_keys)
+            raise
+
+    def send_unthrottled(self, channels, event_name, data, socket_id=None):
+        self.send_group_events(
+            {channel: [{"channel": channel, "event": event_name, "data": data}] for channel in channels}, socket_id
+        )
+
+    def send_group_events(self, group_events, socket_id=None):
+        """Send a dict of channel to its list of events"""
+        if not group_events:
+            return
+
+        from asgiref.sync import async_to_sync
+
+        with self.measure(sum(len(events) for events in group_events.values())):
+            async_to_sync(self._group_send_many)(group_events, socket_id)
+
+    async def _group_send_many(self, group_events, socket_id):
+        await asyncio.gather(*[
+            self.channel_layer.group_send(
+                get_group_name(channel),
+                {"type": "pusher.events", "events": events, "socket_id": socket_id},
+            )
+            for channel, events in group_events.items()
+        ])
+
+    def _sync_cache(self, channels=None):
+        """Occupancy is recorded by the consumers, there is nothing to fetch"""
+        pass
+
+
+class PusherEventsConsumerMixin(object):
+    """
+    Relays events from ChannelLayerProvider to a websocket, for use with `AsyncJsonWebsocketConsumer`.
+
+    The consumer's `channel_name` is its socket id, clients send it with the
+    `X-Pusher-Socket-ID` header to exclude themselves from their own changes.
+    """
+
+    async def pusher_subscribe(self, channel):
+        """Join the group for a channel, check permissions before calling this"""
+        from asgiref.sync import sync_to_async
+
+        await self.channel_layer.group_add(get_group_name(channel), self.channel_name)
+        await sync_to_async(channel_subscribed)(channel)
+        self.pusher_channels = getattr(self, "pusher_channels", set()) | {channel}
+
+    async def pusher_unsubscribe(self, channel):
+        from asgiref.sync import sync_to_async
+
+        await self.channel_layer.group_discard(get_group_name(channel), self.channel_name)
+        await sync_to_async(channel_unsubscribed)(channel)
+        self.pusher_channels = getattr(self, "pusher_channels", set()) - {channel}
+
+    async def pusher_unsubscribe_all(self):
+        """Leave every subscribed channel, call this when disconnecting"""
+        for channel in list(getattr(self, "pusher_channels", ())):
+            await self.pusher_unsubscribe(channel)
+
+    async def pusher_events(self, message):
+        if message.get("socket_id") is not None and message["socket_id"] == self.channel_name:
+            return
+        for event in message["events"]:
+            await self.send_json(event)
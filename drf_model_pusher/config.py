@@ -1,12 +1,45 @@
 """Methods for configuration drf_model_pusher"""
-from drf_model_pusher.receivers import send_pusher_event
-from drf_model_pusher.signals import view_post_save, view_pre_destroy
+from django.db.models.signals import post_delete, post_save
+
+from drf_model_pusher.dispatch import connect_default_receiver
+from drf_model_pusher.receivers import (
+    push_model_post_delete,
+    push_model_post_save,
+    send_pusher_batch,
+    send_pusher_event,
+)
+from drf_model_pusher.signals import view_batch, view_post_save, view_pre_destroy
 
 
 def connect_pusher_views():
     """
     Register the send_pusher_event with the view_post_save and
-    view_pre_destroy signals
+    view_pre_destroy signals, and send_pusher_batch with view_batch.
+    While they are the only receivers backends dispatch packets directly.
+    """
+    connect_default_receiver(view_post_save, send_pusher_event)
+    connect_default_receiver(view_pre_destroy, send_pusher_event)
+    connect_default_receiver(view_batch, send_pusher_batch)
+
+
+def connect_pusher_models(*models):
+    """
+    Push changes for the models through their pusher backends whenever
+    they are saved or deleted, regardless of whether a view was involved
+    """
+    for model in models:
+        post_save.connect(
+            push_model_post_save, sender=model, dispatch_uid="drf_model_pusher_post_save"
+        )
+        post_delete.connect(
+            push_model_post_delete, sender=model, dispatch_uid="drf_model_pusher_post_delete"
+        )
+
+
+def disconnect_pusher_models(*models):
+    """
+    Stop pushing changes for the models on save and delete
     """
-    view_post_save.connect(send_pusher_event)
-    view_pre_destroy.connect(send_pusher_event)
+    for model in models:
+        post_save.disconnect(sender=model, dispatch_uid="drf_model_pusher_post_save")
+        post_delete.disconnect(sender=model, dispatch_uid="drf_model_pusher_post_delete")
@@ -0,0 +1,194 @@
+"""
+Dispatches packets from backends straight to their provider.
+
+Backends used to send every packet through a Django signal whose default receiver
+sent it. When the default receiver is the only one connected the signal is skipped
+and the packet goes to the dispatcher configured by DRF_MODEL_PUSHER_DISPATCHER.
+Once other receivers are connected the signal is sent as before, so they can
+observe or replace the default receiver.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from drf_model_pusher.providers import trigger_packets
+from drf_model_pusher.signals import PusherSignal
+
+logger = logging.getLogger(__name__)
+
+ROUTE_NONE = "none"
+ROUTE_DIRECT = "direct"
+ROUTE_SIGNAL = "signal"
+
+
+class PusherPacket(object):
+    """A (channels, event_name, data) packet and how to send it"""
+
+    __slots__ = (
+        "sender", "instance", "channels", "event_name", "data", "socket_id", "provider_class", "priority",
+        "idempotency_key",
+    )
+
+    def __init__(
+        self,
+        sender,
+        instance,
+        channels,
+        event_name,
+        data,
+        socket_id=None,
+        provider_class=None,
+        priority=None,
+        idempotency_key=None,
+    ):
+        self.sender = sender
+        self.instance = instance
+        self.channels = channels
+        self.event_name = event_name
+        self.data = data
+        self.socket_id = socket_id
+        self.provider_class = provider_class
+        self.priority = priority
+        self.idempotency_key = idempotency_key
+
+    def as_signal_kwargs(self):
+        return {
+            "sender": self.sender,
+            "instance": self.instance,
+            "channels": self.channels,
+            "event_name": self.event_name,
+            "data": self.data,
+            "socket_id": self.socket_id,
+            "provider_class": self.provider_class,
+            "priority": self.priority,
+            "idempotency_key": self.idempotency_key,
+        }
+
+
+class PusherBatch(object):
+    """A batch of (channels, event_name, data) packets sent together"""
+
+    __slots__ = (
+        "sender", "instance", "packets", "socket_id", "provider_class", "pre_destroy", "priority", "idempotency_keys",
+    )
+
+    def __init__(
+        self,
+        sender,
+        instance,
+        packets,
+        socket_id=None,
+        provider_class=None,
+        pre_destroy=False,
+        priority=None,
+        idempotency_keys=None,
+    ):
+        self.sender = sender
+        self.instance = instance
+        self.packets = packets
+        self.socket_id = socket_id
+        self.provider_class = provider_class
+        self.pre_destroy = pre_destroy
+        self.priority = priority
+        self.idempotency_keys = idempotency_keys
+
+    def as_signal_kwargs(self):
+        return {
+            "sender": self.sender,
+            "instance": self.instance,
+            "packets": self.packets,
+            "socket_id": self.socket_id,
+            "provider_class": self.provider_class,
+            "pre_destroy": self.pre_destroy,
+            "priority": self.priority,
+            "idempotency_keys": self.idempotency_keys,
+        }
+
+
+# Signals whose dropped packets were logged
+_logged_drops = set()
+
+
+def connect_default_receiver(signal, default_receiver):
+    """Connect the receiver sending a PusherSignal's packets, which is bypassed while it's the only receiver"""
+    signal.default_receiver = default_receiver
+    signal.connect(default_receiver)
+
+
+def get_signal_route(signal):
+    """Return whether a signal has no receivers, only its default receiver, or other receivers too"""
+    if isinstance(signal, PusherSignal):
+        if signal.has_observers():
+            return ROUTE_SIGNAL
+        if signal.default_connected:
+            return ROUTE_DIRECT
+    elif signal.has_listeners():
+        return ROUTE_SIGNAL
+
+    if signal not in _logged_drops:
+        _logged_drops.add(signal)
+        logger.warning("No receivers are connected to %r, its pusher packets are dropped", signal)
+    return ROUTE_NONE
+
+
+class PusherDispatcher(object):
+    """
+    Sends packets through their provider.
+
+    Providers are configured once per provider class and thread, rather than for
+    every packet, and are discarded whenever settings change.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get_provider(self, provider_class, priority=None, idempotency_keys=None):
+        from drf_model_pusher.receivers import get_provider_class
+
+        providers = getattr(self._local, "providers", None)
+        if providers is None:
+            providers = self._local.providers = {}
+
+        provider = providers.get(provider_class)
+        if provider is None:
+            provider = providers[provider_class] = get_provider_class(provider_class)()
+            provider.configure()
+        provider.priority = priority
+        provider.idempotency_keys = idempotency_keys
+        return provider
+
+    def dispatch(self, packet):
+        idempotency_keys = None if packet.idempotency_key is None else [packet.idempotency_key]
+        provider = self.get_provider(packet.provider_class, packet.priority, idempotency_keys)
+        provider.trigger(packet.channels, packet.event_name, packet.data, packet.socket_id)
+
+    def dispatch_batch(self, batch):
+        provider = self.get_provider(batch.provider_class, batch.priority, batch.idempotency_keys)
+        trigger_packets(provider, batch.packets, batch.socket_id)
+
+
+_dispatcher = None
+
+
+def get_dispatcher():
+    """Return the dispatcher configured by DRF_MODEL_PUSHER_DISPATCHER"""
+    global _dispatcher
+    if _dispatcher is None:
+        dispatcher_class = getattr(
+            settings, "DRF_MODEL_PUSHER_DISPATCHER", "drf_model_pusher.dispatch.PusherDispatcher"
+        )
+        if isinstance(dispatcher_class, str):
+            dispatcher_class = import_string(dispatcher_class)
+        _dispatcher = dispatcher_class()
+    return _dispatcher
+
+
+@receiver(setting_changed)
+def reset_dispatcher(setting=None, **kwargs):
+    global _dispatcher
+    if setting is None or setting.startswith(("DRF_MODEL_PUSHER", "PUSHER_")):
+        _dispatcher = None
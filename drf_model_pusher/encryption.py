@@ -0,0 +1,179 @@
+"""
+End to end encrypted `private-encrypted-` channels, see EncryptedPusherBackend.
+
+Pusher's client serializes the payload and derives the channel's key again for every
+channel an event is sent to. EncryptedPusherProvider serializes each payload once,
+keeps the keys of recently used channels in an LRU cache, and sends encrypted
+fan-out through the batch endpoint, so only the encryption itself is per channel.
+"""
+import base64
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.utils.encoders import JSONEncoder
+
+from drf_model_pusher.exceptions import ModelPusherException
+from drf_model_pusher.providers import PusherProvider, get_batch_size, get_pusher_app_settings
+
+ENCRYPTED_PREFIX = "private-encrypted-"
+
+
+def is_encrypted_channel(channel):
+    return channel.startswith(ENCRYPTED_PREFIX)
+
+
+def get_encryption_master_key(app=None):
+    """Return the app's 32 byte encryption master key"""
+    encoded = get_pusher_app_settings(app).get("encryption_master_key_base64")
+    if encoded is None:
+        raise ModelPusherException(
+            "Encrypted channels require PUSHER_ENCRYPTION_MASTER_KEY_BASE64, or encryption_master_key_base64 "
+            "for apps in DRF_MODEL_PUSHER_APPS"
+        )
+    master_key = base64.b64decode(encoded)
+    if len(master_key) != 32:
+        raise ModelPusherException("The encryption master key must be base64 encoded 32 bytes")
+    return master_key
+
+
+def serialize_payload(data):
+    """Return event data as UTF-8 encoded JSON, strings being sent as they are"""
+    if isinstance(data, str):
+        return data.encode("utf-8")
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False).encode("utf-8")
+
+
+class ChannelKeyCache(object):
+    """
+    An LRU cache of the secret boxes of the `maxsize` most recently used channels.
+
+    A channel's key is the SHA-256 of its name followed by the master key, as derived
+    by Pusher's client libraries.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._boxes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_box(self, channel, master_key):
+        key = (master_key, channel)
+        with self._lock:
+            box = self._boxes.get(key)
+            if box is not None:
+                self._boxes.move_to_end(key)
+                self.hits += 1
+                return box
+
+        import nacl.secret
+
+        box = nacl.secret.SecretBox(hashlib.sha256(channel.encode("utf-8") + master_key).digest())
+        with self._lock:
+            self.misses += 1
+            self._boxes[key] = box
+            if len(self._boxes) > self.maxsize:
+                self._boxes.popitem(last=False)
+        return box
+
+
+def encrypt_payload(box, payload):
+    """Return the event data Pusher's clients decrypt for a serialized payload, with a random nonce"""
+    import nacl.utils
+
+    nonce = nacl.utils.random(box.NONCE_SIZE)
+    encrypted = box.encrypt(payload, nonce)
+    return json.dumps({
+        "nonce": base64.b64encode(nonce).decode("ascii"),
+        "ciphertext": base64.b64encode(encrypted.ciphertext).decode("ascii"),
+    })
+
+
+_key_cache = None
+
+
+def get_channel_key_cache():
+    """Return the process wide ChannelKeyCache, sized by DRF_MODEL_PUSHER_ENCRYPTION_KEY_CACHE_SIZE"""
+    global _key_cache
+    if _key_cache is None:
+        _key_cache = ChannelKeyCache(getattr(settings, "DRF_MODEL_PUSHER_ENCRYPTION_KEY_CACHE_SIZE", 4096))
+    return _key_cache
+
+
+@receiver(setting_changed)
+def reset_channel_key_cache(setting, **kwargs):
+    global _key_cache
+    if setting.startswith(("DRF_MODEL_PUSHER_ENCRYPTION", "PUSHER_ENCRYPTION", "DRF_MODEL_PUSHER_APPS")):
+        _key_cache = None
+
+
+class EncryptedPusherProvider(PusherProvider):
+    """
+    Sends events to encrypted channels, encrypting each channel's copy of the payload itself.
+
+    Every packet is sent through the batch endpoint, as Pusher accepts a single encrypted
+    channel per trigger. Each payload is serialized once per call however many channels
+    it's sent to, and events to other channels are sent unencrypted alongside.
+    """
+
+    _payloads = None
+    _master_key = None
+
+    def trigger(self, channels, event_name, data, socket_id=None):
+        if not isinstance(channels, list):
+            raise TypeError("channels must be a list, received {0}".format(str(type(channels))))
+
+        self.trigger_batch([(channels, event_name, data)], socket_id)
+
+    def trigger_batch(self, packets, socket_id=None):
+        self._payloads = {}
+        try:
+            super().trigger_batch(packets, socket_id)
+        finally:
+            self._payloads = None
+
+    def send_unthrottled(self, channels, event_name, data, socket_id=None):
+        events = []
+        for channel in channels:
+            event = {"channel": channel, "name": event_name, "data": data}
+            if socket_id is not None:
+                event["socket_id"] = socket_id
+            events.append(event)
+        batch_size = get_batch_size()
+        for offset in range(0, len(events), batch_size):
+            with self.measure(len(events[offset:offset + batch_size])):
+                self.send_batch(events[offset:offset + batch_size])
+
+    def get_payload(self, data):
+        """Return the serialized data, serializing each packet's data once per call"""
+        if self._payloads is None:
+            return serialize_payload(data)
+
+        # The data is kept with its payload so its id isn't reused during the call
+        cached = self._payloads.get(id(data))
+        if cached is None:
+            cached = self._payloads[id(data)] = (data, serialize_payload(data))
+        return cached[1]
+
+    def get_master_key(self):
+        if self._master_key is None:
+            self._master_key = get_encryption_master_key(self.app)
+        return self._master_key
+
+    def send_batch(self, events):
+        key_cache = get_channel_key_cache()
+        encoded = []
+        for event in events:
+            payload = self.get_payload(event["data"])
+            if is_encrypted_channel(event["channel"]):
+                data = encrypt_payload(key_cache.get_box(event["channel"], self.get_master_key()), payload)
+            else:
+                data = payload.decode("utf-8")
+            encoded.append(dict(event, data=data))
+        self.client.trigger_batch(encoded, already_encoded=True)
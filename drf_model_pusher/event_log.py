@@ -0,0 +1,67 @@
+"""
+A bounded per-channel log of recent events, so reconnecting clients can catch up on missed events.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+
+class ChannelEventLog(object):
+    """
+    Stores recent events per channel in the Django cache.
+
+    Each event is stamped with a monotonic per-channel sequence number and
+    stored in one of `size` ring buffer slots, which expire after `ttl` seconds.
+    """
+
+    key_prefix = "drf-model-pusher:log"
+
+    def __init__(self, size=None, ttl=None):
+        self.size = size or getattr(settings, "DRF_MODEL_PUSHER_EVENT_LOG_SIZE", 100)
+        self.ttl = ttl or getattr(settings, "DRF_MODEL_PUSHER_EVENT_LOG_TTL", 3600)
+
+    def get_sequence_key(self, channel):
+        return "{0}:seq:{1}".format(self.key_prefix, channel)
+
+    def get_slot_key(self, channel, sequence):
+        return "{0}:event:{1}:{2}".format(self.key_prefix, channel, sequence % self.size)
+
+    def append(self, channel, event_name, data):
+        """Record an event for the channel, returning its sequence number"""
+        sequence_key = self.get_sequence_key(channel)
+        cache.add(sequence_key, 0, timeout=None)
+        try:
+            sequence = cache.incr(sequence_key)
+        except ValueError:
+            # The sequence was evicted between add and incr
+            cache.add(sequence_key, 0, timeout=None)
+            sequence = cache.incr(sequence_key)
+
+        cache.set(self.get_slot_key(channel, sequence), (sequence, event_name, data), timeout=self.ttl)
+        return sequence
+
+    def get_sequence(self, channel):
+        """Return the latest sequence number for the channel"""
+        return cache.get(self.get_sequence_key(channel), 0)
+
+    def get_events_since(self, channel, since):
+        """
+        Return a tuple of (events, sequence, resync) for the events after `since`.
+
+        `resync` is True when any of the events is no longer available, because it
+        expired, was evicted or was overwritten, and the client must refetch its state.
+        """
+        current = self.get_sequence(channel)
+        if since > current or current - since > self.size:
+            return [], current, True
+
+        wanted = range(since + 1, current + 1)
+        slots = cache.get_many([self.get_slot_key(channel, sequence) for sequence in wanted])
+
+        events = []
+        for sequence in wanted:
+            stored = slots.get(self.get_slot_key(channel, sequence))
+            if stored is None or stored[0] != sequence:
+                return [], current, True
+            events.append({"seq": stored[0], "event": stored[1], "data": stored[2]})
+
+        return events, current, False
@@ -0,0 +1,176 @@
+"""
+Drops events already sent to a channel, so retries and changes pushed by several
+code paths (such as a view and the model signals) reach clients once.
+
+Backends stamp each packet with an idempotency key derived from the model, primary
+key, event name and the instance's version, or a hash of the payload when the backend
+has no version field. Providers claim each (key, channel) delivery in a shared store
+just before sending, and skip the deliveries claimed within the last `ttl` seconds, or
+`payload_ttl` seconds for payload keys.
+"""
+import hashlib
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from drf_model_pusher.utils import payload_hash
+
+DEDUPLICATED = "deduplicated"
+
+PAYLOAD_KEY_PREFIX = "payload:"
+
+
+def get_idempotency_key(model_label, pk, event_name, version=None, data=None):
+    """
+    Return the key identifying a change by its version, or by its payload when the version isn't known.
+
+    Payloads don't fully identify changes, a field changed from A to B and back to A
+    sends the same payload twice, so payload keys are only claimed for the shorter
+    `payload_ttl` of the Deduplicator.
+    """
+    if version is None:
+        return "{0}{1}:{2}:{3}:{4}".format(PAYLOAD_KEY_PREFIX, model_label, pk, event_name, payload_hash(data))
+    return "{0}:{1}:{2}:{3}".format(model_label, pk, event_name, version)
+
+
+def is_payload_key(idempotency_key):
+    return idempotency_key.startswith(PAYLOAD_KEY_PREFIX)
+
+
+def get_delivery_key(idempotency_key, channel):
+    """Return the store key of a change sent to a channel, hashed to suit any cache's key limits"""
+    digest = hashlib.sha1("{0}\0{1}".format(idempotency_key, channel).encode("utf-8")).hexdigest()
+    return "drf-model-pusher:sent:{0}".format(digest)
+
+
+class IdempotencyStore(object):
+    """Records claimed delivery keys for a time"""
+
+    def claim_many(self, keys, ttl):
+        """Claim the keys which aren't already claimed, returning the set of keys claimed"""
+        raise NotImplementedError
+
+    def release_many(self, keys):
+        """Release claimed keys, e.g. when their send failed"""
+        raise NotImplementedError
+
+
+class CacheIdempotencyStore(IdempotencyStore):
+    """Claims keys with the Django cache's atomic `add`, one call per key"""
+
+    def claim_many(self, keys, ttl):
+        return {key for key in keys if cache.add(key, 1, timeout=ttl)}
+
+    def release_many(self, keys):
+        cache.delete_many(list(keys))
+
+
+class RedisIdempotencyStore(IdempotencyStore):
+    """
+    Claims keys with pipelined `SET NX EX`, a single round trip per batch.
+
+    Requires the optional `redis` dependency.
+    """
+
+    def __init__(self, url="redis://localhost:6379/0", client=None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def claim_many(self, keys, ttl):
+        keys = list(keys)
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(key, 1, nx=True, ex=max(1, int(ttl)))
+        return {key for key, claimed in zip(keys, pipe.execute()) if claimed}
+
+    def release_many(self, keys):
+        keys = list(keys)
+        if keys:
+            self.client.delete(*keys)
+
+
+class Deduplicator(object):
+    """
+    Claims deliveries in `store` for `ttl` seconds, or `payload_ttl` seconds for
+    changes keyed by their payload, and counts the duplicates skipped.
+    """
+
+    def __init__(
+        self, ttl=60, payload_ttl=5, store="drf_model_pusher.idempotency.CacheIdempotencyStore", store_options=None
+    ):
+        if isinstance(store, str):
+            store = import_string(store)
+        self.ttl = ttl
+        self.payload_ttl = payload_ttl
+        self.store = store(**(store_options or {}))
+        self.metrics = Counter()
+
+    @classmethod
+    def from_settings(cls):
+        """Return a deduplicator configured by DRF_MODEL_PUSHER_IDEMPOTENCY, or None when it's disabled"""
+        options = getattr(settings, "DRF_MODEL_PUSHER_IDEMPOTENCY", None)
+        if options is None:
+            return None
+        return cls(**options)
+
+    def filter(self, deliveries):
+        """
+        Return the items of (idempotency_key, channel, item) deliveries to send and their claimed delivery keys.
+
+        Items without an idempotency key are always sent, with a delivery key of None.
+        """
+        keys = [None if key is None else get_delivery_key(key, channel) for key, channel, item in deliveries]
+        ttls = {}
+        for key, (idempotency_key, channel, item) in zip(keys, deliveries):
+            if key is not None:
+                ttl = self.payload_ttl if is_payload_key(idempotency_key) else self.ttl
+                ttls.setdefault(ttl, set()).add(key)
+        claimed = set()
+        for ttl, ttl_keys in ttls.items():
+            claimed |= self.store.claim_many(ttl_keys, ttl)
+
+        items, item_keys = [], []
+        for key, (idempotency_key, channel, item) in zip(keys, deliveries):
+            if key is None:
+                items.append(item)
+                item_keys.append(None)
+            elif key in claimed:
+                # Only the first of the same delivery in a batch is sent
+                claimed.discard(key)
+                items.append(item)
+                item_keys.append(key)
+            else:
+                self.metrics[DEDUPLICATED] += 1
+        return items, item_keys
+
+    def release(self, keys):
+        keys = [key for key in keys if key is not None]
+        if keys:
+            self.store.release_many(keys)
+
+
+_deduplicator = None
+_deduplicator_loaded = False
+
+
+def get_deduplicator():
+    """Return the process wide Deduplicator configured in settings, if any"""
+    global _deduplicator, _deduplicator_loaded
+    if not _deduplicator_loaded:
+        _deduplicator = Deduplicator.from_settings()
+        _deduplicator_loaded = True
+    return _deduplicator
+
+
+@receiver(setting_changed)
+def reset_deduplicator(setting, **kwargs):
+    global _deduplicator_loaded
+    if setting.startswith("DRF_MODEL_PUSHER_IDEMPOTENCY"):
+        _deduplicator_loaded = False
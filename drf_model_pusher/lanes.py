@@ -0,0 +1,149 @@
+"""
+Weighted priority lanes for queued dispatch, so rare create and delete events aren't stuck behind updates.
+"""
+import queue
+import threading
+import time
+from collections import Counter, deque
+
+PRIORITY_HIGH = "high"
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+
+DEFAULT_LANE_WEIGHTS = {PRIORITY_HIGH: 4, PRIORITY_NORMAL: 2, PRIORITY_LOW: 1}
+
+
+class LaneMetrics(object):
+    """Counts and queueing latencies per lane"""
+
+    def __init__(self, lanes, samples=1000):
+        self.counts = Counter()
+        self.latencies = {lane: deque(maxlen=samples) for lane in lanes}
+
+    def record_latency(self, lane, latency):
+        self.latencies[lane].append(latency)
+        self.counts[(lane, "sent")] += 1
+
+    def snapshot(self, lanes):
+        """Return a dict of lane to its queue length, counters and latency percentiles in seconds"""
+        result = {}
+        for lane, items in lanes.items():
+            latencies = sorted(self.latencies[lane])
+            result[lane] = {
+                "queued": len(items),
+                "sent": self.counts[(lane, "sent")],
+                "coalesced": self.counts[(lane, "coalesced")],
+                "shed": self.counts[(lane, "shed")],
+                "p50": latencies[len(latencies) // 2] if latencies else None,
+                "p95": latencies[int(len(latencies) * 0.95)] if latencies else None,
+            }
+        return result
+
+
+class PriorityLanes(object):
+    """
+    A bounded queue of weighted lanes served by weighted round robin.
+
+    Items in `coalesce_lanes` always replace a queued item with the same coalesce
+    key. When full, the oldest item of a lower priority lane, or of the item's own
+    lane when it's in `coalesce_lanes`, is shed to make room. Items which can't make
+    room block the producer until space is available.
+    """
+
+    def __init__(self, max_size=10000, weights=None, coalesce_lanes=(PRIORITY_LOW,)):
+        weights = weights or DEFAULT_LANE_WEIGHTS
+        self.max_size = max_size
+        self.weights = dict(weights)
+        self.coalesce_lanes = set(coalesce_lanes)
+        self.lanes = {lane: deque() for lane in sorted(weights, key=weights.get, reverse=True)}
+        self.metrics = LaneMetrics(self.lanes)
+        self._credits = dict(weights)
+        self._coalesce_index = {}
+        self._size = 0
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return self._size
+
+    def put(self, item, lane=PRIORITY_NORMAL, coalesce_key=None, timeout=None):
+        """Queue an item, returning False if there was no room within timeout"""
+        if lane not in self.lanes:
+            lane = PRIORITY_NORMAL
+
+        with self._condition:
+            if coalesce_key is not None and lane in self.coalesce_lanes:
+                entry = self._coalesce_index.get((lane, coalesce_key))
+                if entry is not None:
+                    entry[0] = item
+                    self.metrics.counts[(lane, "coalesced")] += 1
+                    return True
+
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self._size >= self.max_size and not self._shed(lane):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+
+            entry = [item, time.monotonic(), coalesce_key]
+            self.lanes[lane].append(entry)
+            if coalesce_key is not None and lane in self.coalesce_lanes:
+                self._coalesce_index[(lane, coalesce_key)] = entry
+            self._size += 1
+            self._condition.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Return the next (item, lane), raising queue.Empty if none arrives within timeout"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._size, timeout):
+                raise queue.Empty()
+            return self._pop()
+
+    def get_batch(self, max_items, timeout=None):
+        """Return up to max_items (item, lane) tuples, waiting up to timeout for the first"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._size, timeout):
+                return []
+            batch = []
+            while self._size and len(batch) < max_items:
+                batch.append(self._pop())
+            return batch
+
+    def snapshot(self):
+        with self._condition:
+            return self.metrics.snapshot(self.lanes)
+
+    def _pop(self):
+        lane = self._next_lane()
+        item, enqueued, coalesce_key = self.lanes[lane].popleft()
+        if coalesce_key is not None:
+            self._coalesce_index.pop((lane, coalesce_key), None)
+        self._size -= 1
+        self.metrics.record_latency(lane, time.monotonic() - enqueued)
+        self._condition.notify_all()
+        return item, lane
+
+    def _next_lane(self):
+        """Return the highest priority non-empty lane with credits left, refilling credits when spent"""
+        for _ in range(2):
+            for lane, items in self.lanes.items():
+                if items and self._credits[lane] > 0:
+                    self._credits[lane] -= 1
+                    return lane
+            self._credits = dict(self.weights)
+        raise queue.Empty()
+
+    def _shed(self, lane):
+        """Drop the oldest item from the lowest priority lane which may be shed for `lane`"""
+        for candidate in reversed(list(self.lanes)):
+            items = self.lanes[candidate]
+            lower = self.weights[candidate] < self.weights[lane]
+            if items and (lower or (candidate == lane and candidate in self.coalesce_lanes)):
+                item, enqueued, coalesce_key = items.popleft()
+                if coalesce_key is not None:
+                    self._coalesce_index.pop((candidate, coalesce_key), None)
+                self._size -= 1
+                self.metrics.counts[(candidate, "shed")] += 1
+                return True
+        return False
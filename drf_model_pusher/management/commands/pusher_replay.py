@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from drf_model_pusher.recording import (
+    StandInPusher,
+    StandInPusherProvider,
+    get_recorded_channels,
+    read_recording,
+    replay_recording,
+)
+
+
+class Command(BaseCommand):
+    help = "Replay push traffic recorded with DRF_MODEL_PUSHER_RECORDING against a local stand-in for Pusher."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="The recording to replay")
+        parser.add_argument(
+            "--speed", type=float, default=1.0, help="How many times faster than recorded to replay, 0 for no delays"
+        )
+        parser.add_argument("--workers", type=int, default=1, help="The number of threads sending")
+        parser.add_argument(
+            "--latency", type=float, default=0.0, help="Seconds the stand-in takes to answer each request"
+        )
+        parser.add_argument(
+            "--provider", default=None, help="A dotted path to a provider class to send with instead of the stand-in"
+        )
+
+    def handle(self, *args, **options):
+        if options["speed"] < 0 or options["workers"] < 1:
+            raise CommandError("--speed must be at least 0 and --workers at least 1")
+
+        records = read_recording(options["path"])
+        stand_in = None
+        if options["provider"]:
+            provider_factory = import_string(options["provider"])
+        else:
+            stand_in = StandInPusher(latency=options["latency"], occupied_channels=get_recorded_channels(records))
+
+            def provider_factory():
+                return StandInPusherProvider(stand_in=stand_in)
+
+        stats = replay_recording(records, provider_factory, speed=options["speed"], workers=options["workers"])
+
+        self.stdout.write(
+            "Replayed {triggers} triggers of {packets} packets in {duration:.2f}s, {throughput:.1f} packets/s "
+            "handed to the provider".format(**stats)
+        )
+        if stand_in is not None:
+            self.stdout.write(
+                "The stand-in received {0} requests of {1} events, {2:.1f} events/s".format(
+                    stand_in.requests,
+                    stand_in.events,
+                    stand_in.events / stats["duration"] if stats["duration"] else 0.0,
+                )
+            )
+        self.stdout.write(
+            "Latency p50 {0:.1f}ms p90 {1:.1f}ms p99 {2:.1f}ms max {3:.1f}ms".format(
+                *(stats[percentile] * 1000 for percentile in ("p50", "p90", "p99", "max"))
+            )
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from drf_model_pusher.occupancy_sync import get_occupancy_apps, sync_occupancy
+
+
+class Command(BaseCommand):
+    help = "Sync the stored occupancy of pusher channels with Pusher."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--app", action="append", dest="apps", default=None, help="An app in DRF_MODEL_PUSHER_APPS, repeatable"
+        )
+
+    def handle(self, *args, **options):
+        synced = sync_occupancy(options["apps"] or get_occupancy_apps())
+        for app, channels in synced.items():
+            self.stdout.write("Synced {0} occupied channels for {1}".format(len(channels), app or "the default app"))
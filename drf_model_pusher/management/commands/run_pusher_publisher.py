@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from drf_model_pusher.publisher import PublisherServer, get_socket_path
+
+
+class Command(BaseCommand):
+    help = "Run the local publisher which batches pusher events from every worker on this host."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket", default=None, help="Unix socket path, defaults to DRF_MODEL_PUSHER_PUBLISHER_SOCKET"
+        )
+        parser.add_argument("--max-queue", type=int, default=10000, help="Packets queued before senders block")
+        parser.add_argument("--batch-size", type=int, default=100, help="Packets sent per flush")
+        parser.add_argument("--flush-interval", type=float, default=0.05, help="Seconds to wait to fill a batch")
+
+    def handle(self, *args, **options):
+        server = PublisherServer(
+            socket_path=options["socket"] or get_socket_path(),
+            max_queue=options["max_queue"],
+            batch_size=options["batch_size"],
+            flush_interval=options["flush_interval"],
+        )
+        self.stdout.write("Publishing pusher events from {0}".format(server.socket_path))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
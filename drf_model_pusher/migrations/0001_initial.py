@@ -0,0 +1,27 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChannelOccupancy',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app', models.CharField(blank=True, default='', max_length=64)),
+                ('channel', models.CharField(max_length=200)),
+                ('occupied', models.BooleanField(default=False)),
+                ('expires_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+            options={
+                'unique_together': {('app', 'channel')},
+            },
+        ),
+    ]
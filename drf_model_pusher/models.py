@@ -0,0 +1,13 @@
+from django.db import models
+
+
+class ChannelOccupancy(models.Model):
+    """Whether a channel is occupied, used by DatabaseOccupancyStore"""
+
+    app = models.CharField(max_length=64, blank=True, default="")
+    channel = models.CharField(max_length=200)
+    occupied = models.BooleanField(default=False)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        unique_together = (("app", "channel"),)
@@ -0,0 +1,513 @@
+"""
+Occupancy state for the occupied channels optimisation.
+
+State is kept in the OccupancyStore configured by DRF_MODEL_PUSHER_OCCUPANCY_STORE, the
+Django cache by default. Setting DRF_MODEL_PUSHER_OCCUPANCY_TABLE to a file path also keeps
+it in a table memory-mapped by every worker on the host, so occupancy checks are served
+from local memory instead of a round trip to the store.
+"""
+import datetime
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import Q
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"drfmpocc"
+HEADER = struct.Struct("<8sQ")
+SLOT = struct.Struct("<Qd")
+TAG = struct.Struct("<Q")
+
+STATE_OCCUPIED = 1
+STATE_VACATED = 2
+STATE_MASK = 3
+
+# Marks a slot being reused, it's never a key's tag and isn't empty so probing continues past it
+TOMBSTONE = STATE_MASK
+
+# Slots probed before a key is treated as missing, bounding the cost of a lookup
+MAX_PROBES = 16
+
+
+class OccupancyTable(object):
+    """
+    An open addressing hash table of occupancy state in a memory-mapped file.
+
+    Each slot is a 64 bit word holding a hash of the key with the state in its low
+    bits, followed by the time the entry expires. Lookups read the mapping without
+    locking, and check the word again after reading the expiry, so a torn read at
+    worst looks like a miss. Writes take a lock shared by the processes and threads
+    using the file. Expired slots are reused once the probed slots are full, marked
+    with a tombstone first so the old key never appears with the new expiry.
+    """
+
+    def __init__(self, path, slots=65536, ttl=10):
+        self.path = path
+        self.ttl = ttl
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            with self._file_lock(0):
+                size = os.fstat(self._fd).st_size
+                if size < HEADER.size:
+                    os.ftruncate(self._fd, HEADER.size + slots * SLOT.size)
+                    os.pwrite(self._fd, HEADER.pack(MAGIC, slots), 0)
+                magic, self.slots = HEADER.unpack(os.pread(self._fd, HEADER.size, 0))
+                if magic != MAGIC or os.fstat(self._fd).st_size < HEADER.size + self.slots * SLOT.size:
+                    raise OSError("{0} is not an occupancy table".format(path))
+            self._mmap = mmap.mmap(self._fd, HEADER.size + self.slots * SLOT.size)
+        except Exception:
+            os.close(self._fd)
+            raise
+
+    def close(self):
+        self._mmap.close()
+        os.close(self._fd)
+
+    @contextmanager
+    def _file_lock(self, offset):
+        """Lock a byte of the file, the first byte guards writes and the second a sync"""
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, offset)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, offset)
+
+    @contextmanager
+    def sync_lock(self):
+        """Serialize syncing with Pusher across the host, so a single process syncs at a time"""
+        with self._sync_lock, self._file_lock(1):
+            yield
+
+    @staticmethod
+    def _tag(key):
+        tag = TAG.unpack(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest())[0] & ~STATE_MASK
+        return tag or STATE_MASK + 1
+
+    def _offsets(self, tag):
+        index = tag >> 2
+        for probe in range(min(MAX_PROBES, self.slots)):
+            yield HEADER.size + ((index + probe) % self.slots) * SLOT.size
+
+    def get(self, key):
+        """Return whether the key is occupied, or None when it's missing or expired"""
+        tag = self._tag(key)
+        now = time.time()
+        for offset in self._offsets(tag):
+            word, expires = SLOT.unpack_from(self._mmap, offset)
+            if word == 0:
+                return None
+            if word & ~STATE_MASK == tag:
+                # The slot was reused for another key while it was read
+                if expires < now or TAG.unpack_from(self._mmap, offset)[0] != word:
+                    return None
+                return word & STATE_MASK == STATE_OCCUPIED
+        return None
+
+    def set_many(self, keys, occupied, ttl=None):
+        """Store the state of keys, returning the keys which didn't fit in the table"""
+        state = STATE_OCCUPIED if occupied else STATE_VACATED
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        now = time.time()
+        dropped = []
+        with self._write_lock, self._file_lock(0):
+            for key in keys:
+                tag = self._tag(key)
+                target = None
+                for offset in self._offsets(tag):
+                    word, slot_expires = SLOT.unpack_from(self._mmap, offset)
+                    if word & ~STATE_MASK == tag:
+                        target = offset
+                        break
+                    if target is None and (word == 0 or slot_expires < now):
+                        target = offset
+                    if word == 0:
+                        break
+
+                if target is None:
+                    dropped.append(key)
+                    continue
+                self._write_slot(target, tag | state, expires)
+        return dropped
+
+    def _write(self, offset, data):
+        self._mmap[offset:offset + len(data)] = data
+
+    def _write_slot(self, offset, word, expires):
+        """
+        Write a slot so readers never see a tag with another key's expiry, invalidating
+        a slot held by another key before its expiry is replaced.
+        """
+        if TAG.unpack_from(self._mmap, offset)[0] & ~STATE_MASK not in (0, word & ~STATE_MASK):
+            self._write(offset, TAG.pack(TOMBSTONE))
+        self._write(offset + TAG.size, struct.pack("<d", expires))
+        self._write(offset, TAG.pack(word))
+
+    def set(self, key, occupied, ttl=None):
+        return not self.set_many([key], occupied, ttl=ttl)
+
+
+_table = None
+_table_pid = None
+
+
+def get_occupancy_table():
+    """Return the process's OccupancyTable, or None when it's disabled or unavailable"""
+    global _table, _table_pid
+
+    path = getattr(settings, "DRF_MODEL_PUSHER_OCCUPANCY_TABLE", None)
+    if not path or fcntl is None:
+        return None
+
+    # Forked workers open their own mapping, file locks aren't inherited across fork
+    if _table is not None and (_table_pid != os.getpid() or (_table and _table.path != path)):
+        _table = None
+
+    if _table is None:
+        _table_pid = os.getpid()
+        try:
+            _table = OccupancyTable(
+                path,
+                slots=getattr(settings, "DRF_MODEL_PUSHER_OCCUPANCY_TABLE_SLOTS", 65536),
+                ttl=getattr(settings, "DRF_MODEL_PUSHER_OCCUPANCY_TABLE_TTL", 10),
+            )
+        except OSError:
+            logger.warning("Occupancy table %s is unavailable, using the store", path, exc_info=True)
+            _table = False
+
+    return _table or None
+
+
+@receiver(setting_changed)
+def reset_occupancy_table(setting=None, **kwargs):
+    global _table, _store
+    if setting is None or setting.startswith("DRF_MODEL_PUSHER_OCCUPANCY"):
+        if _table and _table_pid == os.getpid():
+            _table.close()
+        _table = None
+        _store = None
+
+
+def get_occupied_cache_key(channel, app=None):
+    """Return the cache key storing whether a channel is occupied"""
+    if app is None:
+        return "drf-model-pusher:occupied:{}".format(channel)
+    return "drf-model-pusher:occupied:{}:{}".format(app, channel)
+
+
+class OccupancyStore(object):
+    """
+    Stores which channels of each Pusher app are occupied.
+
+    `get_many` returns None for channels whose state is unknown, which makes
+    providers sync with Pusher. Passing `timeout=None` to `set_many` stores state
+    which never expires, otherwise DRF_MODEL_PUSHER_OCCUPANCY_TIMEOUT is used.
+    """
+
+    default_timeout = 300
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = getattr(settings, "DRF_MODEL_PUSHER_OCCUPANCY_TIMEOUT", self.default_timeout)
+        self.timeout = timeout
+
+    def get_timeout(self, timeout=DEFAULT_TIMEOUT):
+        return self.timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def get_many(self, channels, app=None):
+        """Return a dict of channel to whether it's occupied, or None when unknown"""
+        raise NotImplementedError
+
+    def set_many(self, channels, occupied, app=None, timeout=DEFAULT_TIMEOUT):
+        raise NotImplementedError
+
+    def replace(self, channels, app=None):
+        """Replace the state of an app after a full sync, `channels` are occupied and every other channel isn't"""
+        raise NotImplementedError
+
+
+class CacheOccupancyStore(OccupancyStore):
+    """
+    Stores a key per channel through the Django cache.
+
+    The cache can't list keys, so the channels marked occupied are also kept in an
+    index per app, and a sync vacates the indexed channels Pusher no longer reports.
+    The index is updated with a get and a set, so channels marked occupied by
+    concurrent writes can be missed and are then corrected by their expiry. A sync
+    also records that the app was synced, until that record expires channels which
+    aren't stored are known to be unoccupied, otherwise they're unknown and cause
+    another sync.
+    """
+
+    default_timeout = DEFAULT_TIMEOUT
+
+    def get_index_key(self, app=None):
+        return "drf-model-pusher:occupied-index:{0}".format(app or "")
+
+    def get_synced_key(self, app=None):
+        return "drf-model-pusher:occupancy-synced:{0}".format(app or "")
+
+    def get_many(self, channels, app=None):
+        keys = {get_occupied_cache_key(channel, app): channel for channel in channels}
+        if not keys:
+            return {}
+        synced_key = self.get_synced_key(app)
+        found = cache.get_many(list(keys) + [synced_key])
+        unoccupied = False if synced_key in found else None
+        return {channel: found.get(key, unoccupied) for key, channel in keys.items()}
+
+    def set_many(self, channels, occupied, app=None, timeout=DEFAULT_TIMEOUT):
+        channels = list(channels)
+        cache.set_many(
+            {get_occupied_cache_key(channel, app): occupied for channel in channels},
+            timeout=self.get_timeout(timeout),
+        )
+
+        index = cache.get(self.get_index_key(app)) or set()
+        updated = index | set(channels) if occupied else index - set(channels)
+        if updated != index:
+            cache.set(self.get_index_key(app), updated, timeout=None)
+
+    def replace(self, channels, app=None):
+        channels = list(channels)
+        vacated = (cache.get(self.get_index_key(app)) or set()).difference(channels)
+        if vacated:
+            cache.set_many(
+                {get_occupied_cache_key(channel, app): False for channel in vacated},
+                timeout=self.get_timeout(),
+            )
+        cache.set_many(
+            {get_occupied_cache_key(channel, app): True for channel in channels}, timeout=self.get_timeout()
+        )
+        cache.set(self.get_index_key(app), set(channels), timeout=None)
+        cache.set(self.get_synced_key(app), True, timeout=self.get_timeout())
+
+
+class RedisOccupancyStore(OccupancyStore):
+    """
+    Stores the occupied and vacated channels of each app in Redis sorted sets, scored by when they expire.
+
+    Lookups are a single round trip of pipelined ZMSCORE (Redis 6.2+) and a full
+    sync swaps in a new occupied set atomically, recording that the app was synced.
+    Until that record expires, channels in neither set are known to be unoccupied.
+    Each channel expires on its own, so state stored without a timeout doesn't keep
+    the rest of the set alive, and expired channels are pruned by later writes.
+
+    Requires the optional `redis` dependency.
+    """
+
+    def __init__(self, url="redis://localhost:6379/0", client=None, prefix="drf-model-pusher:occupancy", **kwargs):
+        super().__init__(**kwargs)
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def get_key(self, app=None, occupied=True):
+        return "{0}:{1}:{2}".format(self.prefix, app or "", "occupied" if occupied else "vacated")
+
+    def get_synced_key(self, app=None):
+        return "{0}:{1}:synced".format(self.prefix, app or "")
+
+    def get_expires_at(self, timeout=DEFAULT_TIMEOUT):
+        timeout = self.get_timeout(timeout)
+        return float("inf") if timeout is None else time.time() + timeout
+
+    def get_many(self, channels, app=None):
+        channels = list(channels)
+        if not channels:
+            return {}
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.exists(self.get_synced_key(app))
+        pipe.zmscore(self.get_key(app), channels)
+        pipe.zmscore(self.get_key(app, occupied=False), channels)
+        synced, occupied, vacated = pipe.execute()
+        now = time.time()
+        unoccupied = False if synced else None
+        return {
+            channel: True if is_occupied is not None and is_occupied > now
+            else False if is_vacated is not None and is_vacated > now
+            else unoccupied
+            for channel, is_occupied, is_vacated in zip(channels, occupied, vacated)
+        }
+
+    def set_many(self, channels, occupied, app=None, timeout=DEFAULT_TIMEOUT):
+        channels = list(channels)
+        if not channels:
+            return
+
+        key = self.get_key(app, occupied)
+        expires_at = self.get_expires_at(timeout)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zadd(key, {channel: expires_at for channel in channels})
+        pipe.zrem(self.get_key(app, not occupied), *channels)
+        pipe.zremrangebyscore(key, "-inf", time.time())
+        pipe.execute()
+
+    def replace(self, channels, app=None):
+        channels = list(channels)
+        key = self.get_key(app)
+        swap_key = key + ":swap"
+        expires_at = self.get_expires_at()
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(self.get_key(app, occupied=False))
+        if channels:
+            pipe.delete(swap_key)
+            pipe.zadd(swap_key, {channel: expires_at for channel in channels})
+            pipe.rename(swap_key, key)
+        else:
+            pipe.delete(key)
+        if self.timeout is None:
+            pipe.set(self.get_synced_key(app), 1)
+        else:
+            pipe.set(self.get_synced_key(app), 1, ex=int(self.timeout))
+        pipe.execute()
+
+
+class DatabaseOccupancyStore(OccupancyStore):
+    """
+    Stores a row per channel in the `ChannelOccupancy` table.
+
+    A full sync replaces an app's rows in a transaction, recording that the app was
+    synced so channels without rows are known to be unoccupied. Expired rows are
+    ignored and removed by the next sync.
+    """
+
+    SYNCED = "#synced"
+
+    def get_expires_at(self, timeout=DEFAULT_TIMEOUT):
+        timeout = self.get_timeout(timeout)
+        if timeout is None:
+            return None
+        return timezone.now() + datetime.timedelta(seconds=timeout)
+
+    def get_many(self, channels, app=None):
+        from drf_model_pusher.models import ChannelOccupancy
+
+        channels = list(channels)
+        if not channels:
+            return {}
+
+        rows = dict(
+            ChannelOccupancy.objects.filter(app=app or "", channel__in=channels + [self.SYNCED])
+            .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()))
+            .values_list("channel", "occupied")
+        )
+        unoccupied = False if self.SYNCED in rows else None
+        return {channel: rows.get(channel, unoccupied) for channel in channels}
+
+    def set_many(self, channels, occupied, app=None, timeout=DEFAULT_TIMEOUT):
+        from drf_model_pusher.models import ChannelOccupancy
+
+        channels = list(channels)
+        expires_at = self.get_expires_at(timeout)
+        # An upsert, so concurrent writers of the same channels don't conflict on the unique constraint
+        with transaction.atomic():
+            ChannelOccupancy.objects.bulk_create(
+                [
+                    ChannelOccupancy(app=app or "", channel=channel, occupied=occupied, expires_at=expires_at)
+                    for channel in channels
+                ],
+                ignore_conflicts=True,
+            )
+            ChannelOccupancy.objects.filter(app=app or "", channel__in=channels).update(
+                occupied=occupied, expires_at=expires_at
+            )
+
+    def replace(self, channels, app=None):
+        from drf_model_pusher.models import ChannelOccupancy
+
+        expires_at = self.get_expires_at()
+        with transaction.atomic():
+            ChannelOccupancy.objects.filter(app=app or "").delete()
+            ChannelOccupancy.objects.bulk_create(
+                ChannelOccupancy(app=app or "", channel=channel, occupied=True, expires_at=expires_at)
+                for channel in list(channels) + [self.SYNCED]
+            )
+
+
+_store = None
+
+
+def get_occupancy_store():
+    """Return the OccupancyStore configured by DRF_MODEL_PUSHER_OCCUPANCY_STORE"""
+    global _store
+    if _store is None:
+        store_class = getattr(
+            settings, "DRF_MODEL_PUSHER_OCCUPANCY_STORE", "drf_model_pusher.occupancy.CacheOccupancyStore"
+        )
+        if isinstance(store_class, str):
+            store_class = import_string(store_class)
+        _store = store_class(**getattr(settings, "DRF_MODEL_PUSHER_OCCUPANCY_STORE_OPTIONS", {}))
+    return _store
+
+
+def get_occupancy_timeout():
+    """Return the timeout of occupancy state, a finite one when the store's state never expires"""
+    timeout = get_occupancy_store().timeout
+    return OccupancyStore.default_timeout if timeout is None else timeout
+
+
+def get_channels_occupancy(channels, app=None):
+    """Return a dict of channel to whether it's occupied, or None when its state is unknown"""
+    channels = list(channels)
+    occupancy = {}
+    table = get_occupancy_table()
+    if table is not None:
+        for channel in channels:
+            occupancy[channel] = table.get(get_occupied_cache_key(channel, app))
+
+    missing = [channel for channel in channels if occupancy.get(channel) is None]
+    if missing:
+        found = get_occupancy_store().get_many(missing, app)
+        occupancy.update(found)
+        if table is not None:
+            for occupied in (True, False):
+                table.set_many(
+                    [get_occupied_cache_key(channel, app) for channel in missing if found[channel] is occupied],
+                    occupied,
+                )
+    return occupancy
+
+
+def set_channels_occupancy(channels, occupied, app=None, timeout=DEFAULT_TIMEOUT):
+    """Store whether channels are occupied, in the store and the occupancy table"""
+    channels = list(channels)
+    get_occupancy_store().set_many(channels, occupied, app=app, timeout=timeout)
+    table = get_occupancy_table()
+    if table is not None:
+        table.set_many([get_occupied_cache_key(channel, app) for channel in channels], occupied)
+
+
+def replace_channels_occupancy(channels, app=None):
+    """Store the occupied channels of an app after a full sync with Pusher"""
+    channels = list(channels)
+    get_occupancy_store().replace(channels, app=app)
+    table = get_occupancy_table()
+    if table is not None:
+        table.set_many([get_occupied_cache_key(channel, app) for channel in channels], True)
@@ -0,0 +1,105 @@
+"""
+Syncs channel occupancy with Pusher outside of requests: once at startup and periodically in a background thread.
+"""
+import logging
+import os
+import random
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from drf_model_pusher.providers import PusherProvider
+
+logger = logging.getLogger(__name__)
+
+
+def get_occupancy_apps():
+    """Return the Pusher apps to sync, None being the app configured by the PUSHER_* settings"""
+    apps = []
+    if getattr(settings, "PUSHER_APP_ID", None):
+        apps.append(None)
+    apps.extend(sorted(getattr(settings, "DRF_MODEL_PUSHER_APPS", {})))
+    return apps
+
+
+def sync_occupancy(apps=None):
+    """Replace the stored occupancy of each app with Pusher's, returning a dict of app to its occupied channels"""
+    synced = {}
+    for app in get_occupancy_apps() if apps is None else apps:
+        provider = PusherProvider(app=app)
+        provider.configure()
+        synced[app] = provider._fetch_occupied_channels()
+    return synced
+
+
+class OccupancyRefresher(threading.Thread):
+    """
+    Periodically reconciles the stored occupancy with Pusher, so syncs during requests
+    are rare and missed webhooks are corrected within `interval` seconds.
+    """
+
+    def __init__(self, interval, apps=None):
+        super().__init__(name="drf-model-pusher-occupancy", daemon=True)
+        self.interval = interval
+        self.apps = apps
+        self.stopped = threading.Event()
+
+    def run(self):
+        # Spread the syncs of workers started together
+        while not self.stopped.wait(self.interval * random.uniform(0.9, 1.1)):
+            # Like a request, stores using the database mustn't reuse a connection the server closed
+            close_old_connections()
+            try:
+                sync_occupancy(self.apps)
+            except Exception:
+                logger.exception("Failed to sync pusher channel occupancy")
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self.stopped.set()
+
+
+_refresher = None
+_refresher_pid = None
+_refresher_lock = threading.Lock()
+
+
+def ensure_occupancy_refresher():
+    """
+    Start the refresher configured by DRF_MODEL_PUSHER_OCCUPANCY_REFRESH_INTERVAL unless it's running in this process.
+
+    Providers call this when they first check occupancy, rather than the app starting it, so
+    management commands don't sync. Threads don't survive fork, so it's also started again in
+    each forked worker.
+    """
+    global _refresher, _refresher_pid
+    interval = getattr(settings, "DRF_MODEL_PUSHER_OCCUPANCY_REFRESH_INTERVAL", None)
+    if not interval or (_refresher_pid == os.getpid() and _refresher.is_alive()):
+        return _refresher
+
+    with _refresher_lock:
+        if _refresher_pid != os.getpid() or not _refresher.is_alive():
+            _refresher = OccupancyRefresher(interval)
+            _refresher.start()
+            _refresher_pid = os.getpid()
+    return _refresher
+
+
+def stop_occupancy_refresher():
+    global _refresher, _refresher_pid
+    if _refresher is not None and _refresher_pid == os.getpid():
+        _refresher.stop()
+    _refresher = _refresher_pid = None
+
+
+def warm_up_occupancy():
+    """Sync occupancy at startup when DRF_MODEL_PUSHER_OCCUPANCY_WARMUP is enabled, logging failures"""
+    if not getattr(settings, "DRF_MODEL_PUSHER_WEBHOOK_OPTIMISATION_ENABLED", False):
+        return
+    if getattr(settings, "DRF_MODEL_PUSHER_OCCUPANCY_WARMUP", False):
+        try:
+            sync_occupancy()
+        except Exception:
+            logger.exception("Failed to warm up pusher channel occupancy")
@@ -1,15 +1,104 @@
+import bisect
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
 
 from django.conf import settings
-from django.core.cache import cache
-from pusher import Pusher
+from django.utils.module_loading import import_string
+
+from drf_model_pusher.exceptions import ModelPusherException
+from drf_model_pusher.idempotency import get_deduplicator
+from drf_model_pusher.occupancy import (
+    get_channels_occupancy,
+    get_occupancy_table,
+    get_occupied_cache_key,
+    replace_channels_occupancy,
+)
+from drf_model_pusher.shedding import get_overload_controller
+from drf_model_pusher.throttling import get_throttle
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pusher import Pusher
+
+# Pusher clients keyed by their credentials, shared by every provider in the process
+_pusher_clients = {}
+
+
+def get_pusher_app_settings(app=None):
+    """Return the credentials for an app in DRF_MODEL_PUSHER_APPS, or the PUSHER_* settings when app is None"""
+    if app is None:
+        app_settings = {
+            "app_id": settings.PUSHER_APP_ID,
+            "key": settings.PUSHER_KEY,
+            "secret": settings.PUSHER_SECRET,
+            "cluster": getattr(settings, "PUSHER_CLUSTER", "mt1"),
+        }
+        encryption_master_key = getattr(settings, "PUSHER_ENCRYPTION_MASTER_KEY_BASE64", None)
+        if encryption_master_key is not None:
+            app_settings["encryption_master_key_base64"] = encryption_master_key
+        return app_settings
+
+    try:
+        app_settings = dict(settings.DRF_MODEL_PUSHER_APPS[app])
+    except (AttributeError, KeyError):
+        raise ModelPusherException("Pusher app {0} is not configured in DRF_MODEL_PUSHER_APPS".format(app))
+    app_settings.setdefault("cluster", "mt1")
+    return app_settings
+
+
+def get_pusher_client(app=None) -> "Pusher":
+    """Return a pooled Pusher client for the app"""
+    # Imported here so processes which never publish don't pay for importing pusher
+    from pusher import Pusher
+
+    app_settings = get_pusher_app_settings(app)
+    key = tuple(sorted(app_settings.items()))
+    try:
+        return _pusher_clients[key]
+    except KeyError:
+        client = _pusher_clients[key] = Pusher(**app_settings)
+        return client
+
+
+@contextmanager
+def unmeasured():
+    yield
+
+
+def trigger_packets(provider, packets, socket_id=None):
+    """Send (channels, event_name, data) packets with the provider's trigger_batch, or a trigger per packet when
+    the provider has no trigger_batch"""
+    trigger_batch = getattr(provider, "trigger_batch", None)
+    if trigger_batch is not None:
+        trigger_batch(packets, socket_id)
+        return
+
+    idempotency_keys = getattr(provider, "idempotency_keys", None)
+    for index, (channels, event_name, data) in enumerate(packets):
+        if idempotency_keys:
+            provider.idempotency_keys = [idempotency_keys[index]]
+        provider.trigger(channels, event_name, data, socket_id)
+
+
+def get_batch_size():
+    """Return the number of events sent per request to Pusher's batch endpoint"""
+    return getattr(settings, "DRF_MODEL_PUSHER_BATCH_SIZE", 10)
 
 
 class PusherProvider(object):
     """
     This class provides a wrapper to Pusher so that we can mock it or disable it easily
+
+    `app` selects credentials from DRF_MODEL_PUSHER_APPS instead of the PUSHER_* settings.
+    `priority` is the lane of the events being sent, used by queued providers, and
+    `idempotency_keys` are the keys of the packets being sent, see `drf_model_pusher.idempotency`.
     """
 
-    def __init__(self):
+    def __init__(self, app=None):
+        self.app = app
+        self.priority = None
+        self.idempotency_keys = None
         self._pusher = None
         self._disabled = False
 
@@ -17,17 +106,7 @@ class PusherProvider(object):
             self._disabled = settings.DRF_MODEL_PUSHER_DISABLED
 
     def configure(self):
-        try:
-            pusher_cluster = settings.PUSHER_CLUSTER
-        except AttributeError:
-            pusher_cluster = "mt1"
-
-        self._pusher = Pusher(
-            app_id=settings.PUSHER_APP_ID,
-            key=settings.PUSHER_KEY,
-            secret=settings.PUSHER_SECRET,
-            cluster=pusher_cluster,
-        )
+        self._pusher = get_pusher_client(self.app)
 
     def trigger(self, channels, event_name, data, socket_id=None):
         if not isinstance(channels, list):
@@ -36,49 +115,282 @@ class PusherProvider(object):
         if self._disabled:
             return
 
-        valid_channels = channels
+        valid_channels = self.get_occupied_channels(channels)
+        valid_channels = self.get_unthrottled_channels(valid_channels, event_name, data, socket_id)
+        if not valid_channels:
+            return
 
-        # Only send events to channels that are occupied
-        if getattr(settings, "DRF_MODEL_PUSHER_WEBHOOK_OPTIMISATION_ENABLED", False):
-            valid_channels = []
-            has_synced_cache = False
-            for channel in channels:
-                cache_key = "drf-model-pusher:occupied:{}".format(channel)
-                occupied = cache.get(cache_key)
+        idempotency_key = self.get_idempotency_key(0)
+        valid_channels, delivery_keys = self.deduplicate(
+            [(idempotency_key, channel, channel) for channel in valid_channels]
+        )
+        if valid_channels:
+            try:
+                with self.measure():
+                    self.client.trigger(valid_channels, event_name, data, socket_id)
+            except Exception:
+                self.release_deliveries(delivery_keys)
+                raise
 
-                if occupied is None and not has_synced_cache:
-                    self._sync_cache()
-                    has_synced_cache = True
-                    occupied = cache.get(cache_key)
+    def trigger_batch(self, packets, socket_id=None):
+        """Send many (channels, event_name, data) packets using Pusher's batch endpoint
 
-                if occupied:
-                    valid_channels.append(channel)
+        Pusher accepts a single channel per batched event and a limited number of events per
+        request, so packets are expanded per channel and sent in groups of `batch_size`."""
+        if self._disabled:
+            return
 
-        if valid_channels:
-            self.client.trigger(valid_channels, event_name, data, socket_id)
+        deliveries = []
+        for index, (channels, event_name, data) in enumerate(packets):
+            if not isinstance(channels, list):
+                raise TypeError("channels must be a list, received {0}".format(str(type(channels))))
+
+            valid_channels = self.get_occupied_channels(channels)
+            valid_channels = self.get_unthrottled_channels(valid_channels, event_name, data, socket_id)
+            idempotency_key = self.get_idempotency_key(index)
+            for channel in valid_channels:
+                event = {"channel": channel, "name": event_name, "data": data}
+                if socket_id is not None:
+                    event["socket_id"] = socket_id
+                deliveries.append((idempotency_key, channel, event))
+
+        events, delivery_keys = self.deduplicate(deliveries)
+        batch_size = get_batch_size()
+        for offset in range(0, len(events), batch_size):
+            try:
+                with self.measure(len(events[offset:offset + batch_size])):
+                    self.send_batch(events[offset:offset + batch_size])
+            except Exception:
+                # The chunks after a failed one aren't sent either
+                self.release_deliveries(delivery_keys[offset:])
+                raise
+
+    def send_batch(self, events):
+        """Send a list of event dicts with a single call to Pusher's batch endpoint"""
+        self.client.trigger_batch(events)
+
+    def get_idempotency_key(self, index):
+        """Return the idempotency key of the packet at index, if any"""
+        keys = self.idempotency_keys
+        return keys[index] if keys else None
+
+    def deduplicate(self, deliveries):
+        """Return the items of (idempotency_key, channel, item) deliveries which weren't already sent, and the
+        delivery keys claimed for them, see `drf_model_pusher.idempotency`"""
+        deduplicator = get_deduplicator()
+        if deduplicator is None:
+            return [item for idempotency_key, channel, item in deliveries], []
+        return deduplicator.filter(deliveries)
+
+    def release_deliveries(self, delivery_keys):
+        """Release the deliveries of a failed send so a retry isn't skipped as a duplicate"""
+        deduplicator = get_deduplicator()
+        if deduplicator is not None:
+            deduplicator.release(delivery_keys)
+
+    def get_unthrottled_channels(self, channels, event_name, data, socket_id=None):
+        """Return the channels within their configured rate limits and the current shedding level,
+        see `drf_model_pusher.throttling` and `drf_model_pusher.shedding`"""
+        if not channels:
+            return channels
+
+        controller = get_overload_controller()
+        if controller is not None:
+            channels = controller.filter_channels(
+                channels, event_name, data, socket_id, self.priority, self.send_unthrottled
+            )
+
+        throttle = get_throttle()
+        if throttle is None or not channels:
+            return channels
+        return throttle.filter_channels(channels, event_name, data, socket_id, self.send_unthrottled)
+
+    def send_unthrottled(self, channels, event_name, data, socket_id=None):
+        """Send an event without applying occupancy checks or throttling, used for coalesced events"""
+        with self.measure():
+            self.client.trigger(channels, event_name, data, socket_id)
+
+    def measure(self, events=1):
+        """Return a context manager recording the latency of a publish for load shedding"""
+        controller = get_overload_controller()
+        if controller is None:
+            return unmeasured()
+        return controller.measure(events)
+
+    def get_occupied_channels(self, channels):
+        """Return the channels which are occupied, or all channels when the optimisation is disabled"""
+        if not getattr(settings, "DRF_MODEL_PUSHER_WEBHOOK_OPTIMISATION_ENABLED", False):
+            return channels
+
+        if getattr(settings, "DRF_MODEL_PUSHER_OCCUPANCY_REFRESH_INTERVAL", None):
+            from drf_model_pusher.occupancy_sync import ensure_occupancy_refresher
+
+            ensure_occupancy_refresher()
+
+        # Only send events to channels that are occupied
+        occupancy = get_channels_occupancy(channels, self.app)
+        unknown_channels = [channel for channel in channels if occupancy[channel] is None]
+        if unknown_channels:
+            self._sync_cache(unknown_channels)
+            occupancy.update(get_channels_occupancy(unknown_channels, self.app))
+
+        return [channel for channel in channels if occupancy[channel]]
 
     @property
-    def client(self) -> Pusher:
+    def client(self) -> "Pusher":
         if self._pusher is None:
             self.configure()
 
         return self._pusher
 
-    def _sync_cache(self):
+    def _sync_cache(self, channels=None):
         """
-        Fetches channel existence state from Pusher and stores the results in the cache
+        Fetches channel existence state from Pusher and stores the results in the occupancy store
         :return:
         """
-        response = self.client.channels_info()
-        occupied_channels = list(
-            map(
-                lambda occupied_channel: "drf-model-pusher:occupied:{}".format(occupied_channel),
-                response.get("channels", {}).keys()
-            )
+        table = get_occupancy_table()
+        if table is None:
+            self._fetch_occupied_channels()
+            return
+
+        # One worker on the host syncs at a time, the others use its results once it's done
+        with table.sync_lock():
+            keys = {get_occupied_cache_key(channel, self.app): channel for channel in channels or ()}
+            if keys and all(table.get(key) is not None for key in keys):
+                return
+            occupied_channels = self._fetch_occupied_channels()
+            # Remember the channels weren't occupied so other workers don't sync again for them
+            table.set_many([key for key, channel in keys.items() if channel not in occupied_channels], False)
+
+    def _fetch_occupied_channels(self):
+        occupied_channels = list(self.client.channels_info().get("channels", {}).keys())
+        replace_channels_occupancy(occupied_channels, self.app)
+        return set(occupied_channels)
+
+
+class ConsistentHashRing(object):
+    """Maps keys onto nodes so that adding or removing a node only moves a fraction of the keys"""
+
+    def __init__(self, nodes, replicas=100):
+        self._ring = sorted(
+            (self._hash("{0}:{1}".format(node, replica)), node) for node in nodes for replica in range(replicas)
         )
-        cache.set_many(
-            dict.fromkeys(occupied_channels, True)
+        self._hashes = [point for point, node in self._ring]
+
+    @staticmethod
+    def _hash(key):
+        return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+    def get_node(self, key):
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._ring[index][1]
+
+
+_executor = None
+
+
+def get_executor():
+    """Return the thread pool used to send to several Pusher apps concurrently"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "DRF_MODEL_PUSHER_APP_WORKERS", 4), thread_name_prefix="drf-model-pusher"
         )
+    return _executor
+
+
+class ShardedPusherProvider(PusherProvider):
+    """
+    Routes channels across the Pusher apps configured in DRF_MODEL_PUSHER_APPS.
+
+    Channels are mapped to apps with DRF_MODEL_PUSHER_APP_ROUTER, a dotted path to a
+    callable taking the channel and returning an app name, or otherwise by consistent
+    hashing of the channel name. Each app has its own pooled client and occupancy
+    cache, and the triggers for different apps are sent concurrently.
+    """
+
+    _rings = {}
+
+    def __init__(self, app=None):
+        super().__init__(app=app)
+        self._providers = {}
+
+    def configure(self):
+        pass
+
+    def get_app_provider(self, app):
+        """Return the provider sending to a single app"""
+        provider = self._providers.get(app)
+        if provider is None:
+            provider = self._providers[app] = PusherProvider(app=app)
+            provider.configure()
+        return provider
+
+    def get_app_for_channel(self, channel):
+        """Return the name of the app a channel is sent through"""
+        router = getattr(settings, "DRF_MODEL_PUSHER_APP_ROUTER", None)
+        if router is not None:
+            if isinstance(router, str):
+                router = import_string(router)
+            return router(channel)
+
+        apps = tuple(sorted(getattr(settings, "DRF_MODEL_PUSHER_APPS", {})))
+        if not apps:
+            raise ModelPusherException("DRF_MODEL_PUSHER_APPS must configure at least one Pusher app")
+        ring = self._rings.get(apps)
+        if ring is None:
+            ring = self._rings[apps] = ConsistentHashRing(apps)
+        return ring.get_node(channel)
+
+    def group_channels(self, channels):
+        """Return a dict of app name to the channels routed to it"""
+        groups = {}
+        for channel in channels:
+            groups.setdefault(self.get_app_for_channel(channel), []).append(channel)
+        return groups
+
+    def trigger(self, channels, event_name, data, socket_id=None):
+        if not isinstance(channels, list):
+            raise TypeError("channels must be a list, received {0}".format(str(type(channels))))
+
+        if self._disabled:
+            return
+
+        calls = []
+        for app, app_channels in self.group_channels(channels).items():
+            provider = self.get_app_provider(app)
+            provider.priority = self.priority
+            provider.idempotency_keys = self.idempotency_keys
+            calls.append((provider.trigger, (app_channels, event_name, data, socket_id)))
+        self._run_concurrently(calls)
+
+    def trigger_batch(self, packets, socket_id=None):
+        if self._disabled:
+            return
+
+        app_packets, app_keys = {}, {}
+        for index, (channels, event_name, data) in enumerate(packets):
+            for app, app_channels in self.group_channels(channels).items():
+                app_packets.setdefault(app, []).append((app_channels, event_name, data))
+                app_keys.setdefault(app, []).append(self.get_idempotency_key(index))
+
+        calls = []
+        for app, packets in app_packets.items():
+            provider = self.get_app_provider(app)
+            provider.priority = self.priority
+            provider.idempotency_keys = app_keys[app]
+            calls.append((provider.trigger_batch, (packets, socket_id)))
+        self._run_concurrently(calls)
+
+    def _run_concurrently(self, calls):
+        if len(calls) == 1:
+            method, args = calls[0]
+            method(*args)
+            return
+
+        futures = [get_executor().submit(method, *args) for method, args in calls]
+        for future in futures:
+            future.result()
 
 
 class AblyProvider(object):
@@ -90,3 +402,6 @@ class AblyProvider(object):
 
     def trigger(self, channels, event_name, data):
         pass
+
+    def trigger_batch(self, packets, socket_id=None):
+        pass
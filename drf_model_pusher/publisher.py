@@ -0,0 +1,324 @@
+"""
+An out-of-process publisher, web workers write packets to a local Unix socket and
+the `run_pusher_publisher` daemon batches them across workers before sending.
+
+Frames are a 4 byte big endian length followed by a compact JSON list of
+`[channels, event_name, data, socket_id, priority]` packets, with the packet's
+idempotency key appended when it has one.
+"""
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.utils.encoders import JSONEncoder
+
+from drf_model_pusher.lanes import PRIORITY_NORMAL, PriorityLanes
+from drf_model_pusher.providers import PusherProvider
+from drf_model_pusher.shedding import get_overload_controller
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct(">I")
+
+
+def get_socket_path():
+    """
+    Return DRF_MODEL_PUSHER_PUBLISHER_SOCKET, or a socket in a private directory of $XDG_RUNTIME_DIR.
+
+    There's no default in a shared directory such as /tmp, where another user could
+    bind the path first and receive every event.
+    """
+    path = getattr(settings, "DRF_MODEL_PUSHER_PUBLISHER_SOCKET", None)
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime_dir:
+        raise ImproperlyConfigured(
+            "Set DRF_MODEL_PUSHER_PUBLISHER_SOCKET to a path in a directory only the publisher's user can write to"
+        )
+    return os.path.join(runtime_dir, "drf-model-pusher", "publisher.sock")
+
+
+def ensure_private_directory(path):
+    """Create the directory of a socket path with mode 0700, refusing a directory other users can write to"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise ImproperlyConfigured(
+            "The publisher socket's directory {0} must be owned by the publisher's user and not writable by "
+            "others".format(directory)
+        )
+
+
+def encode_frame(packets, socket_id=None, priority=None, idempotency_keys=None):
+    """Encode (channels, event_name, data) packets into a length prefixed frame"""
+    frame = [[channels, event_name, data, socket_id, priority] for channels, event_name, data in packets]
+    for packet, idempotency_key in zip(frame, idempotency_keys or ()):
+        if idempotency_key is not None:
+            packet.append(idempotency_key)
+    body = json.dumps(
+        frame,
+        cls=JSONEncoder,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+def read_frame(stream):
+    """Read a frame from a file-like stream, returning its packets or None at the end of the stream"""
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    body = stream.read(length)
+    if len(body) < length:
+        return None
+    return json.loads(body.decode("utf-8"))
+
+
+class PublisherClient(object):
+    """
+    Writes frames to the publisher socket, keeping one connection per thread.
+
+    Writes block while the publisher is saturated, up to `timeout` seconds.
+    """
+
+    def __init__(self, socket_path=None, timeout=None):
+        self.socket_path = socket_path or get_socket_path()
+        if timeout is None:
+            timeout = getattr(settings, "DRF_MODEL_PUSHER_PUBLISHER_TIMEOUT", 1.0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self._local.sock = sock
+        return sock
+
+    def close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def send(self, packets, socket_id=None, priority=None, idempotency_keys=None):
+        frame = encode_frame(packets, socket_id, priority, idempotency_keys)
+        sock = getattr(self._local, "sock", None)
+        try:
+            if sock is None:
+                sock = self.connect()
+            sock.sendall(frame)
+        except (BrokenPipeError, ConnectionResetError):
+            # The publisher restarted, reconnect once
+            self.close()
+            try:
+                self.connect().sendall(frame)
+            except OSError:
+                # Don't leave a broken socket for the thread's next send
+                self.close()
+                raise
+        except OSError:
+            self.close()
+            raise
+
+
+_client = None
+
+
+def get_publisher_client():
+    """Return the process wide PublisherClient"""
+    global _client
+    if _client is None or _client.socket_path != get_socket_path():
+        _client = PublisherClient()
+    return _client
+
+
+class SocketPublisherProvider(PusherProvider):
+    """
+    Sends packets to the local publisher daemon instead of calling Pusher, falling back
+    to calling Pusher directly when the publisher is unavailable or saturated.
+    """
+
+    def configure(self):
+        pass
+
+    def trigger(self, channels, event_name, data, socket_id=None):
+        self.trigger_batch([(channels, event_name, data)], socket_id)
+
+    def trigger_batch(self, packets, socket_id=None):
+        if self._disabled:
+            return
+
+        try:
+            get_publisher_client().send(packets, socket_id, self.priority, self.idempotency_keys)
+        except OSError:
+            logger.warning("Pusher publisher unavailable at %s, sending directly", get_socket_path(), exc_info=True)
+            super().configure()
+            super().trigger_batch(packets, socket_id)
+
+
+class PublisherRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            frame = read_frame(self.rfile)
+            if frame is None:
+                return
+            for packet in frame:
+                self.server.publisher.enqueue(packet)
+
+
+class PublisherServer(object):
+    """
+    Accepts frames from web workers and sends them to Pusher in batches.
+
+    Packets are queued in weighted priority lanes (see `drf_model_pusher.lanes`).
+    The queue is bounded, once it is full low priority updates are coalesced or
+    shed, then connections stop being read so senders block on their socket
+    writes until the queue drains.
+    """
+
+    def __init__(
+        self,
+        socket_path=None,
+        provider_class=PusherProvider,
+        max_queue=10000,
+        batch_size=100,
+        flush_interval=0.05,
+        lane_weights=None,
+    ):
+        self.socket_path = socket_path or get_socket_path()
+        self.provider_class = provider_class
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = PriorityLanes(max_size=max_queue, weights=lane_weights)
+        self.sent = 0
+        self._running = threading.Event()
+        self._server = None
+        self._flusher = None
+        self._socket_inode = None
+
+    def enqueue(self, packet):
+        channels, event_name, data, socket_id = packet[:4]
+        priority = packet[4] if len(packet) > 4 and packet[4] else PRIORITY_NORMAL
+        # The idempotency key is kept as a fifth item when the packet has one
+        self.queue.put(
+            (channels, event_name, data, socket_id) + tuple(packet[5:6]),
+            lane=priority,
+            coalesce_key=self.get_coalesce_key(channels, event_name, data, socket_id),
+        )
+
+    def get_coalesce_key(self, channels, event_name, data, socket_id):
+        """Return a key identifying events which supersede each other, when the data has an id"""
+        if isinstance(data, dict) and data.get("id") is not None:
+            return (tuple(channels), event_name, str(data["id"]), socket_id)
+        return None
+
+    def start(self):
+        """
+        Bind the socket and start the flushing thread, returning without serving requests.
+
+        The socket's directory is created private to the publisher's user. An existing
+        path isn't removed, as this process didn't create it, so a socket left by a
+        publisher which crashed must be removed before starting another.
+        """
+        ensure_private_directory(self.socket_path)
+        if os.path.lexists(self.socket_path):
+            raise ImproperlyConfigured(
+                "{0} already exists, remove it if no publisher is running".format(self.socket_path)
+            )
+
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, PublisherRequestHandler)
+        self._socket_inode = os.stat(self.socket_path).st_ino
+        self._server.daemon_threads = True
+        self._server.publisher = self
+        self._running.set()
+        self._flusher = threading.Thread(target=self.flush_loop, daemon=True)
+        self._flusher.start()
+
+    def serve_forever(self):
+        if self._server is None:
+            self.start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self.stop()
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+    def stop(self):
+        """Flush the remaining packets and remove the socket bound by start()"""
+        self._running.clear()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self._server is not None:
+            self._server.server_close()
+        # Only remove the socket this server bound, not one since replaced by another publisher
+        try:
+            if self._socket_inode is not None and os.stat(self.socket_path).st_ino == self._socket_inode:
+                os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+        self._socket_inode = None
+
+    def flush_loop(self):
+        while self._running.is_set() or len(self.queue):
+            controller = get_overload_controller()
+            if controller is not None:
+                controller.record_backlog(len(self.queue))
+            packets = self.drain()
+            if packets:
+                self.publish(packets)
+
+    def drain(self):
+        """Collect up to batch_size (packet, lane) pairs, waiting at most flush_interval after the first"""
+        packets = self.queue.get_batch(self.batch_size, timeout=self.flush_interval)
+        if not packets:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(packets) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            more = self.queue.get_batch(self.batch_size - len(packets), timeout=remaining)
+            if not more:
+                break
+            packets.extend(more)
+        return packets
+
+    def publish(self, packets):
+        """Send (packet, lane) pairs through the provider, grouped by the socket id they exclude and their lane"""
+        groups, group_keys = {}, {}
+        for packet, lane in packets:
+            channels, event_name, data, socket_id = packet[:4]
+            groups.setdefault((socket_id, lane), []).append((channels, event_name, data))
+            group_keys.setdefault((socket_id, lane), []).append(packet[4] if len(packet) > 4 else None)
+
+        provider = self.provider_class()
+        provider.configure()
+        for (socket_id, lane), group in groups.items():
+            try:
+                # The lane is the packets' priority, so load shedding applies to the daemon's sends too
+                provider.priority = lane
+                provider.idempotency_keys = group_keys[socket_id, lane]
+                provider.trigger_batch(group, socket_id)
+                self.sent += len(group)
+            except Exception:
+                logger.exception("Failed to publish %d pusher packets", len(group))
@@ -0,0 +1,104 @@
+"""
+PusherQuerySet pushes bulk changes made through the queryset API, which bypass both views and model signals.
+"""
+from django.db import models
+
+from drf_model_pusher.backends import (
+    PUSH_CREATE,
+    PUSH_DELETE,
+    PUSH_UPDATE,
+    apply_related_hints,
+    get_chunk_size,
+    get_models_pusher_backends,
+    get_related_hints,
+    push_model_changes,
+)
+from drf_model_pusher.utils import chunked
+
+
+class PusherQuerySet(models.QuerySet):
+    """
+    A QuerySet which pushes the objects affected by bulk operations through the
+    pusher backends registered for its model, in chunks of `pusher_chunk_size`.
+
+    Use it as a manager with `objects = PusherQuerySet.as_manager()`.
+    """
+
+    pusher_chunk_size = None
+
+    # Extra fields loaded for bulk deletes, such as the fields get_pusher_channels uses
+    pusher_delete_fields = ()
+
+    def get_pusher_chunk_size(self):
+        return self.pusher_chunk_size or get_chunk_size()
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        self.push_bulk_changes(PUSH_CREATE, objs)
+        return objs
+
+    def has_pusher_backends(self):
+        return bool(get_models_pusher_backends(self.model))
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if not self.has_pusher_backends():
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        objs = list(objs)
+        result = super().bulk_update(objs, fields, *args, **kwargs)
+        self.push_bulk_changes(PUSH_UPDATE, objs)
+        return result
+
+    def update(self, **kwargs):
+        """Update the rows and then push them, re-fetching the updated rows one chunk at a time"""
+        if not self.has_pusher_backends():
+            return super().update(**kwargs)
+        pks = list(self.values_list("pk", flat=True))
+        rows = super().update(**kwargs)
+        self.push_bulk_changes(PUSH_UPDATE, self._iterate_pks(pks), reload=False)
+        return rows
+
+    def delete(self):
+        """Push the deletions, streaming the rows before they are deleted
+
+        Unless a backend serializes deletes, only the fields needed for the delete payloads are loaded."""
+        if not self.has_pusher_backends():
+            return super().delete()
+        chunk_size = self.get_pusher_chunk_size()
+        rows = self
+        fields = self.get_pusher_delete_fields()
+        if fields is not None:
+            rows = self.only(*fields)
+        self.push_bulk_changes(PUSH_DELETE, rows.iterator(chunk_size=chunk_size), pre_destroy=True)
+        return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def get_pusher_delete_fields(self):
+        """Return the fields every backend needs to push deletes, or None if any need the whole row"""
+        fields = ["pk"] + list(self.pusher_delete_fields)
+        for backend_class in get_models_pusher_backends(self.model):
+            backend_fields = backend_class.get_delete_fields()
+            if backend_fields is None:
+                return None
+            fields.extend(field for field in backend_fields if field not in fields)
+        return fields
+
+    def push_bulk_changes(self, event, instances, pre_destroy=False, reload=True):
+        """Push the instances through the pusher backends of this querysets model"""
+        push_model_changes(
+            self.model,
+            event,
+            instances,
+            pre_destroy=pre_destroy,
+            chunk_size=self.get_pusher_chunk_size(),
+            reload=reload,
+        )
+
+    def _iterate_pks(self, pks):
+        """Yield the instances for pks with the related objects the backends need, fetching one chunk at a time"""
+        select_related, prefetch_related = get_related_hints(get_models_pusher_backends(self.model), PUSH_UPDATE)
+        queryset = apply_related_hints(self.model._base_manager.using(self.db), select_related, prefetch_related)
+        for chunk in chunked(pks, self.get_pusher_chunk_size()):
+            # Evaluated per chunk rather than with .iterator() so prefetch_related is applied
+            yield from queryset.filter(pk__in=chunk)
@@ -1,5 +1,26 @@
 """The receiver methods attach to callbacks to signals"""
-from drf_model_pusher.providers import PusherProvider
+from django.conf import settings
+
+from drf_model_pusher.backends import PUSH_CREATE, PUSH_DELETE, PUSH_UPDATE, push_model_changes
+from drf_model_pusher.providers import PusherProvider, trigger_packets
+
+
+def get_provider_class(provider_class):
+    """
+    Return the provider class, or factory, to send with.
+
+    PusherProvider is routed through the local publisher when it's enabled, and every
+    provider is wrapped in a RecordingProvider when DRF_MODEL_PUSHER_RECORDING is set.
+    """
+    if provider_class is PusherProvider and getattr(settings, "DRF_MODEL_PUSHER_PUBLISHER_ENABLED", False):
+        from drf_model_pusher.publisher import SocketPublisherProvider
+
+        provider_class = SocketPublisherProvider
+    if getattr(settings, "DRF_MODEL_PUSHER_RECORDING", None) is not None:
+        from drf_model_pusher.recording import RecordingProvider
+
+        return RecordingProvider.factory(provider_class)
+    return provider_class
 
 
 def send_pusher_event(
@@ -16,7 +37,40 @@ def send_pusher_event(
     Sends an update using the provided provider class
     """
 
-    push_provider_class = kwargs.get("provider_class", PusherProvider)
+    push_provider_class = get_provider_class(kwargs.get("provider_class", PusherProvider))
     push_provider = push_provider_class()
+    push_provider.priority = kwargs.get("priority")
+    idempotency_key = kwargs.get("idempotency_key")
+    push_provider.idempotency_keys = None if idempotency_key is None else [idempotency_key]
     push_provider.configure()
     push_provider.trigger(channels, event_name, data, socket_id)
+
+
+def send_pusher_batch(signal, sender, instance, packets, socket_id=None, **kwargs):
+    """
+    Sends a batch of packets using the provided provider class
+    """
+
+    push_provider_class = get_provider_class(kwargs.get("provider_class", PusherProvider))
+    push_provider = push_provider_class()
+    push_provider.priority = kwargs.get("priority")
+    push_provider.idempotency_keys = kwargs.get("idempotency_keys")
+    push_provider.configure()
+    trigger_packets(push_provider, packets, socket_id)
+
+
+def push_model_post_save(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Pushes a create or update through the backends registered for the saved model
+    """
+    if raw:
+        return
+
+    push_model_changes(sender, PUSH_CREATE if created else PUSH_UPDATE, [instance])
+
+
+def push_model_post_delete(sender, instance, **kwargs):
+    """
+    Pushes a delete through the backends registered for the deleted model
+    """
+    push_model_changes(sender, PUSH_DELETE, [instance], pre_destroy=True)
@@ -0,0 +1,277 @@
+"""
+Records sampled push traffic to a log and replays it against a local stand-in, to load test releases with
+production's burstiness, fan-out and payload sizes.
+
+The log has a compact JSON line per trigger, `[time, kind, priority, packets]`, where kind is "t" for
+`trigger` and "b" for `trigger_batch`, and packets are `[channels, event_name, size, data]` with data
+None when redacted.
+"""
+import json
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+from drf_model_pusher.providers import PusherProvider, trigger_packets
+
+TRIGGER = "t"
+TRIGGER_BATCH = "b"
+
+# The size of a redacted payload before padding, {"redacted":""}
+REDACTED_SIZE = 15
+
+
+class TrafficRecorder(object):
+    """
+    Appends a sample of `sample_rate` of triggers to the log at `path`.
+
+    Payloads are redacted by default, replaced by their size, or by the result of
+    `redact` when it's a callable (or a dotted path to one) taking and returning the
+    data. Pass `redact=False` to record them as sent. The file is created readable by
+    its owner only. Each line is a single append, so every worker can record to the same file.
+    """
+
+    def __init__(self, path, sample_rate=1.0, redact=True):
+        if isinstance(redact, str):
+            redact = import_string(redact)
+        self.path = path
+        self.sample_rate = sample_rate
+        self.redact = redact
+        self._fd = None
+        self._fd_pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        """Return a recorder configured by DRF_MODEL_PUSHER_RECORDING, or None when recording is disabled"""
+        options = getattr(settings, "DRF_MODEL_PUSHER_RECORDING", None)
+        if options is None:
+            return None
+        return cls(**options)
+
+    def get_fd(self):
+        if self._fd_pid != os.getpid():
+            with self._lock:
+                if self._fd_pid != os.getpid():
+                    self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                    self._fd_pid = os.getpid()
+        return self._fd
+
+    def encode_packet(self, channels, event_name, data):
+        encoded = json.dumps(data, cls=JSONEncoder, separators=(",", ":"))
+        if callable(self.redact):
+            data = self.redact(data)
+        elif self.redact:
+            data = None
+        return [list(channels), event_name, len(encoded), data]
+
+    def record(self, kind, packets, priority=None):
+        """Append a trigger of (channels, event_name, data) packets, if it's sampled"""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        line = json.dumps(
+            [time.time(), kind, priority, [self.encode_packet(*packet) for packet in packets]],
+            cls=JSONEncoder,
+            separators=(",", ":"),
+        )
+        os.write(self.get_fd(), (line + "\n").encode("utf-8"))
+
+
+_recorder = None
+_recorder_loaded = False
+
+
+def get_recorder():
+    """Return the process wide TrafficRecorder configured in settings, if any"""
+    global _recorder, _recorder_loaded
+    if not _recorder_loaded:
+        _recorder = TrafficRecorder.from_settings()
+        _recorder_loaded = True
+    return _recorder
+
+
+@receiver(setting_changed)
+def reset_recorder(setting, **kwargs):
+    global _recorder_loaded
+    if setting.startswith("DRF_MODEL_PUSHER_RECORDING"):
+        _recorder_loaded = False
+
+
+class RecordingProvider(object):
+    """
+    Wraps a provider, recording the packets it's asked to send when DRF_MODEL_PUSHER_RECORDING is set.
+
+    Other attributes, such as `priority` and `idempotency_keys`, are the wrapped provider's.
+    """
+
+    def __init__(self, provider):
+        object.__setattr__(self, "provider", provider)
+
+    @classmethod
+    def factory(cls, provider_class):
+        """Return a callable creating wrapped providers of provider_class"""
+
+        def create(*args, **kwargs):
+            return cls(provider_class(*args, **kwargs))
+
+        return create
+
+    def __getattr__(self, name):
+        return getattr(self.provider, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.provider, name, value)
+
+    def record(self, kind, packets):
+        recorder = get_recorder()
+        if recorder is not None and not getattr(self.provider, "_disabled", False):
+            recorder.record(kind, packets, getattr(self.provider, "priority", None))
+
+    def trigger(self, channels, event_name, data, socket_id=None):
+        self.record(TRIGGER, [(channels, event_name, data)])
+        self.provider.trigger(channels, event_name, data, socket_id)
+
+    def trigger_batch(self, packets, socket_id=None):
+        packets = list(packets)
+        self.record(TRIGGER_BATCH, packets)
+        trigger_packets(self.provider, packets, socket_id)
+
+
+def read_recording(path):
+    """Return the recorded triggers of a log in time order, as (time, kind, priority, packets)"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                records.append(tuple(json.loads(line)))
+    records.sort(key=lambda record: record[0])
+    return records
+
+
+def restore_packet(channels, event_name, size, data):
+    """Return a packet from a recorded one, padding redacted payloads to their recorded size"""
+    if data is None:
+        data = {"redacted": "x" * max(0, size - REDACTED_SIZE)}
+    return channels, event_name, data
+
+
+class StandInPusher(object):
+    """
+    A local stand-in for the Pusher client, taking `latency` seconds per request.
+
+    `occupied_channels` are reported as occupied, so the occupied channels optimisation
+    doesn't drop the replayed events.
+    """
+
+    def __init__(self, latency=0.0, occupied_channels=()):
+        self.latency = latency
+        self.occupied_channels = set(occupied_channels)
+        self.requests = 0
+        self.events = 0
+        self._lock = threading.Lock()
+
+    def _request(self, events):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            self.events += events
+
+    def trigger(self, channels, event_name, data, socket_id=None):
+        self._request(len(channels))
+
+    def trigger_batch(self, batch=None, already_encoded=False):
+        self._request(len(batch))
+
+    def channels_info(self, prefix_filter=None, attributes=None):
+        return {"channels": {channel: {} for channel in self.occupied_channels}}
+
+
+class StandInPusherProvider(PusherProvider):
+    """Sends through the push pipeline to a StandInPusher"""
+
+    def __init__(self, app=None, stand_in=None):
+        super().__init__(app=app)
+        self.stand_in = stand_in if stand_in is not None else StandInPusher()
+
+    def configure(self):
+        self._pusher = self.stand_in
+
+
+def get_recorded_channels(records):
+    """Return every channel in recorded triggers"""
+    return {channel for record in records for packet in record[3] for channel in packet[0]}
+
+
+def get_percentile(values, percentile):
+    """Return the nearest rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    return values[max(0, int(math.ceil(percentile / 100.0 * len(values))) - 1)]
+
+
+def replay_recording(records, provider_factory, speed=1.0, workers=1):
+    """
+    Send recorded triggers through providers made by `provider_factory`, returning throughput and latency statistics.
+
+    Triggers are sent at their recorded times divided by `speed`, or as fast as
+    possible when `speed` is 0, by `workers` threads with a provider each. Latency
+    is measured from when a trigger was due, so it includes time spent waiting for a
+    free worker.
+
+    `packets` and `throughput` count the packets handed to providers, which may drop
+    some, e.g. for unoccupied channels or when throttled.
+    """
+    latencies = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def send(due, kind, priority, packets):
+        provider = getattr(local, "provider", None)
+        if provider is None:
+            provider = local.provider = provider_factory()
+            provider.configure()
+        provider.priority = priority
+        packets = [restore_packet(*packet) for packet in packets]
+        if kind == TRIGGER_BATCH:
+            provider.trigger_batch(packets)
+        else:
+            provider.trigger(*packets[0])
+        latency = time.monotonic() - due
+        with lock:
+            latencies.append(latency)
+
+    started = time.monotonic()
+    first = records[0][0] if records else 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for recorded, kind, priority, packets in records:
+            due = started + (recorded - first) / speed if speed else time.monotonic()
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(send, due, kind, priority, packets))
+        for future in futures:
+            future.result()
+    duration = time.monotonic() - started
+
+    latencies.sort()
+    packets = sum(len(record[3]) for record in records)
+    return {
+        "triggers": len(records),
+        "packets": packets,
+        "duration": duration,
+        "throughput": packets / duration if duration else 0.0,
+        "p50": get_percentile(latencies, 50),
+        "p90": get_percentile(latencies, 90),
+        "p99": get_percentile(latencies, 99),
+        "max": latencies[-1] if latencies else 0.0,
+    }
@@ -1,6 +1,7 @@
-from django.core.cache import cache
 from rest_framework import serializers
 
+from drf_model_pusher.occupancy import set_channels_occupancy
+
 
 class PusherWebhookSerializer(serializers.Serializer):
     """
@@ -33,15 +34,14 @@ class ChannelExistenceSerializer(PusherWebhookSerializer):
     events = ChannelExistenceEventSerializer(many=True)
 
     def create(self, validated_data):
+        app = self.context.get("pusher_app")
         for event in validated_data.get("events", []):
-            cache_key = "drf-model-pusher:occupied:{}".format(event["channel"])
-
             # Channel is occupied, set it to True
             if event["name"] == "channel_occupied":
-                cache.set(cache_key, True)
+                set_channels_occupancy([event["channel"]], True, app=app)
 
             # Channel has been vacated, set it to False
             if event["name"] == "channel_vacated":
-                cache.set(cache_key, False)
+                set_channels_occupancy([event["channel"]], False, app=app)
 
         return validated_data
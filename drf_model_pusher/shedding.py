@@ -0,0 +1,247 @@
+"""
+Sheds low value events when Pusher is slow or the dispatch backlog grows,
+trading realtime freshness for API availability.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from drf_model_pusher.lanes import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+SHED = "shed"
+COALESCED = "coalesced"
+
+MAX_LATENCY_SAMPLES = 1000
+
+# The fraction of events kept at each shedding level, by priority. High priority events are never shed.
+DEFAULT_SAMPLE_RATES = {
+    1: {PRIORITY_LOW: 0.5},
+    2: {PRIORITY_LOW: 0.1, PRIORITY_NORMAL: 0.5},
+    3: {PRIORITY_LOW: 0.0, PRIORITY_NORMAL: 0.1},
+}
+
+
+class OverloadController(object):
+    """
+    Tracks recent publish latency and backlog, and sheds events past their thresholds.
+
+    Each of the `latency` (seconds, averaged over `window` seconds) and `backlog`
+    (queued or in flight events) thresholds raises the shedding level by one. At a
+    level, events are kept at the sample rate of their priority. From
+    `coalesce_level`, update events are held and a single thread sends the latest
+    per channel, event and object every `coalesce_window` seconds. The level rises as soon as a
+    threshold is crossed, and falls one level at a time once it has been below its
+    thresholds for `recovery_time` seconds.
+    """
+
+    def __init__(
+        self,
+        latency=(0.5, 1.0, 2.0),
+        backlog=(1000, 5000, 9000),
+        sample_rates=None,
+        coalesce_level=2,
+        coalesce_window=1.0,
+        coalesce_events=("update",),
+        recovery_time=5.0,
+        window=10.0,
+    ):
+        self.latency_thresholds = tuple(latency)
+        self.backlog_thresholds = tuple(backlog)
+        self.sample_rates = DEFAULT_SAMPLE_RATES if sample_rates is None else sample_rates
+        self.coalesce_level = coalesce_level
+        self.coalesce_window = coalesce_window
+        self.coalesce_suffixes = tuple(".{0}".format(event) for event in coalesce_events)
+        self.recovery_time = recovery_time
+        self.window = window
+        self.level = 0
+        self.backlog = 0
+        self.metrics = Counter()
+        self._latencies = deque()
+        self._latency_sum = 0.0
+        self._in_flight = 0
+        self._recovering_since = None
+        self._pending = {}
+        self._flusher = None
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        """Return a controller configured by DRF_MODEL_PUSHER_SHEDDING, or None when shedding is disabled"""
+        options = getattr(settings, "DRF_MODEL_PUSHER_SHEDDING", None)
+        if options is None:
+            return None
+        return cls(**options)
+
+    def get_latency(self, now=None):
+        """Return the mean publish latency over the window"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            while self._latencies and self._latencies[0][0] < now - self.window:
+                self._latency_sum -= self._latencies.popleft()[1]
+            if not self._latencies:
+                self._latency_sum = 0.0
+                return 0.0
+            return self._latency_sum / len(self._latencies)
+
+    def get_backlog(self):
+        return self.backlog + self._in_flight
+
+    def record_latency(self, seconds):
+        with self._lock:
+            if len(self._latencies) == MAX_LATENCY_SAMPLES:
+                self._latency_sum -= self._latencies.popleft()[1]
+            self._latencies.append((time.monotonic(), seconds))
+            self._latency_sum += seconds
+        self.update()
+
+    def record_backlog(self, backlog):
+        """Record the number of events waiting to be published, e.g. the length of a queue"""
+        self.backlog = backlog
+        self.update()
+
+    @contextmanager
+    def measure(self, events=1):
+        """Time a publish of `events`, counting them as backlog while in flight"""
+        with self._lock:
+            self._in_flight += events
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= events
+            self.record_latency(time.monotonic() - started)
+
+    def get_target_level(self, now=None):
+        latency = self.get_latency(now)
+        backlog = self.get_backlog()
+        return max(
+            sum(1 for threshold in self.latency_thresholds if latency >= threshold),
+            sum(1 for threshold in self.backlog_thresholds if backlog >= threshold),
+        )
+
+    def update(self):
+        """Move the shedding level towards the level of the current latency and backlog, returning it"""
+        now = time.monotonic()
+        target = self.get_target_level(now)
+        with self._lock:
+            previous = level = self.level
+            if target >= level:
+                self._recovering_since = None
+                level = target
+            elif self._recovering_since is None:
+                self._recovering_since = now
+            elif now - self._recovering_since >= self.recovery_time:
+                self._recovering_since = now
+                level -= 1
+            self.level = level
+
+        if level != previous:
+            logger.warning("Pusher shedding level changed from %d to %d", previous, level)
+        return level
+
+    def snapshot(self):
+        """Return the current shedding level and the measurements it's based on"""
+        return {
+            "level": self.level,
+            "latency": self.get_latency(),
+            "backlog": self.get_backlog(),
+            SHED: self.metrics[SHED],
+            COALESCED: self.metrics[COALESCED],
+        }
+
+    def get_sample_rate(self, level, priority):
+        if priority == PRIORITY_HIGH:
+            return 1.0
+        return self.sample_rates.get(level, {}).get(priority or PRIORITY_NORMAL, 1.0)
+
+    def filter_channels(self, channels, event_name, data, socket_id, priority, send):
+        """
+        Return the channels an event can be sent to now. Shed events are dropped and
+        coalesced events are later sent with `send`.
+        """
+        level = self.update()
+        if not level:
+            return channels
+
+        rate = self.get_sample_rate(level, priority)
+        if rate < 1.0 and random.random() >= rate:
+            self.metrics[SHED] += len(channels)
+            return []
+
+        if level >= self.coalesce_level and event_name.endswith(self.coalesce_suffixes):
+            object_id = data.get("id") if isinstance(data, dict) else None
+            for channel in channels:
+                self._coalesce((channel, event_name, object_id), data, socket_id, send)
+            return []
+
+        return channels
+
+    def _coalesce(self, key, data, socket_id, send):
+        self.metrics[COALESCED] += 1
+        with self._lock:
+            self._pending[key] = (data, socket_id, send)
+            if self._flusher is None or self._flusher_pid != os.getpid():
+                self._flusher = threading.Thread(
+                    target=self._run_flusher, name="drf-model-pusher-coalesce", daemon=True
+                )
+                self._flusher_pid = os.getpid()
+                self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.coalesce_window)
+            with self._lock:
+                if not self._pending:
+                    # Stopping under the lock, so the next coalesced event starts a new flusher
+                    self._flusher = None
+                    return
+            self.flush_coalesced()
+
+    def flush_coalesced(self):
+        """Send the latest of each coalesced event, returning the number sent"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for (channel, event_name, object_id), (data, socket_id, send) in pending.items():
+            try:
+                send([channel], event_name, data, socket_id)
+            except Exception:
+                logger.exception("Failed to send coalesced pusher event %s", event_name)
+        return len(pending)
+
+
+_controller = None
+_controller_loaded = False
+
+
+def get_overload_controller():
+    """Return the process wide OverloadController configured in settings, if any"""
+    global _controller, _controller_loaded
+    if not _controller_loaded:
+        _controller = OverloadController.from_settings()
+        _controller_loaded = True
+    return _controller
+
+
+def get_shedding_level():
+    """Return the current shedding level, 0 when nothing is being shed"""
+    controller = get_overload_controller()
+    return controller.level if controller is not None else 0
+
+
+@receiver(setting_changed)
+def reset_overload_controller(setting, **kwargs):
+    global _controller_loaded
+    if setting.startswith("DRF_MODEL_PUSHER_SHEDDING"):
+        _controller_loaded = False
@@ -1,10 +1,77 @@
+import weakref
+
 from django.dispatch import Signal
 
 
-view_post_save = Signal(
-    providing_args=["instance", "channels", "event_name", "data", "socket_id"]
+def get_lookup_key(target):
+    """Identify a receiver or sender as Django's signals do, bound methods by their instance and function"""
+    if hasattr(target, "__func__"):
+        return id(target.__self__), id(target.__func__)
+    return id(target)
+
+
+class PusherSignal(Signal):
+    """
+    A signal tracking whether receivers other than its `default_receiver` are connected,
+    so backends can skip sending it while nobody else listens, see `drf_model_pusher.dispatch`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_receiver = None
+        self.default_connected = False
+        # Lookup key -> reference to each other connected receiver
+        self._observers = {}
+
+    def get_observer_key(self, receiver, sender=None, dispatch_uid=None):
+        if dispatch_uid:
+            return dispatch_uid, get_lookup_key(sender)
+        return get_lookup_key(receiver), get_lookup_key(sender)
+
+    def is_default(self, key):
+        return self.default_receiver is not None and key == self.get_observer_key(self.default_receiver)
+
+    def connect(self, receiver, sender=None, weak=True, dispatch_uid=None):
+        super().connect(receiver, sender=sender, weak=weak, dispatch_uid=dispatch_uid)
+        key = self.get_observer_key(receiver, sender, dispatch_uid)
+        with self.lock:
+            if self.is_default(key):
+                self.default_connected = True
+            elif not weak:
+                self._observers[key] = lambda: receiver
+            elif hasattr(receiver, "__func__"):
+                self._observers[key] = weakref.WeakMethod(receiver)
+            else:
+                self._observers[key] = weakref.ref(receiver)
+
+    def disconnect(self, receiver=None, sender=None, dispatch_uid=None):
+        disconnected = super().disconnect(receiver, sender=sender, dispatch_uid=dispatch_uid)
+        key = self.get_observer_key(receiver, sender, dispatch_uid)
+        with self.lock:
+            if self.is_default(key):
+                self.default_connected = False
+            else:
+                self._observers.pop(key, None)
+        return disconnected
+
+    def has_observers(self):
+        """Return whether receivers other than the default receiver are connected"""
+        with self.lock:
+            for key, reference in list(self._observers.items()):
+                if reference() is None:
+                    # Weakly referenced receivers are disconnected when they're garbage collected
+                    del self._observers[key]
+            return bool(self._observers)
+
+
+view_post_save = PusherSignal(
+    providing_args=["instance", "channels", "event_name", "data", "socket_id", "priority"]
+)
+
+view_pre_destroy = PusherSignal(
+    providing_args=["instance", "channels", "event_name", "data", "socket_id", "priority"]
 )
 
-view_pre_destroy = Signal(
-    providing_args=["instance", "channels", "event_name", "data", "socket_id"]
+view_batch = PusherSignal(
+    providing_args=["instance", "packets", "socket_id", "pre_destroy", "priority"]
 )
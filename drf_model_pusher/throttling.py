@@ -0,0 +1,285 @@
+"""
+Token bucket throttling for events sent to channels, so a noisy object can't flood a channel.
+"""
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from fnmatch import fnmatchcase
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from drf_model_pusher.exceptions import ModelPusherException
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_DROP = "drop"
+THROTTLE_DELAY = "delay"
+THROTTLE_COALESCE = "coalesce"
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """Return the (tokens per second, capacity) for a rate such as "10/s" or "100/m" """
+    num, period = rate.split("/")
+    num = int(num)
+    duration = PERIODS[period[0]]
+    return num / duration, num
+
+
+class TokenBucket(object):
+    """An in-process token bucket refilled at `rate` tokens per second up to `capacity`"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def consume(self, now):
+        """Take a token, returning 0 when one was available or the seconds until one will be"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class LocalBucketStore(object):
+    """
+    Keeps the token buckets of the `maxsize` most recently used keys in process memory.
+
+    An evicted bucket starts full again when its key is next used, so `maxsize`
+    should exceed the number of channels busy at once.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, capacity):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, capacity)
+                if len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.consume(time.monotonic())
+
+
+class CacheBucketStore(object):
+    """
+    Shares buckets between workers through the Django cache.
+
+    Buckets are approximated with atomic counters over fixed windows of
+    `capacity / rate` seconds, each window allowing `capacity` events.
+    """
+
+    key_prefix = "drf-model-pusher:throttle"
+
+    def consume(self, key, rate, capacity):
+        now = time.time()
+        duration = capacity / rate
+        window = int(now // duration)
+        cache_key = "{0}:{1}:{2}".format(self.key_prefix, key, window)
+
+        cache.add(cache_key, 0, timeout=int(duration) + 1)
+        try:
+            count = cache.incr(cache_key)
+        except ValueError:
+            # The key expired between add and incr
+            cache.add(cache_key, 1, timeout=int(duration) + 1)
+            count = 1
+
+        if count <= capacity:
+            return 0.0
+        return (window + 1) * duration - now
+
+
+class ChannelThrottle(object):
+    """
+    Applies token buckets per channel and per (channel, event name) to outgoing events.
+
+    Rates are configured with fnmatch patterns, the first matching pattern applies.
+    Events over the rate are dropped, delayed for up to `max_delay` seconds, or
+    coalesced so only the latest event per channel and event name is sent once the
+    bucket refills. Delayed and coalesced events are sent by a single background
+    thread, never blocking the caller. In process buckets and memoized pattern
+    matches are kept for the `max_keys` most recently used names.
+    """
+
+    def __init__(
+        self,
+        channel_rates=None,
+        event_rates=None,
+        action=THROTTLE_DROP,
+        shared=False,
+        max_delay=1.0,
+        max_keys=10000,
+    ):
+        if action not in (THROTTLE_DROP, THROTTLE_DELAY, THROTTLE_COALESCE):
+            raise ModelPusherException("Unknown throttle action {0}".format(action))
+
+        self.channel_rates = [(pattern, parse_rate(rate)) for pattern, rate in (channel_rates or {}).items()]
+        self.event_rates = [(pattern, parse_rate(rate)) for pattern, rate in (event_rates or {}).items()]
+        self.action = action
+        self.max_delay = max_delay
+        self.max_keys = max_keys
+        self.store = CacheBucketStore() if shared else LocalBucketStore(max_keys)
+        self.metrics = Counter()
+        self._rates = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        # (due, sequence, function, args) heap run by the scheduler thread
+        self._scheduled = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._scheduler = None
+        self._scheduler_pid = None
+
+    @classmethod
+    def from_settings(cls):
+        """Return a throttle configured from settings, or None when no rates are configured"""
+        rates = getattr(settings, "DRF_MODEL_PUSHER_THROTTLE_RATES", None)
+        if not rates:
+            return None
+        return cls(
+            channel_rates=rates.get("channels"),
+            event_rates=rates.get("events"),
+            action=getattr(settings, "DRF_MODEL_PUSHER_THROTTLE_ACTION", THROTTLE_DROP),
+            shared=getattr(settings, "DRF_MODEL_PUSHER_THROTTLE_SHARED", False),
+            max_delay=getattr(settings, "DRF_MODEL_PUSHER_THROTTLE_MAX_DELAY", 1.0),
+            max_keys=getattr(settings, "DRF_MODEL_PUSHER_THROTTLE_MAX_KEYS", 10000),
+        )
+
+    def get_rate(self, rates, name):
+        """Return the (rate, capacity) of the first pattern matching name, memoized per name"""
+        key = (id(rates), name)
+        with self._lock:
+            try:
+                self._rates.move_to_end(key)
+                return self._rates[key]
+            except KeyError:
+                pass
+        rate = next((rate for pattern, rate in rates if fnmatchcase(name, pattern)), None)
+        with self._lock:
+            self._rates[key] = rate
+            if len(self._rates) > self.max_keys:
+                self._rates.popitem(last=False)
+        return rate
+
+    def consume(self, channel, event_name):
+        """Take a token from the channel and event buckets, returning the seconds to wait if throttled"""
+        wait = 0.0
+        channel_rate = self.get_rate(self.channel_rates, channel)
+        if channel_rate is not None:
+            wait = self.store.consume("channel:{0}".format(channel), *channel_rate)
+
+        event_rate = self.get_rate(self.event_rates, event_name)
+        if not wait and event_rate is not None:
+            wait = self.store.consume("event:{0}:{1}".format(channel, event_name), *event_rate)
+
+        return wait
+
+    def filter_channels(self, channels, event_name, data, socket_id, send):
+        """
+        Return the channels which can be sent to now. Throttled channels are handled
+        according to the action, coalesced events are later sent with `send`.
+        """
+        allowed, delayed = [], []
+        delay = 0.0
+        for channel in channels:
+            with self._lock:
+                pending = self._pending.get((channel, event_name))
+                if pending is not None:
+                    # A coalesced event is already waiting, replace its payload
+                    pending[0], pending[1] = data, socket_id
+                    self.metrics[THROTTLE_COALESCE] += 1
+                    continue
+
+            wait = self.consume(channel, event_name)
+            if not wait:
+                allowed.append(channel)
+            elif self.action == THROTTLE_DELAY and wait <= self.max_delay:
+                delay = max(delay, wait)
+                delayed.append(channel)
+                self.metrics[THROTTLE_DELAY] += 1
+            elif self.action == THROTTLE_COALESCE:
+                with self._lock:
+                    self._pending[(channel, event_name)] = [data, socket_id]
+                self.call_later(wait, self._flush, channel, event_name, send)
+                self.metrics[THROTTLE_COALESCE] += 1
+            else:
+                self.metrics[THROTTLE_DROP] += 1
+
+        if delayed:
+            self.call_later(delay, send, delayed, event_name, data, socket_id)
+
+        return allowed
+
+    def call_later(self, wait, function, *args):
+        """Call function with args after `wait` seconds on the scheduler thread, started on first use"""
+        with self._condition:
+            heapq.heappush(self._scheduled, (time.monotonic() + wait, next(self._sequence), function, args))
+            if self._scheduler_pid != os.getpid() or not self._scheduler.is_alive():
+                self._scheduler = threading.Thread(
+                    target=self.run_scheduler, name="drf-model-pusher-throttle", daemon=True
+                )
+                self._scheduler_pid = os.getpid()
+                self._scheduler.start()
+            self._condition.notify()
+
+    def run_scheduler(self):
+        while True:
+            with self._condition:
+                while not self._scheduled or self._scheduled[0][0] > time.monotonic():
+                    self._condition.wait(self._scheduled[0][0] - time.monotonic() if self._scheduled else None)
+                due, sequence, function, args = heapq.heappop(self._scheduled)
+            try:
+                function(*args)
+            except Exception:
+                logger.exception("Failed to send throttled pusher event")
+
+    def _flush(self, channel, event_name, send):
+        """Send the latest coalesced event for the channel once its bucket has refilled"""
+        wait = self.consume(channel, event_name)
+        if wait:
+            self.call_later(wait, self._flush, channel, event_name, send)
+            return
+
+        with self._lock:
+            data, socket_id = self._pending.pop((channel, event_name))
+        send([channel], event_name, data, socket_id)
+
+
+_throttle = None
+_throttle_loaded = False
+
+
+def get_throttle():
+    """Return the process wide ChannelThrottle configured in settings, if any"""
+    global _throttle, _throttle_loaded
+    if not _throttle_loaded:
+        _throttle = ChannelThrottle.from_settings()
+        _throttle_loaded = True
+    return _throttle
+
+
+@receiver(setting_changed)
+def reset_throttle(setting, **kwargs):
+    global _throttle_loaded
+    if setting.startswith("DRF_MODEL_PUSHER_THROTTLE"):
+        _throttle_loaded = False
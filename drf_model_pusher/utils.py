@@ -0,0 +1,22 @@
+"""Helper functions shared by drf_model_pusher modules"""
+import hashlib
+import json
+from itertools import islice
+
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def chunked(iterable, size):
+    """Yield lists of at most `size` items from an iterable without materialising it"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def payload_hash(data):
+    """Return a digest of JSON serializable data, equal for equal payloads regardless of key order"""
+    encoded = json.dumps(data, cls=JSONEncoder, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
@@ -1,10 +1,54 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.http import HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied, ValidationError
 from rest_framework.generics import CreateAPIView
+from rest_framework.parsers import FormParser, JSONParser
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
 
 from drf_model_pusher.authentication import PusherWebhookAuthentication
-from drf_model_pusher.backends import get_models_pusher_backends
+from drf_model_pusher.backends import (
+    PUSH_CREATE,
+    PUSH_DELETE,
+    PUSH_UPDATE,
+    get_chunk_size,
+    get_models_pusher_backends,
+    get_related_hints,
+    pusher_backend_registry,
+    reload_instances,
+)
+from drf_model_pusher.channel_auth import (
+    BATCHED_CHANNEL_NAME_RE,
+    CHANNEL_NAME_RE,
+    SOCKET_ID_RE,
+    check_channel_permissions,
+    get_auth_max_channels,
+    get_channel_auth,
+    get_presence_channel_data,
+)
+from drf_model_pusher.channel_cache import ChannelResolutionCache, accepts_instance
+from drf_model_pusher.event_log import ChannelEventLog
 from drf_model_pusher.exceptions import ModelPusherException
 from drf_model_pusher.serializers import ChannelExistenceSerializer
 from drf_model_pusher.signals import view_post_save
+from drf_model_pusher.utils import chunked, payload_hash
+from drf_model_pusher.webhooks import get_webhook_ingestor, parse_webhook, verify_webhook_signature
+
+# Dispatch table of (view class, model) -> (registry version, pusher backend classes)
+_view_backends_table = {}
+
+
+def clear_view_backends_table():
+    """Empty the per-view dispatch table, useful after registering backends at runtime"""
+    _view_backends_table.clear()
 
 
 class ModelPusherViewMixin(object):
@@ -12,9 +56,13 @@ class ModelPusherViewMixin(object):
 
     pusher_backends = []
 
-    PUSH_CREATE = "create"
-    PUSH_UPDATE = "update"
-    PUSH_DELETE = "delete"
+    # Seconds to cache channels across requests, only used when get_pusher_channels accepts
+    # an `instance` and the channels depend on the instance alone
+    pusher_channels_cache_timeout = None
+
+    PUSH_CREATE = PUSH_CREATE
+    PUSH_UPDATE = PUSH_UPDATE
+    PUSH_DELETE = PUSH_DELETE
 
     def __init__(
         self, push_creations=True, push_updates=True, push_deletions=True, **kwargs
@@ -25,16 +73,34 @@ class ModelPusherViewMixin(object):
         super().__init__(**kwargs)
         self.pusher_backends = self.get_models_pusher_backends()
 
+    def get_pusher_model(self):
+        """Return the model for this view without evaluating or building a queryset where possible"""
+        queryset = getattr(self, "queryset", None)
+        if queryset is not None:
+            return queryset.model
+
+        serializer_class = getattr(self, "serializer_class", None)
+        serializer_meta = getattr(serializer_class, "Meta", None)
+        if getattr(serializer_meta, "model", None) is not None:
+            return serializer_meta.model
+
+        if hasattr(self, "get_queryset"):
+            return self.get_queryset().model
+
+        raise ModelPusherException(
+            "View must have a queryset attribute, serializer_class with a Meta.model "
+            "or get_queryset method defined"
+        )
+
     def get_models_pusher_backends(self):
-        if hasattr(self, "queryset"):
-            model = self.queryset.model
-        elif hasattr(self, "get_queryset"):
-            model = self.get_queryset().model
-        else:
-            raise ModelPusherException(
-                "View must have a queryset attribute or get_queryset method defined"
-            )
-        return get_models_pusher_backends(model)
+        """Return the pusher backend classes for this view, resolved once per view class and model"""
+        model = self.get_pusher_model()
+        key = (self.__class__, model)
+        version, backends = _view_backends_table.get(key, (None, None))
+        if version != pusher_backend_registry.version:
+            backends = tuple(get_models_pusher_backends(model))
+            _view_backends_table[key] = (pusher_backend_registry.version, backends)
+        return backends
 
     def get_pusher_channels(self):
         """Return the channel from the view"""
@@ -44,14 +110,83 @@ class ModelPusherViewMixin(object):
             )
         )
 
+    def get_pusher_channel_cache(self):
+        """Return the cache memoizing channel resolution for this request"""
+        channel_cache = getattr(self, "_pusher_channel_cache", None)
+        if channel_cache is None:
+            channel_cache = ChannelResolutionCache(timeout=self.pusher_channels_cache_timeout)
+            self._pusher_channel_cache = channel_cache
+        return channel_cache
+
+    def resolve_pusher_channels(self, instance=None):
+        """Return the channels from get_pusher_channels, resolved once per request
+
+        When get_pusher_channels accepts an `instance` argument the channels are resolved
+        once per instance, and can be cached across requests with pusher_channels_cache_timeout."""
+        channel_cache = self.get_pusher_channel_cache()
+        resolver_name = "{0}.{1}".format(self.__class__.__module__, self.__class__.__qualname__)
+        if accepts_instance(self.get_pusher_channels):
+            return channel_cache.resolve(
+                resolver_name, instance, lambda: self.get_pusher_channels(instance=instance)
+            )
+        return channel_cache.resolve(resolver_name, None, self.get_pusher_channels)
+
     def get_pusher_backends(self):
-        """Return all the pusher backends registered for this views model"""
-        return [pusher_backend(view=self) for pusher_backend in self.pusher_backends]
+        """Return all the pusher backends registered for this views model
+
+        Backends are instantiated once and reused for the lifetime of the view, which is a single request."""
+        backends = getattr(self, "_pusher_backend_instances", None)
+        if backends is None:
+            backends = [pusher_backend(view=self) for pusher_backend in self.pusher_backends]
+            self._pusher_backend_instances = backends
+        return backends
 
     def push_changes(self, event=PUSH_UPDATE, instance=None, pre_destroy=False):
-        """Triggers the push_change method for all the pusher backends registered on this views model"""
+        """Push the changes for all the pusher backends registered on this views model
+
+        Backends sending the same event name and payload are merged into a single trigger,
+        then the channels are split into chunks of DRF_MODEL_PUSHER_MAX_CHANNELS."""
+        max_channels = getattr(settings, "DRF_MODEL_PUSHER_MAX_CHANNELS", 100)
+        instance = self.get_pusher_instance(event, instance)
+        for pusher_backend, (channels, event_name, data) in self.plan_pusher_packets(event, instance):
+            for channels_chunk in chunked(channels, max_channels):
+                pusher_backend.push_packet(
+                    event, (channels_chunk, event_name, data), pre_destroy=pre_destroy, instance=instance
+                )
+
+    def get_pusher_instance(self, event, instance):
+        """Reload the instance once with the related objects the backends declare, before serializing"""
+        if instance is None:
+            return instance
+        select_related, prefetch_related = get_related_hints(self.pusher_backends, event)
+        return reload_instances(instance.__class__, [instance], select_related, prefetch_related)[0]
+
+    def plan_pusher_packets(self, event, instance=None):
+        """Return a list of (backend, packet) with the channels of identical packets merged
+
+        A merged packet is pushed by the first backend which planned it, so signal receivers
+        see that backend as the sender, and its idempotency key is used for every channel."""
+        plan = OrderedDict()
+        seen = {}
         for pusher_backend in self.get_pusher_backends():
-            pusher_backend.push_change(event, instance, pre_destroy=pre_destroy)
+            for channels, event_name, data in pusher_backend.get_packets(event, instance):
+                key = (
+                    event_name,
+                    payload_hash(data),
+                    pusher_backend.provider_class,
+                    pusher_backend.pusher_socket_id,
+                    pusher_backend.get_event_priority(event),
+                )
+                if key not in plan:
+                    plan[key] = (pusher_backend, ([], event_name, data))
+                    seen[key] = set()
+
+                merged_channels, merged_seen = plan[key][1][0], seen[key]
+                for channel in channels:
+                    if channel not in merged_seen:
+                        merged_seen.add(channel)
+                        merged_channels.append(channel)
+        return list(plan.values())
 
     def perform_update(self, serializer):
         """Update the object and then send the pusher event"""
@@ -87,5 +222,242 @@ class ModelPusherViewMixin(object):
 
 
 class ChannelExistenceWebhook(CreateAPIView):
+    """Receives channel existence webhooks, set `pusher_app` for apps configured in DRF_MODEL_PUSHER_APPS"""
+
     authentication_classes = [PusherWebhookAuthentication]
     serializer_class = ChannelExistenceSerializer
+    pusher_app = None
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["pusher_app"] = self.pusher_app
+        return context
+
+
+class DeferredPusherWebhook(APIView):
+    """
+    Receives channel existence, subscription count and presence webhooks, acknowledging them
+    before they're applied.
+
+    The signature is checked against the raw body and the events are queued for the
+    webhook ingestor, which applies them in merged batches. Set `pusher_app` for apps
+    configured in DRF_MODEL_PUSHER_APPS.
+    """
+
+    authentication_classes = []
+    permission_classes = []
+    pusher_app = None
+
+    def post(self, request, *args, **kwargs):
+        body = request.body
+        if not verify_webhook_signature(
+            body, request.META.get("HTTP_X_PUSHER_KEY"), request.META.get("HTTP_X_PUSHER_SIGNATURE"), self.pusher_app
+        ):
+            raise AuthenticationFailed("Invalid webhook signature.")
+
+        try:
+            time_ms, events = parse_webhook(body)
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+        if events:
+            get_webhook_ingestor().submit(self.pusher_app, time_ms, events)
+        return Response()
+
+
+class ChannelEventLogView(APIView):
+    """
+    Returns the events sent to a channel after a sequence number, e.g. `?channel=my-channel&since=10`.
+
+    The response includes `resync: true` when the events are no longer available
+    and the client must refetch its state. Private and presence channels are denied
+    unless `has_channel_permission` is overridden.
+    """
+
+    event_log_class = ChannelEventLog
+
+    def has_channel_permission(self, request, channel):
+        """Return whether the request may read the channels events"""
+        return not channel.startswith(("private-", "presence-"))
+
+    def get(self, request, *args, **kwargs):
+        channel = request.query_params.get("channel")
+        if not channel:
+            raise ValidationError({"channel": "This query parameter is required."})
+
+        try:
+            since = int(request.query_params.get("since", 0))
+        except ValueError:
+            raise ValidationError({"since": "A valid integer is required."})
+
+        if not self.has_channel_permission(request, channel):
+            raise PermissionDenied()
+
+        events, sequence, resync = self.event_log_class().get_events_since(channel, since)
+        return Response({"channel": channel, "seq": sequence, "resync": resync, "events": events})
+
+
+class ChannelSnapshotView(APIView):
+    """
+    Streams the current objects of a channel as JSON, e.g. `?channel=my-channel`, for clients to load after subscribing.
+
+    Objects are serialized with the serializer of `pusher_backend`, reading `chunk_size`
+    rows at a time with `.iterator()`. When the backend records an event log, the
+    response has an ETag derived from the channel's latest sequence number, and
+    requests whose If-None-Match matches it are answered with a 304 without querying.
+    Override `get_snapshot_queryset` to select the channel's objects. Private and
+    presence channels are denied unless `has_channel_permission` is overridden.
+    """
+
+    pusher_backend = None
+    chunk_size = None
+
+    def has_channel_permission(self, request, channel):
+        """Return whether the request may read the channels objects"""
+        return not channel.startswith(("private-", "presence-"))
+
+    def get_snapshot_queryset(self, request, channel):
+        """Return the objects currently in the channel"""
+        raise NotImplementedError("{0} must implement get_snapshot_queryset".format(self.__class__.__name__))
+
+    def get_serializer_context(self):
+        return {"request": self.request, "view": self, "format": self.format_kwarg}
+
+    def get_sequence(self, channel):
+        """Return the channel's latest event sequence number, or None when it isn't known"""
+        event_log_class = self.pusher_backend.event_log_class
+        if event_log_class is None:
+            return None
+        return event_log_class().get_sequence(channel) or None
+
+    def get_etag(self, request, channel, sequence):
+        """Return the ETag of a snapshot, which is per user as get_snapshot_queryset may depend on the user"""
+        view = "{0}.{1}".format(self.__class__.__module__, self.__class__.__qualname__)
+        user = request.user.pk if request.user.is_authenticated else ""
+        digest = hashlib.sha1(
+            "{0}\0{1}\0{2}\0{3}".format(view, channel, sequence, user).encode("utf-8")
+        ).hexdigest()
+        return '"{0}"'.format(digest)
+
+    def get(self, request, *args, **kwargs):
+        channel = request.query_params.get("channel")
+        if not channel:
+            raise ValidationError({"channel": "This query parameter is required."})
+        if not self.has_channel_permission(request, channel):
+            raise PermissionDenied()
+
+        # Read before the objects, so events sent while streaming are replayed from the sequence
+        sequence = self.get_sequence(channel)
+        etag = None if sequence is None else self.get_etag(request, channel, sequence)
+        if etag is not None and etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+            response = HttpResponseNotModified()
+        else:
+            queryset = self.get_snapshot_queryset(request, channel)
+            response = StreamingHttpResponse(
+                self.stream_snapshot(queryset, channel, sequence), content_type="application/json"
+            )
+
+        if etag is not None:
+            response["ETag"] = etag
+        # Snapshots can differ per user, so shared caches mustn't store them
+        response["Cache-Control"] = "private, no-cache"
+        patch_vary_headers(response, ("Authorization", "Cookie"))
+        return response
+
+    def stream_snapshot(self, queryset, channel, sequence):
+        """Yield the JSON encoded snapshot, serializing a chunk of objects at a time"""
+        backend = self.pusher_backend
+        chunk_size = self.chunk_size or get_chunk_size()
+        if backend.select_related:
+            queryset = queryset.select_related(*backend.select_related)
+
+        yield '{{"channel":{0},"seq":{1},"results":['.format(json.dumps(channel), json.dumps(sequence or 0))
+        separator = ""
+        for chunk in chunked(queryset.iterator(chunk_size=chunk_size), chunk_size):
+            if backend.prefetch_related:
+                prefetch_related_objects(chunk, *backend.prefetch_related)
+            data = backend.serializer_class(chunk, many=True, context=self.get_serializer_context()).data
+            yield separator + json.dumps(data, cls=JSONEncoder, separators=(",", ":"))[1:-1]
+            separator = ","
+        yield "]}"
+
+
+class ChannelAuthView(APIView):
+    """
+    Authenticates subscriptions to private and presence channels, for pusher-js's `authEndpoint`.
+
+    A request with `socket_id` and `channel_name` is answered with the channel's auth.
+    Several channels are authenticated in one request by sending `channel_name[0]`,
+    `channel_name[1]`... as pusher-js-auth does, or a list of `channel_name`, and the
+    response maps each channel to `{"status": 200, "data": {...}}` or `{"status": 403}`.
+
+    Each channel is checked by the first of `channel_permission_classes` whose pattern matches it,
+    which subclasses must declare: channels no permission matches are denied.
+    """
+
+    parser_classes = [FormParser, JSONParser]
+    channel_permission_classes = []
+    pusher_app = None
+
+    def get_channel_permissions(self):
+        return [permission_class() for permission_class in self.channel_permission_classes]
+
+    def get_presence_data(self, request, channel):
+        """Return the presence channel member data for the user"""
+        return {"user_id": str(request.user.pk)}
+
+    def get_channel_names(self, request):
+        """Return the requested channel names and whether they were batched"""
+        data = request.data
+        indexed = {}
+        for key in data:
+            match = BATCHED_CHANNEL_NAME_RE.match(key)
+            if match:
+                indexed[int(match.group(1))] = data[key]
+        if indexed:
+            return [indexed[index] for index in sorted(indexed)], True
+
+        if hasattr(data, "getlist"):
+            channels = data.getlist("channel_name")
+            return channels, len(channels) > 1
+
+        channels = data.get("channel_name")
+        if isinstance(channels, list):
+            return channels, True
+        return ([channels] if channels else []), False
+
+    def post(self, request, *args, **kwargs):
+        socket_id = request.data.get("socket_id")
+        if not isinstance(socket_id, str) or not SOCKET_ID_RE.match(socket_id):
+            raise ValidationError({"socket_id": "A valid socket id is required."})
+
+        channels, batched = self.get_channel_names(request)
+        if not channels:
+            raise ValidationError({"channel_name": "This field is required."})
+        if len(channels) > get_auth_max_channels():
+            raise ValidationError({"channel_name": "Too many channels."})
+        if not all(isinstance(channel, str) and CHANNEL_NAME_RE.match(channel) for channel in channels):
+            raise ValidationError({"channel_name": "A valid channel name is required."})
+
+        allowed = check_channel_permissions(request, channels, self.get_channel_permissions())
+        results = {}
+        for channel in channels:
+            if not allowed[channel]:
+                results[channel] = {"status": 403}
+                continue
+
+            channel_data = None
+            if channel.startswith("presence-"):
+                channel_data = get_presence_channel_data(self.get_presence_data(request, channel))
+            results[channel] = {
+                "status": 200,
+                "data": get_channel_auth(socket_id, channel, channel_data, app=self.pusher_app),
+            }
+
+        if batched:
+            return Response(results)
+
+        result = results[channels[0]]
+        if result["status"] != 200:
+            raise PermissionDenied()
+        return Response(result["data"])
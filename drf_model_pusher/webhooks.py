@@ -0,0 +1,259 @@
+"""
+Deferred ingestion of Pusher webhooks, see DeferredPusherWebhook.
+
+Webhooks are verified and parsed without serializers, then queued and applied by a
+background thread in merged batches, so only the latest state of each channel is
+written however many webhooks arrived for it. The time of the webhook which set
+each state is stored with it, so an older webhook applied later, by another batch
+or worker, doesn't overwrite newer state. Every key expires with the occupancy
+state, so the state of channels webhooks stop reporting doesn't build up.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from drf_model_pusher.occupancy import get_occupancy_timeout, set_channels_occupancy
+from drf_model_pusher.providers import get_pusher_app_settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_OCCUPIED = "channel_occupied"
+CHANNEL_VACATED = "channel_vacated"
+SUBSCRIPTION_COUNT = "subscription_count"
+MEMBER_ADDED = "member_added"
+MEMBER_REMOVED = "member_removed"
+
+WEBHOOK_EVENTS = {CHANNEL_OCCUPIED, CHANNEL_VACATED, SUBSCRIPTION_COUNT, MEMBER_ADDED, MEMBER_REMOVED}
+
+
+def verify_webhook_signature(body, key, signature, app=None):
+    """Return whether the webhook body was signed with the app's secret"""
+    app_settings = get_pusher_app_settings(app)
+    if not key or not signature or not hmac.compare_digest(key, app_settings["key"]):
+        return False
+    expected = hmac.new(app_settings["secret"].encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def parse_webhook(body):
+    """
+    Return the (time_ms, events) of a webhook body, keeping only the events applied by the ingestor.
+
+    Raises ValueError when the body isn't a webhook.
+    """
+    webhook = json.loads(body.decode("utf-8"))
+    if not isinstance(webhook, dict) or not isinstance(webhook.get("time_ms"), int):
+        raise ValueError("time_ms is required")
+    if not isinstance(webhook.get("events"), list):
+        raise ValueError("events is required")
+
+    events = []
+    for event in webhook["events"]:
+        if not isinstance(event, dict) or not isinstance(event.get("channel"), str):
+            raise ValueError("events must have a channel")
+        if event.get("name") in WEBHOOK_EVENTS:
+            events.append(event)
+    return webhook["time_ms"], events
+
+
+def get_occupancy_time_key(channel, app=None):
+    return "drf-model-pusher:occupancy-time:{0}:{1}".format(app or "", channel)
+
+
+def get_subscription_count_key(channel, app=None):
+    return "drf-model-pusher:subscriptions:{0}:{1}".format(app or "", channel)
+
+
+def get_presence_member_key(channel, user_id, app=None):
+    return "drf-model-pusher:member:{0}:{1}:{2}".format(app or "", channel, user_id)
+
+
+def get_presence_vacated_key(channel, app=None):
+    return "drf-model-pusher:members-vacated:{0}:{1}".format(app or "", channel)
+
+
+def get_subscription_count(channel, app=None):
+    """Return the last subscription count reported for a channel, or None when it isn't known"""
+    stored = cache.get(get_subscription_count_key(channel, app))
+    return None if stored is None else stored[1]
+
+
+def is_presence_member(channel, user_id, app=None):
+    """Return whether webhooks reported the user as a member of a presence channel"""
+    member_key = get_presence_member_key(channel, str(user_id), app)
+    vacated_key = get_presence_vacated_key(channel, app)
+    found = cache.get_many([member_key, vacated_key])
+    member = found.get(member_key)
+    return member is not None and member[1] and member[0] >= found.get(vacated_key, 0)
+
+
+class WebhookChanges(object):
+    """The latest state of each channel across a batch of webhooks"""
+
+    def __init__(self):
+        # (app, channel) -> (time_ms, occupied)
+        self.occupancy = {}
+        # (app, channel) -> (time_ms, subscription count)
+        self.counts = {}
+        # (app, channel, user_id) -> (time_ms, present)
+        self.members = {}
+        # (app, channel) -> time_ms the channel was last vacated, removing all its members
+        self.vacated = {}
+
+    def add(self, app, time_ms, events):
+        for event in events:
+            name = event["name"]
+            key = (app, event["channel"])
+            if name == CHANNEL_OCCUPIED or name == MEMBER_ADDED:
+                self.set_occupied(key, time_ms, True)
+            elif name == CHANNEL_VACATED:
+                self.set_occupied(key, time_ms, False)
+                self.set_latest(self.counts, key, time_ms, 0)
+                self.vacated[key] = max(time_ms, self.vacated.get(key, 0))
+            elif name == SUBSCRIPTION_COUNT:
+                count = event.get("subscription_count")
+                if isinstance(count, int):
+                    self.set_latest(self.counts, key, time_ms, count)
+                    self.set_occupied(key, time_ms, count > 0)
+
+            if name in (MEMBER_ADDED, MEMBER_REMOVED) and event.get("user_id") is not None:
+                self.set_latest(self.members, key + (str(event["user_id"]),), time_ms, name == MEMBER_ADDED)
+
+    def set_occupied(self, key, time_ms, occupied):
+        self.set_latest(self.occupancy, key, time_ms, occupied)
+
+    @staticmethod
+    def set_latest(states, key, time_ms, state):
+        """Keep the most recent state, webhooks can arrive out of order"""
+        if time_ms >= states.get(key, (0, None))[0]:
+            states[key] = (time_ms, state)
+
+
+class WebhookIngestor(object):
+    """
+    Applies webhooks in merged batches.
+
+    Submitted webhooks are applied every `flush_interval` seconds by a background
+    thread, started in each process on first use, or as they're submitted when
+    `flush_interval` is None. Webhooks still queued when the process exits are lost,
+    the occupancy syncs with Pusher correct them.
+    """
+
+    def __init__(self, flush_interval=0.1):
+        self.flush_interval = flush_interval
+        self.stopped = threading.Event()
+        self._pending = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+
+    def submit(self, app, time_ms, events):
+        if self.flush_interval is None:
+            changes = WebhookChanges()
+            changes.add(app, time_ms, events)
+            self.apply(changes)
+            return
+
+        with self._lock:
+            self._pending.append((app, time_ms, events))
+            if self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name="drf-model-pusher-webhooks", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to apply pusher webhooks")
+
+    def stop(self):
+        """Stop the background thread, applying the webhooks still queued"""
+        self.stopped.set()
+        self.flush()
+
+    def flush(self):
+        """Apply the queued webhooks, returning the number applied"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            changes = WebhookChanges()
+            for app, time_ms, events in pending:
+                changes.add(app, time_ms, events)
+            self.apply(changes)
+        return len(pending)
+
+    def apply(self, changes):
+        """Write the changes which are newer than the stored state, each channel and member with its own keys"""
+        timeout = get_occupancy_timeout()
+        if changes.occupancy:
+            time_keys = {(app, channel): get_occupancy_time_key(channel, app) for app, channel in changes.occupancy}
+            stored = cache.get_many(list(time_keys.values()))
+            grouped, times = {}, {}
+            for (app, channel), (time_ms, occupied) in changes.occupancy.items():
+                time_key = time_keys[app, channel]
+                if time_ms >= stored.get(time_key, 0):
+                    grouped.setdefault((app, occupied), []).append(channel)
+                    times[time_key] = time_ms
+            for (app, occupied), channels in grouped.items():
+                set_channels_occupancy(channels, occupied, app=app)
+            cache.set_many(times, timeout=timeout)
+
+        if changes.counts:
+            self.set_newer(
+                {get_subscription_count_key(channel, app): state for (app, channel), state in changes.counts.items()},
+                timeout,
+            )
+
+        if changes.vacated:
+            vacated = {
+                get_presence_vacated_key(channel, app): time_ms for (app, channel), time_ms in changes.vacated.items()
+            }
+            stored = cache.get_many(list(vacated))
+            cache.set_many(
+                {key: time_ms for key, time_ms in vacated.items() if time_ms > stored.get(key, 0)}, timeout=timeout
+            )
+
+        if changes.members:
+            members = {
+                get_presence_member_key(channel, user_id, app): state
+                for (app, channel, user_id), state in changes.members.items()
+            }
+            self.set_newer(members, timeout)
+
+    def set_newer(self, states, timeout):
+        """Store the (time_ms, state) of keys unless newer state is already stored"""
+        if states:
+            stored = cache.get_many(list(states))
+            cache.set_many(
+                {key: state for key, state in states.items() if key not in stored or state[0] >= stored[key][0]},
+                timeout=timeout,
+            )
+
+
+_ingestor = None
+
+
+def get_webhook_ingestor():
+    """Return the process wide WebhookIngestor"""
+    global _ingestor
+    if _ingestor is None:
+        _ingestor = WebhookIngestor(flush_interval=getattr(settings, "DRF_MODEL_PUSHER_WEBHOOK_FLUSH_INTERVAL", 0.1))
+    return _ingestor
+
+
+@receiver(setting_changed)
+def reset_webhook_ingestor(setting, **kwargs):
+    global _ingestor
+    if setting.startswith("DRF_MODEL_PUSHER_WEBHOOK_FLUSH") and _ingestor is not None:
+        _ingestor.stop()
+        _ingestor = None
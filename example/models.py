@@ -1,5 +1,7 @@
 from django.db import models
 
+from drf_model_pusher.querysets import PusherQuerySet
+
 
 class MyPublicModel(models.Model):
     name = models.CharField(max_length=32)
@@ -11,3 +13,31 @@ class MyPrivateModel(models.Model):
 
 class MyPresenceModel(models.Model):
     name = models.CharField(max_length=32)
+
+
+class MyPublicProxyModel(MyPublicModel):
+    class Meta:
+        proxy = True
+
+
+class MyBulkModel(models.Model):
+    name = models.CharField(max_length=32)
+
+    objects = PusherQuerySet.as_manager()
+
+    def get_pusher_channels(self):
+        return ["bulk-channel"]
+
+
+class MyParentModel(models.Model):
+    name = models.CharField(max_length=32)
+
+
+class MyChildModel(models.Model):
+    name = models.CharField(max_length=32)
+    parent = models.ForeignKey(MyParentModel, on_delete=models.CASCADE, related_name="children")
+
+    objects = PusherQuerySet.as_manager()
+
+    def get_pusher_channels(self):
+        return ["child-channel"]
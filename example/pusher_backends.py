@@ -1,5 +1,6 @@
 from drf_model_pusher.backends import PusherBackend, PrivatePusherBackend, PresencePusherBackend
-from example.serializers import MyPublicModelSerializer, MyPrivateModelSerializer, MyPresenceModelSerializer
+from example.serializers import MyPublicModelSerializer, MyPrivateModelSerializer, MyPresenceModelSerializer, \
+    MyBulkModelSerializer, MyChildModelSerializer
 
 
 class MyPublicModelPusherBackend(PusherBackend):
@@ -12,3 +13,12 @@ class MyPrivateModelBackend(PrivatePusherBackend):
 
 class MyPresenceModelBackend(PresencePusherBackend):
     serializer_class = MyPresenceModelSerializer
+
+
+class MyBulkModelBackend(PusherBackend):
+    serializer_class = MyBulkModelSerializer
+
+
+class MyChildModelBackend(PusherBackend):
+    serializer_class = MyChildModelSerializer
+    select_related = ("parent",)
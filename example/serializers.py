@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from example.models import MyPublicModel, MyPrivateModel, MyPresenceModel
+from example.models import MyPublicModel, MyPrivateModel, MyPresenceModel, MyBulkModel, MyChildModel
 
 
 class MyPublicModelSerializer(serializers.ModelSerializer):
@@ -19,3 +19,17 @@ class MyPresenceModelSerializer(serializers.ModelSerializer):
     class Meta:
         model = MyPresenceModel
         fields = ("name",)
+
+
+class MyBulkModelSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MyBulkModel
+        fields = ("name",)
+
+
+class MyChildModelSerializer(serializers.ModelSerializer):
+    parent_name = serializers.CharField(source="parent.name")
+
+    class Meta:
+        model = MyChildModel
+        fields = ("name", "parent_name")
@@ -25,7 +25,9 @@ REQUIRED = ["django", "djangorestframework", "pusher"]
 
 # What packages are optional?
 EXTRAS = {
-    # 'fancy feature': ['django'],
+    "channels": ["channels"],
+    "encryption": ["pusher>=3", "pynacl"],
+    "redis": ["redis>=4.0"],
 }
 
 # The rest you shouldn't have to touch too much :)
@@ -0,0 +1,155 @@
+import threading
+from unittest import TestCase, mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from pytest import mark
+
+from drf_model_pusher.backends import (
+    PusherBackend,
+    PusherBackendRegistry,
+    pusher_backend_registry,
+    register_pusher_backend,
+    reload_instances,
+)
+from example.models import MyChildModel, MyParentModel, MyPublicModel, MyPublicProxyModel, MyPrivateModel
+from example.pusher_backends import MyPublicModelPusherBackend
+from example.serializers import MyPrivateModelSerializer
+
+
+class TestPusherBackendRegistry(TestCase):
+    def test_backends_registered_by_metaclass(self):
+        self.assertEqual(
+            pusher_backend_registry.get_backends(MyPublicModel), (MyPublicModelPusherBackend,)
+        )
+
+    def test_proxy_models_resolve_parent_backends(self):
+        self.assertEqual(
+            pusher_backend_registry.get_backends(MyPublicProxyModel), (MyPublicModelPusherBackend,)
+        )
+
+    def test_backends_keyed_by_model_label(self):
+        registry = PusherBackendRegistry()
+        registry.register(MyPublicModelPusherBackend, model="other_app.MyPublicModel")
+
+        self.assertEqual(registry.get_backends(MyPublicModel), ())
+
+    def test_resolved_backends_are_invalidated_on_register(self):
+        registry = PusherBackendRegistry()
+        self.assertEqual(registry.get_backends(MyPublicProxyModel), ())
+
+        registry.register(MyPublicModelPusherBackend)
+
+        self.assertEqual(registry.get_backends(MyPublicProxyModel), (MyPublicModelPusherBackend,))
+
+    def test_register_decorator(self):
+        @register_pusher_backend(model=MyPublicProxyModel)
+        class MyDecoratedBackend(PusherBackend):
+            serializer_class = MyPrivateModelSerializer
+
+            class Meta:
+                auto_register = False
+
+        try:
+            self.assertNotIn(MyDecoratedBackend, pusher_backend_registry.get_backends(MyPrivateModel))
+            self.assertNotIn(MyDecoratedBackend, pusher_backend_registry.get_backends(MyPublicModel))
+            self.assertIn(MyDecoratedBackend, pusher_backend_registry.get_backends(MyPublicProxyModel))
+        finally:
+            pusher_backend_registry.unregister(MyDecoratedBackend)
+
+    @mock.patch("drf_model_pusher.backends.import_module")
+    def test_lazy_modules_imported_on_first_lookup(self, import_module: mock.Mock):
+        registry = PusherBackendRegistry()
+        registry.add_lazy_module("example", "example.pusher_backends")
+        registry.add_lazy_module("other_app", "other_app.pusher_backends")
+
+        registry.get_backends(MyPublicModel)
+        registry.get_backends(MyPrivateModel)
+
+        import_module.assert_called_once_with("example.pusher_backends")
+
+    def test_lookups_wait_for_lazy_imports(self):
+        registry = PusherBackendRegistry()
+        registry.add_lazy_module("example", "example.pusher_backends")
+        importing, release = threading.Event(), threading.Event()
+
+        def import_module(module_name):
+            importing.set()
+            release.wait(timeout=1)
+            registry.register(MyPublicModelPusherBackend, model=MyPublicModel)
+
+        results = []
+        with mock.patch("drf_model_pusher.backends.import_module", side_effect=import_module):
+            first = threading.Thread(target=lambda: results.append(registry.get_backends(MyPublicModel)))
+            second = threading.Thread(target=lambda: results.append(registry.get_backends(MyPublicModel)))
+            first.start()
+            importing.wait(timeout=1)
+            second.start()
+            second.join(timeout=0.1)
+            release.set()
+            first.join(timeout=1)
+            second.join(timeout=1)
+
+        self.assertEqual(results, [(MyPublicModelPusherBackend,)] * 2)
+        self.assertEqual(registry.get_backends(MyPublicModel), (MyPublicModelPusherBackend,))
+
+
+class TestPusherBackendDeletes(TestCase):
+    def test_delete_data_includes_key_fields(self):
+        class MyKeyFieldsBackend(PusherBackend):
+            serializer_class = MyPrivateModelSerializer
+            delete_key_fields = ("name",)
+
+            class Meta:
+                auto_register = False
+
+        data = MyKeyFieldsBackend().get_delete_data(MyPrivateModel(pk=3, name="Henry"))
+
+        self.assertEqual(data, {"id": 3, "name": "Henry"})
+        self.assertEqual(MyKeyFieldsBackend.get_delete_fields(), ["pk", "name"])
+
+
+@mark.django_db
+class TestReloadInstances(TestCase):
+    def tearDown(self):
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            MyChildModel.objects.all().delete()
+        MyParentModel.objects.all().delete()
+
+    def test_reload_preserves_order_and_joins_related(self):
+        parent = MyParentModel.objects.create(name="parent")
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            MyChildModel.objects.bulk_create([MyChildModel(name=str(i), parent=parent) for i in range(3)])
+        children = list(MyChildModel.objects.order_by("-pk"))
+
+        with CaptureQueriesContext(connection) as queries:
+            reloaded = reload_instances(MyChildModel, children, select_related=("parent",))
+            names = [child.parent.name for child in reloaded]
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([child.pk for child in reloaded], [child.pk for child in children])
+        self.assertEqual(names, ["parent"] * 3)
+
+    def test_reload_reads_the_instances_database(self):
+        parent = MyParentModel.objects.create(name="parent")
+        child = MyChildModel(name="child", parent=parent)
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            MyChildModel.objects.bulk_create([child])
+        child = MyChildModel.objects.get()
+        child._state.db = "replica"
+        manager = MyChildModel._base_manager
+        default = manager.db_manager("default")
+
+        with mock.patch.object(manager, "using", side_effect=lambda alias: default.all()) as using:
+            reloaded = reload_instances(MyChildModel, [child], select_related=("parent",))
+
+        using.assert_called_once_with("replica")
+        self.assertEqual(reloaded[0].parent.name, "parent")
+
+    def test_reload_without_hints_does_not_query(self):
+        instance = MyPublicModel(pk=1, name="Henry")
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(reload_instances(MyPublicModel, [instance]), [instance])
+
+        self.assertEqual(len(queries), 0)
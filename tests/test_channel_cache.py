@@ -0,0 +1,83 @@
+from unittest import TestCase, mock
+from unittest.mock import Mock
+
+from django.core.cache import cache
+from pytest import mark
+from rest_framework.test import APIRequestFactory
+
+from drf_model_pusher.backends import PusherBackend, pusher_backend_registry
+from drf_model_pusher.channel_cache import ChannelResolutionCache, invalidate_pusher_channels
+from example.models import MyPublicModel
+from example.serializers import MyPublicModelSerializer
+from example.views import MyPublicModelViewSet
+
+
+class CountingViewSet(MyPublicModelViewSet):
+    calls = 0
+
+    def get_pusher_channels(self):
+        CountingViewSet.calls += 1
+        return ["channel"]
+
+
+class InstanceChannelsViewSet(MyPublicModelViewSet):
+    pusher_channels_cache_timeout = 60
+    calls = 0
+
+    def get_pusher_channels(self, instance=None):
+        InstanceChannelsViewSet.calls += 1
+        return ["channel-{0}".format(instance.pk)]
+
+
+@mark.django_db
+class TestChannelResolution(TestCase):
+    def setUp(self):
+        CountingViewSet.calls = 0
+        InstanceChannelsViewSet.calls = 0
+
+    def tearDown(self):
+        cache.clear()
+
+    @mock.patch("pusher.Pusher.trigger")
+    def test_channels_resolved_once_per_request_for_many_backends(self, trigger: Mock):
+        class MySecondPublicModelBackend(PusherBackend):
+            serializer_class = MyPublicModelSerializer
+
+            def get_event_name(self, event_type):
+                return "second.{0}".format(event_type)
+
+        try:
+            view = CountingViewSet.as_view({"post": "create"})
+            view(APIRequestFactory().post(path="/mymodels/", data={"name": "Henry"}))
+        finally:
+            pusher_backend_registry.unregister(MySecondPublicModelBackend)
+
+        self.assertEqual(trigger.call_count, 2)
+        self.assertEqual(CountingViewSet.calls, 1)
+
+    @mock.patch("pusher.Pusher.trigger")
+    def test_instance_channels_cached_across_requests(self, trigger: Mock):
+        instance = MyPublicModel.objects.create(name="Julie")
+        view = InstanceChannelsViewSet.as_view({"patch": "partial_update"})
+
+        for name in ("Michelle", "Henry"):
+            view(APIRequestFactory().patch(path="/mymodels/", data={"name": name}), pk=instance.pk)
+
+        self.assertEqual(InstanceChannelsViewSet.calls, 1)
+        self.assertEqual(trigger.call_args[0][0], ["channel-{0}".format(instance.pk)])
+
+        invalidate_pusher_channels(MyPublicModel, instance.pk)
+        view(APIRequestFactory().patch(path="/mymodels/", data={"name": "Julie"}), pk=instance.pk)
+
+        self.assertEqual(InstanceChannelsViewSet.calls, 2)
+
+
+class TestChannelResolutionCache(TestCase):
+    def test_unsaved_instances_are_not_shared(self):
+        channel_cache = ChannelResolutionCache(timeout=60)
+        resolver = Mock(return_value=["a"])
+
+        channel_cache.resolve("resolver", MyPublicModel(), resolver)
+        channel_cache.resolve("resolver", MyPublicModel(), resolver)
+
+        self.assertEqual(resolver.call_count, 2)
@@ -0,0 +1,95 @@
+from unittest import TestCase
+
+import pytest
+
+pytest.importorskip("channels")
+
+from asgiref.sync import async_to_sync  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from drf_model_pusher.channel_layers import (  # noqa: E402
+    ChannelLayerProvider,
+    PusherEventsConsumerMixin,
+    channel_subscribed,
+    channel_unsubscribed,
+    get_group_name,
+)
+
+IN_MEMORY_CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+class TestChannelLayerProvider(TestCase):
+    def setUp(self):
+        self.settings = override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+        self.settings.enable()
+        self.provider = ChannelLayerProvider()
+        self.provider.configure()
+        self.layer = self.provider.channel_layer
+
+    def tearDown(self):
+        self.settings.disable()
+        cache.clear()
+
+    def subscribe(self, channel):
+        channel_name = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(get_group_name(channel), channel_name)
+        return channel_name
+
+    def receive(self, channel_name):
+        return async_to_sync(self.layer.receive)(channel_name)
+
+    def test_group_names(self):
+        self.assertEqual(get_group_name("private-channel"), "private-channel")
+        self.assertTrue(get_group_name("presence-a@b").startswith("drf-model-pusher."))
+
+    def test_trigger_sends_to_groups(self):
+        channel_name = self.subscribe("my-channel")
+
+        self.provider.trigger(["my-channel"], "myevent", {"foo": "bar"}, socket_id="1.1")
+
+        self.assertEqual(
+            self.receive(channel_name),
+            {
+                "type": "pusher.events",
+                "events": [{"channel": "my-channel", "event": "myevent", "data": {"foo": "bar"}}],
+                "socket_id": "1.1",
+            },
+        )
+
+    def test_trigger_batch_sends_one_message_per_group(self):
+        channel_name = self.subscribe("my-channel")
+
+        self.provider.trigger_batch([(["my-channel"], "a", {"i": 1}), (["my-channel"], "b", {"i": 2})])
+
+        self.assertEqual([event["event"] for event in self.receive(channel_name)["events"]], ["a", "b"])
+
+    @override_settings(DRF_MODEL_PUSHER_WEBHOOK_OPTIMISATION_ENABLED=True)
+    def test_unoccupied_channels_are_skipped(self):
+        occupied = self.subscribe("occupied")
+        vacated = self.subscribe("vacated")
+        channel_subscribed("occupied")
+        channel_subscribed("vacated")
+        channel_unsubscribed("vacated")
+
+        self.provider.trigger(["occupied", "vacated", "unknown"], "myevent", {})
+
+        self.assertEqual(self.receive(occupied)["events"][0]["channel"], "occupied")
+        self.assertEqual(self.layer.channels.get(vacated), None)
+
+
+class TestPusherEventsConsumerMixin(TestCase):
+    def test_events_sent_with_own_socket_id_are_skipped(self):
+        sent = []
+
+        class Consumer(PusherEventsConsumerMixin):
+            channel_name = "1.1"
+
+            async def send_json(self, content):
+                sent.append(content)
+
+        event = {"channel": "my-channel", "event": "myevent", "data": {}}
+        async_to_sync(Consumer().pusher_events)({"events": [event], "socket_id": "1.1"})
+        async_to_sync(Consumer().pusher_events)({"events": [event], "socket_id": "2.2"})
+
+        self.assertEqual(sent, [event])
@@ -0,0 +1,130 @@
+import gc
+from unittest import TestCase, mock
+from unittest.mock import Mock
+
+from drf_model_pusher.dispatch import (
+    ROUTE_DIRECT,
+    ROUTE_NONE,
+    ROUTE_SIGNAL,
+    PusherBatch,
+    PusherDispatcher,
+    PusherPacket,
+    get_signal_route,
+)
+from drf_model_pusher.providers import PusherProvider
+from drf_model_pusher.receivers import send_pusher_batch, send_pusher_event
+from drf_model_pusher.signals import PusherSignal, view_batch, view_post_save
+from example.pusher_backends import MyPublicModelPusherBackend
+
+
+def observer(**kwargs):
+    pass
+
+
+class TestDispatch(TestCase):
+    def test_packets_have_no_instance_dict(self):
+        packet = PusherPacket(None, None, ["my-channel"], "myevent", {})
+
+        self.assertFalse(hasattr(packet, "__dict__"))
+
+    def test_signal_routes(self):
+        self.assertEqual(get_signal_route(view_post_save), ROUTE_DIRECT)
+
+        view_post_save.connect(observer)
+        try:
+            self.assertEqual(get_signal_route(view_post_save), ROUTE_SIGNAL)
+        finally:
+            view_post_save.disconnect(observer)
+
+        view_post_save.disconnect(send_pusher_event)
+        try:
+            self.assertEqual(get_signal_route(view_post_save), ROUTE_NONE)
+        finally:
+            view_post_save.connect(send_pusher_event)
+
+    def test_routes_follow_receivers_by_dispatch_uid_and_garbage_collection(self):
+        view_post_save.connect(observer, dispatch_uid="my-observer")
+        self.assertEqual(get_signal_route(view_post_save), ROUTE_SIGNAL)
+        view_post_save.disconnect(dispatch_uid="my-observer")
+        self.assertEqual(get_signal_route(view_post_save), ROUTE_DIRECT)
+
+        def temporary_observer(**kwargs):
+            pass
+
+        view_post_save.connect(temporary_observer)
+        self.assertEqual(get_signal_route(view_post_save), ROUTE_SIGNAL)
+        del temporary_observer
+        gc.collect()
+        self.assertEqual(get_signal_route(view_post_save), ROUTE_DIRECT)
+
+    def test_dropped_packets_are_logged_once(self):
+        signal = PusherSignal()
+
+        with self.assertLogs("drf_model_pusher.dispatch", level="WARNING") as logs:
+            self.assertEqual(get_signal_route(signal), ROUTE_NONE)
+            self.assertEqual(get_signal_route(signal), ROUTE_NONE)
+
+        self.assertEqual(len(logs.output), 1)
+
+    @mock.patch("pusher.Pusher.trigger")
+    def test_direct_dispatch_skips_the_signal(self, trigger: Mock):
+        with mock.patch.object(view_post_save, "send") as send:
+            MyPublicModelPusherBackend().push_packet("update", (["my-channel"], "myevent", {"foo": "bar"}))
+
+        self.assertFalse(send.called)
+        trigger.assert_called_once_with(["my-channel"], "myevent", {"foo": "bar"}, None)
+
+    def test_dispatcher_reuses_providers(self):
+        dispatcher = PusherDispatcher()
+        provider = dispatcher.get_provider(PusherProvider)
+
+        self.assertIs(dispatcher.get_provider(PusherProvider, priority="high"), provider)
+        self.assertEqual(provider.priority, "high")
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_observers_receive_the_signal(self, trigger_batch: Mock):
+        received = []
+
+        def batch_observer(sender, packets, **kwargs):
+            received.append(packets)
+
+        view_batch.connect(batch_observer)
+        try:
+            MyPublicModelPusherBackend().push_packets([(["my-channel"], "myevent", {})])
+        finally:
+            view_batch.disconnect(batch_observer)
+
+        self.assertEqual(received, [[(["my-channel"], "myevent", {})]])
+        # The default receiver still sends the batch
+        self.assertTrue(trigger_batch.called)
+        self.assertEqual(get_signal_route(view_batch), ROUTE_DIRECT)
+
+    def test_providers_without_trigger_batch_trigger_each_packet(self):
+        class MyTriggerOnlyProvider(object):
+            sent = []
+
+            def configure(self):
+                pass
+
+            def trigger(self, channels, event_name, data, socket_id=None):
+                self.sent.append((channels, event_name, self.idempotency_keys))
+
+        batch = PusherBatch(
+            None,
+            None,
+            [(["a"], "x.update", {}), (["b"], "x.update", {})],
+            provider_class=MyTriggerOnlyProvider,
+            idempotency_keys=["key-a", "key-b"],
+        )
+        PusherDispatcher().dispatch_batch(batch)
+        send_pusher_batch(None, None, None, batch.packets, provider_class=MyTriggerOnlyProvider)
+
+        self.assertEqual(
+            MyTriggerOnlyProvider.sent,
+            [
+                (["a"], "x.update", ["key-a"]),
+                (["b"], "x.update", ["key-b"]),
+                (["a"], "x.update", None),
+                (["b"], "x.update", None),
+            ],
+        )
@@ -0,0 +1,125 @@
+import base64
+import json
+from unittest import TestCase, mock
+from unittest.mock import Mock
+
+import nacl.secret
+from django.test import override_settings
+from pusher import Pusher
+from pusher.crypto import generate_shared_secret
+
+from drf_model_pusher.backends import EncryptedPusherBackend
+from drf_model_pusher.channel_auth import get_channel_auth
+from drf_model_pusher.encryption import ChannelKeyCache, EncryptedPusherProvider, get_channel_key_cache
+from drf_model_pusher.exceptions import ModelPusherException
+from example.models import MyBulkModel
+from example.serializers import MyBulkModelSerializer
+
+MASTER_KEY = b"0123456789abcdef0123456789abcdef"
+
+
+def decrypt(channel, data):
+    encrypted = json.loads(data)
+    box = nacl.secret.SecretBox(generate_shared_secret(channel.encode("utf-8"), MASTER_KEY))
+    plain = box.decrypt(base64.b64decode(encrypted["ciphertext"]), base64.b64decode(encrypted["nonce"]))
+    return json.loads(plain.decode("utf-8"))
+
+
+class TestEncryptedPusherProvider(TestCase):
+    def setUp(self):
+        self.settings = override_settings(
+            PUSHER_ENCRYPTION_MASTER_KEY_BASE64=base64.b64encode(MASTER_KEY).decode("ascii")
+        )
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_events_are_encrypted_per_channel(self, trigger_batch: Mock):
+        channels = ["private-encrypted-a", "private-encrypted-b", "public"]
+
+        EncryptedPusherProvider().trigger(channels, "mymodel.update", {"name": "Henry"}, "1.1")
+
+        events = trigger_batch.call_args[0][0]
+        self.assertEqual(trigger_batch.call_args[1], {"already_encoded": True})
+        self.assertEqual([event["channel"] for event in events], channels)
+        self.assertEqual({event["socket_id"] for event in events}, {"1.1"})
+        self.assertEqual(decrypt("private-encrypted-a", events[0]["data"]), {"name": "Henry"})
+        self.assertEqual(decrypt("private-encrypted-b", events[1]["data"]), {"name": "Henry"})
+        self.assertNotEqual(json.loads(events[0]["data"])["nonce"], json.loads(events[1]["data"])["nonce"])
+        self.assertEqual(events[2]["data"], '{"name": "Henry"}')
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_payloads_are_serialized_once(self, trigger_batch: Mock):
+        channels = ["private-encrypted-{0}".format(i) for i in range(25)]
+
+        with mock.patch("drf_model_pusher.encryption.serialize_payload", return_value=b"{}") as serialize_payload:
+            EncryptedPusherProvider().trigger_batch([(channels, "mymodel.update", {"name": "Henry"})])
+
+        self.assertEqual(serialize_payload.call_count, 1)
+        self.assertEqual(sum(len(call[0][0]) for call in trigger_batch.call_args_list), 25)
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_throttled_sends_are_batched(self, trigger_batch: Mock):
+        channels = ["private-encrypted-{0}".format(i) for i in range(25)]
+
+        EncryptedPusherProvider().send_unthrottled(channels, "mymodel.update", {"name": "Henry"})
+
+        self.assertEqual([len(call[0][0]) for call in trigger_batch.call_args_list], [10, 10, 5])
+
+    @override_settings(PUSHER_ENCRYPTION_MASTER_KEY_BASE64=None)
+    def test_master_key_is_required(self):
+        with mock.patch("pusher.Pusher.trigger_batch"), self.assertRaises(ModelPusherException):
+            EncryptedPusherProvider().trigger(["private-encrypted-a"], "mymodel.update", {})
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_channel_keys_are_cached(self, trigger_batch: Mock):
+        key_cache = get_channel_key_cache()
+        provider = EncryptedPusherProvider()
+
+        provider.trigger(["private-encrypted-a"], "mymodel.update", {})
+        provider.trigger(["private-encrypted-a"], "mymodel.update", {})
+
+        self.assertEqual((key_cache.misses, key_cache.hits), (1, 1))
+
+
+class TestChannelKeyCache(TestCase):
+    def test_least_recently_used_keys_are_evicted(self):
+        key_cache = ChannelKeyCache(maxsize=2)
+        box = key_cache.get_box("a", MASTER_KEY)
+        key_cache.get_box("b", MASTER_KEY)
+        key_cache.get_box("a", MASTER_KEY)
+        key_cache.get_box("c", MASTER_KEY)
+
+        self.assertIs(key_cache.get_box("a", MASTER_KEY), box)
+        key_cache.get_box("b", MASTER_KEY)
+        self.assertEqual((key_cache.hits, key_cache.misses), (2, 4))
+
+
+class TestEncryptedPusherBackend(TestCase):
+    def test_channels_are_prefixed(self):
+        class MyEncryptedBackend(EncryptedPusherBackend):
+            serializer_class = MyBulkModelSerializer
+
+            class Meta:
+                auto_register = False
+
+        channels = MyEncryptedBackend().get_channels(MyBulkModel(pk=1))
+
+        self.assertEqual(channels, ["private-encrypted-bulk-channel"])
+        self.assertIs(MyEncryptedBackend.provider_class, EncryptedPusherProvider)
+
+
+class TestEncryptedChannelAuth(TestCase):
+    @override_settings(PUSHER_ENCRYPTION_MASTER_KEY_BASE64=base64.b64encode(MASTER_KEY).decode("ascii"))
+    def test_auth_includes_the_shared_secret(self):
+        auth = get_channel_auth("1.1", "private-encrypted-a")
+
+        self.assertEqual(
+            base64.b64decode(auth["shared_secret"]), generate_shared_secret(b"private-encrypted-a", MASTER_KEY)
+        )
+        expected = Pusher(
+            app_id="1", key="ok", secret="ok", encryption_master_key_base64=base64.b64encode(MASTER_KEY)
+        ).authenticate("private-encrypted-a", "1.1")
+        self.assertEqual(auth, dict(expected, shared_secret=expected["shared_secret"].decode("ascii")))
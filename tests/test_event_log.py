@@ -0,0 +1,104 @@
+from unittest import TestCase, mock
+from unittest.mock import Mock
+
+from django.core.cache import cache
+from pytest import mark
+from rest_framework.test import APIRequestFactory
+
+from drf_model_pusher.event_log import ChannelEventLog
+from drf_model_pusher.views import ChannelEventLogView
+from example.views import MyPublicModelViewSet
+
+
+class TestChannelEventLog(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_sequences_are_per_channel(self):
+        event_log = ChannelEventLog(size=10)
+
+        self.assertEqual(event_log.append("a", "x.update", {}), 1)
+        self.assertEqual(event_log.append("a", "x.update", {}), 2)
+        self.assertEqual(event_log.append("b", "x.update", {}), 1)
+
+    def test_events_since(self):
+        event_log = ChannelEventLog(size=10)
+        for i in range(3):
+            event_log.append("a", "x.update", {"i": i})
+
+        events, sequence, resync = event_log.get_events_since("a", 1)
+
+        self.assertEqual(
+            events,
+            [{"seq": 2, "event": "x.update", "data": {"i": 1}}, {"seq": 3, "event": "x.update", "data": {"i": 2}}],
+        )
+        self.assertEqual(sequence, 3)
+        self.assertFalse(resync)
+
+    def test_resync_when_events_overwritten(self):
+        event_log = ChannelEventLog(size=2)
+        for i in range(5):
+            event_log.append("a", "x.update", {"i": i})
+
+        self.assertEqual(event_log.get_events_since("a", 1), ([], 5, True))
+        self.assertEqual(len(event_log.get_events_since("a", 3)[0]), 2)
+
+    def test_resync_when_the_latest_event_is_missing(self):
+        event_log = ChannelEventLog(size=10)
+        for i in range(3):
+            event_log.append("a", "x.update", {"i": i})
+        cache.delete(event_log.get_slot_key("a", 3))
+
+        self.assertEqual(event_log.get_events_since("a", 2), ([], 3, True))
+        self.assertEqual(event_log.get_events_since("a", 1), ([], 3, True))
+
+    def test_resync_when_sequence_is_ahead(self):
+        event_log = ChannelEventLog(size=2)
+
+        self.assertEqual(event_log.get_events_since("a", 4), ([], 0, True))
+
+
+@mark.django_db
+class TestEventLogBackend(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    @mock.patch("pusher.Pusher.trigger")
+    def test_packets_are_stamped_with_sequences(self, trigger: Mock):
+        view = MyPublicModelViewSet.as_view({"post": "create"})
+
+        with mock.patch("example.pusher_backends.MyPublicModelPusherBackend.event_log_class", ChannelEventLog):
+            for _ in range(2):
+                view(APIRequestFactory().post(path="/mymodels/", data={"name": "Henry"}))
+
+        self.assertEqual(trigger.call_args[0][2], {"name": "Henry", "_seq": {"channel": 2}})
+
+        request = APIRequestFactory().get("/events/", {"channel": "channel", "since": 1})
+        response = ChannelEventLogView.as_view()(request)
+        self.assertEqual(
+            response.data["events"], [{"seq": 2, "event": "mypublicmodel.create", "data": {"name": "Henry"}}]
+        )
+
+    @mock.patch("pusher.Pusher.trigger")
+    def test_channels_are_stamped_separately(self, trigger: Mock):
+        class MyFanOutViewSet(MyPublicModelViewSet):
+            def get_pusher_channels(self):
+                return ["a", "b"]
+
+        view = MyFanOutViewSet.as_view({"post": "create"})
+        with mock.patch("example.pusher_backends.MyPublicModelPusherBackend.event_log_class", ChannelEventLog):
+            ChannelEventLog().append("b", "mypublicmodel.create", {})
+            view(APIRequestFactory().post(path="/mymodels/", data={"name": "Henry"}))
+
+        self.assertEqual(
+            [call[0][:3] for call in trigger.call_args_list],
+            [
+                (["a"], "mypublicmodel.create", {"name": "Henry", "_seq": {"a": 1}}),
+                (["b"], "mypublicmodel.create", {"name": "Henry", "_seq": {"b": 2}}),
+            ],
+        )
+
+    def test_private_channels_denied_by_default(self):
+        request = APIRequestFactory().get("/events/", {"channel": "private-channel", "since": 0})
+
+        self.assertEqual(ChannelEventLogView.as_view()(request).status_code, 403)
@@ -0,0 +1,161 @@
+from unittest import TestCase, mock
+from unittest.mock import Mock
+
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+
+from drf_model_pusher.backends import PUSH_UPDATE, PusherBackend, push_model_changes
+from drf_model_pusher.idempotency import (
+    DEDUPLICATED,
+    Deduplicator,
+    RedisIdempotencyStore,
+    get_deduplicator,
+    get_idempotency_key,
+    is_payload_key,
+)
+from drf_model_pusher.providers import PusherProvider
+from example.models import MyBulkModel
+from example.pusher_backends import MyBulkModelBackend
+from example.serializers import MyBulkModelSerializer
+
+
+class TestIdempotencyKeys(TestCase):
+    def test_keys_are_versioned(self):
+        self.assertEqual(
+            get_idempotency_key("example.mybulkmodel", 1, "mybulkmodel.update", "v1"),
+            "example.mybulkmodel:1:mybulkmodel.update:v1",
+        )
+
+    def test_keys_without_a_version_hash_the_payload(self):
+        key = get_idempotency_key("example.mybulkmodel", 1, "mybulkmodel.update", data={"id": 1, "name": "a"})
+
+        self.assertTrue(is_payload_key(key))
+        self.assertEqual(
+            key, get_idempotency_key("example.mybulkmodel", 1, "mybulkmodel.update", data={"name": "a", "id": 1})
+        )
+        self.assertNotEqual(
+            key, get_idempotency_key("example.mybulkmodel", 1, "mybulkmodel.update", data={"id": 1, "name": "b"})
+        )
+        self.assertFalse(is_payload_key(get_idempotency_key("example.mybulkmodel", 1, "mybulkmodel.update", "v1")))
+
+    @override_settings(DRF_MODEL_PUSHER_IDEMPOTENCY={})
+    def test_backends_use_the_version_field(self):
+        class MyVersionedBackend(PusherBackend):
+            serializer_class = MyBulkModelSerializer
+            idempotency_version_field = "name"
+
+            class Meta:
+                auto_register = False
+
+        backend = MyVersionedBackend()
+        instance = MyBulkModel(pk=1, name="v1")
+
+        self.assertEqual(
+            backend.get_idempotency_key("mybulkmodel.update", {"id": 1}, instance),
+            "example.mybulkmodel:1:mybulkmodel.update:v1",
+        )
+
+    def test_backends_skip_keys_when_disabled(self):
+        backend = MyBulkModelBackend()
+
+        self.assertIsNone(backend.get_idempotency_key("mybulkmodel.update", {"id": 1}, MyBulkModel(pk=1)))
+
+
+class TestDeduplication(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.settings = override_settings(DRF_MODEL_PUSHER_IDEMPOTENCY={"ttl": 60})
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_repeated_changes_are_sent_once(self, trigger_batch: Mock):
+        class MyVersionedBackend(MyBulkModelBackend):
+            serializer_class = MyBulkModelSerializer
+            idempotency_version_field = "name"
+
+            class Meta:
+                auto_register = False
+
+        instances = [MyBulkModel(pk=1, name="a"), MyBulkModel(pk=2, name="b")]
+
+        MyVersionedBackend().push_changes(PUSH_UPDATE, instances)
+        MyVersionedBackend().push_changes(PUSH_UPDATE, instances + [MyBulkModel(pk=3, name="c")])
+
+        self.assertEqual(trigger_batch.call_count, 2)
+        self.assertEqual([event["data"]["name"] for event in trigger_batch.call_args[0][0]], ["c"])
+        self.assertEqual(get_deduplicator().metrics[DEDUPLICATED], 2)
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_unversioned_changes_are_deduplicated_by_payload(self, trigger_batch: Mock):
+        push_model_changes(MyBulkModel, PUSH_UPDATE, [MyBulkModel(pk=1, name="a")])
+        push_model_changes(MyBulkModel, PUSH_UPDATE, [MyBulkModel(pk=1, name="a")])
+        push_model_changes(MyBulkModel, PUSH_UPDATE, [MyBulkModel(pk=1, name="b")])
+
+        self.assertEqual(trigger_batch.call_count, 2)
+        self.assertEqual(get_deduplicator().metrics[DEDUPLICATED], 1)
+
+    def test_payload_keys_are_claimed_for_payload_ttl(self):
+        deduplicator = Deduplicator(ttl=60, payload_ttl=5)
+        payload_key = get_idempotency_key("example.mybulkmodel", 1, "mybulkmodel.update", data={"id": 1})
+        versioned_key = get_idempotency_key("example.mybulkmodel", 2, "mybulkmodel.update", "v1")
+
+        with mock.patch.object(deduplicator.store, "claim_many", side_effect=lambda keys, ttl: keys) as claim_many:
+            items, keys = deduplicator.filter([(payload_key, "a", 1), (versioned_key, "a", 2)])
+
+        self.assertEqual(items, [1, 2])
+        self.assertEqual(sorted(call[0][1] for call in claim_many.call_args_list), [5, 60])
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_chunks_after_a_failure_are_released(self, trigger_batch: Mock):
+        provider = PusherProvider()
+        provider.idempotency_keys = ["key-1", "key-2", "key-3"]
+        packets = [(["my-channel"], "mybulkmodel.update", {"id": pk}) for pk in (1, 2, 3)]
+        trigger_batch.side_effect = [ValueError("Pusher is down"), None, None, None]
+
+        with override_settings(DRF_MODEL_PUSHER_BATCH_SIZE=1):
+            with self.assertRaises(ValueError):
+                provider.trigger_batch(packets)
+            provider.trigger_batch(packets)
+
+        self.assertEqual(trigger_batch.call_count, 4)
+        self.assertEqual(get_deduplicator().metrics[DEDUPLICATED], 0)
+
+    @mock.patch("pusher.Pusher.trigger")
+    def test_failed_sends_are_released(self, trigger: Mock):
+        provider = PusherProvider()
+        provider.idempotency_keys = ["example.mybulkmodel:1:mybulkmodel.update:v1"]
+        trigger.side_effect = [ValueError("Pusher is down"), None, None]
+
+        with self.assertRaises(ValueError):
+            provider.trigger(["my-channel"], "mybulkmodel.update", {"id": 1})
+        provider.trigger(["my-channel"], "mybulkmodel.update", {"id": 1})
+        provider.trigger(["my-channel", "other-channel"], "mybulkmodel.update", {"id": 1})
+
+        self.assertEqual(trigger.call_count, 3)
+        trigger.assert_called_with(["other-channel"], "mybulkmodel.update", {"id": 1}, None)
+
+    @mock.patch("pusher.Pusher.trigger")
+    def test_packets_without_keys_are_sent(self, trigger: Mock):
+        provider = PusherProvider()
+
+        provider.trigger(["my-channel"], "mybulkmodel.update", {"id": 1})
+        provider.trigger(["my-channel"], "mybulkmodel.update", {"id": 1})
+
+        self.assertEqual(trigger.call_count, 2)
+
+
+class TestRedisIdempotencyStore(TestCase):
+    def test_claims_each_key_once(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        deduplicator = Deduplicator(store=RedisIdempotencyStore, store_options={"client": fakeredis.FakeRedis()})
+
+        items, keys = deduplicator.filter([("key", "a", 1), ("key", "b", 2), ("key", "a", 3), (None, "a", 4)])
+        self.assertEqual(items, [1, 2, 4])
+
+        deduplicator.release(keys[:1])
+        self.assertEqual(deduplicator.filter([("key", "a", 1), ("key", "b", 2)])[0], [1])
+        self.assertEqual(deduplicator.metrics[DEDUPLICATED], 2)
@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+from drf_model_pusher.lanes import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, PriorityLanes
+
+
+class TestPriorityLanes(TestCase):
+    def test_lanes_served_by_weight(self):
+        lanes = PriorityLanes(weights={PRIORITY_HIGH: 2, PRIORITY_NORMAL: 1, PRIORITY_LOW: 1})
+        for i in range(3):
+            lanes.put(("update", i), lane=PRIORITY_LOW)
+        for i in range(3):
+            lanes.put(("create", i), lane=PRIORITY_HIGH)
+
+        order = [item for item, lane in lanes.get_batch(6)]
+
+        self.assertEqual(
+            order,
+            [("create", 0), ("create", 1), ("update", 0), ("create", 2), ("update", 1), ("update", 2)],
+        )
+
+    def test_low_priority_items_coalesced(self):
+        lanes = PriorityLanes()
+        lanes.put("first", lane=PRIORITY_LOW, coalesce_key="a")
+        lanes.put("second", lane=PRIORITY_LOW, coalesce_key="a")
+
+        self.assertEqual(lanes.get_batch(10), [("second", PRIORITY_LOW)])
+        self.assertEqual(lanes.snapshot()[PRIORITY_LOW]["coalesced"], 1)
+
+    def test_low_priority_items_shed_when_full(self):
+        lanes = PriorityLanes(max_size=2)
+        lanes.put("update-1", lane=PRIORITY_LOW)
+        lanes.put("update-2", lane=PRIORITY_LOW)
+        lanes.put("create", lane=PRIORITY_HIGH)
+        lanes.put("update-3", lane=PRIORITY_LOW)
+
+        self.assertEqual(
+            lanes.get_batch(10), [("create", PRIORITY_HIGH), ("update-3", PRIORITY_LOW)]
+        )
+        self.assertEqual(lanes.snapshot()[PRIORITY_LOW]["shed"], 2)
+
+    def test_high_priority_items_are_not_shed(self):
+        lanes = PriorityLanes(max_size=1)
+        lanes.put("create-1", lane=PRIORITY_HIGH)
+
+        self.assertFalse(lanes.put("create-2", lane=PRIORITY_HIGH, timeout=0.01))
+        self.assertFalse(lanes.put("update", lane=PRIORITY_LOW, timeout=0.01))
+
+    def test_latency_recorded_per_lane(self):
+        lanes = PriorityLanes()
+        lanes.put("create", lane=PRIORITY_HIGH)
+        lanes.get()
+
+        snapshot = lanes.snapshot()
+        self.assertEqual(snapshot[PRIORITY_HIGH]["sent"], 1)
+        self.assertIsNotNone(snapshot[PRIORITY_HIGH]["p95"])
+        self.assertIsNone(snapshot[PRIORITY_LOW]["p95"])
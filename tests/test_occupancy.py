@@ -0,0 +1,285 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+from unittest.mock import Mock
+
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+from pytest import mark
+
+from drf_model_pusher.occupancy import (
+    CacheOccupancyStore,
+    DatabaseOccupancyStore,
+    OccupancyTable,
+    RedisOccupancyStore,
+    get_channels_occupancy,
+    get_occupancy_table,
+    get_occupied_cache_key,
+    set_channels_occupancy,
+)
+from drf_model_pusher.models import ChannelOccupancy
+from drf_model_pusher.providers import PusherProvider
+
+
+class TestOccupancyTable(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "occupancy")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_state_is_shared_between_mappings(self):
+        writer = OccupancyTable(self.path, slots=64)
+        reader = OccupancyTable(self.path, slots=64)
+
+        writer.set("occupied", True)
+        writer.set("vacated", False)
+
+        self.assertTrue(reader.get("occupied"))
+        self.assertFalse(reader.get("vacated"))
+        self.assertIsNone(reader.get("unknown"))
+        writer.close()
+        reader.close()
+
+    def test_entries_expire(self):
+        table = OccupancyTable(self.path, slots=64, ttl=10)
+        table.set("channel", True, ttl=-1)
+
+        self.assertIsNone(table.get("channel"))
+        table.close()
+
+    def test_expired_slots_are_reused_when_full(self):
+        table = OccupancyTable(self.path, slots=2)
+        self.assertEqual(table.set_many(["a", "b"], True, ttl=-1), [])
+
+        self.assertEqual(table.set_many(["c", "d"], True), [])
+        self.assertEqual(table.set_many(["e"], True), ["e"])
+        self.assertTrue(table.get("c"))
+        self.assertTrue(table.get("d"))
+        table.close()
+
+    def test_reused_slots_are_invalidated_before_the_expiry_is_written(self):
+        table = OccupancyTable(self.path, slots=1)
+        table.set("a", True, ttl=-1)
+        writes = []
+        write = table._write
+
+        def record(offset, data):
+            # The old key must never be live while the slot is rewritten
+            writes.append(table.get("a"))
+            write(offset, data)
+
+        with mock.patch.object(table, "_write", side_effect=record):
+            self.assertTrue(table.set("b", False))
+
+        self.assertEqual(writes, [None, None, None])
+        self.assertIsNone(table.get("a"))
+        self.assertFalse(table.get("b"))
+        table.close()
+
+
+class TestSharedOccupancyTable(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            DRF_MODEL_PUSHER_WEBHOOK_OPTIMISATION_ENABLED=True,
+            DRF_MODEL_PUSHER_OCCUPANCY_TABLE=os.path.join(self.directory.name, "occupancy"),
+        )
+        self.settings.enable()
+        cache.clear()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.directory.cleanup()
+
+    def test_lookups_are_served_from_the_table(self):
+        set_channels_occupancy(["my-channel"], True)
+
+        with mock.patch("drf_model_pusher.occupancy.cache.get_many") as cache_get_many:
+            self.assertEqual(get_channels_occupancy(["my-channel"]), {"my-channel": True})
+
+        self.assertFalse(cache_get_many.called)
+
+    def test_cache_hits_are_copied_into_the_table(self):
+        cache.set(get_occupied_cache_key("my-channel"), True)
+
+        self.assertEqual(get_channels_occupancy(["my-channel"]), {"my-channel": True})
+        self.assertTrue(get_occupancy_table().get(get_occupied_cache_key("my-channel")))
+
+    @mock.patch("pusher.Pusher.channels_info")
+    @mock.patch("pusher.Pusher.trigger")
+    def test_unoccupied_channels_are_only_synced_once(self, trigger: Mock, channels_info: Mock):
+        channels_info.return_value = {"channels": {}}
+
+        PusherProvider().trigger(["my-channel"], "myevent", {"foo": "bar"})
+        PusherProvider().trigger(["my-channel"], "myevent", {"foo": "bar"})
+
+        self.assertEqual(channels_info.call_count, 1)
+        self.assertFalse(trigger.called)
+
+    @override_settings(DRF_MODEL_PUSHER_OCCUPANCY_TABLE="/nonexistent/occupancy")
+    def test_falls_back_to_the_cache_when_unavailable(self):
+        set_channels_occupancy(["my-channel"], True)
+
+        self.assertIsNone(get_occupancy_table())
+        self.assertEqual(get_channels_occupancy(["my-channel"]), {"my-channel": True})
+
+
+class OccupancyStoreTests(object):
+    """Behaviour shared by every OccupancyStore"""
+
+    def get_store(self, **kwargs):
+        raise NotImplementedError
+
+    def test_unknown_channels(self):
+        self.assertEqual(self.get_store().get_many(["a"]), {"a": None})
+
+    def test_set_many(self):
+        store = self.get_store()
+        store.set_many(["a", "b"], True)
+        store.set_many(["b"], False)
+
+        self.assertEqual(store.get_many(["a", "b", "c"]), {"a": True, "b": False, "c": None})
+
+    def test_apps_are_separate(self):
+        store = self.get_store()
+        store.set_many(["a"], True, app="app-a")
+
+        self.assertEqual(store.get_many(["a"], app="app-a"), {"a": True})
+        self.assertEqual(store.get_many(["a"], app="app-b"), {"a": None})
+
+    def test_replace_swaps_occupied_channels(self):
+        store = self.get_store()
+        store.set_many(["a", "b"], True)
+        store.replace(["b", "c"])
+
+        self.assertEqual(store.get_many(["a", "b", "c"]), {"a": False, "b": True, "c": True})
+
+
+class TestCacheOccupancyStore(OccupancyStoreTests, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def get_store(self, **kwargs):
+        return CacheOccupancyStore(**kwargs)
+
+    def test_set_many_uses_channel_cache_keys(self):
+        CacheOccupancyStore().set_many(["a"], True, app="app-a")
+
+        self.assertTrue(cache.get(get_occupied_cache_key("a", "app-a")))
+
+    def test_replace_marks_channels_occupied(self):
+        store = CacheOccupancyStore()
+        store.replace(["a"])
+
+        self.assertEqual(store.get_many(["a", "b"]), {"a": True, "b": False})
+
+    def test_sync_expires(self):
+        store = CacheOccupancyStore(timeout=-1)
+        store.replace(["a"])
+
+        self.assertEqual(store.get_many(["a", "b"]), {"a": None, "b": None})
+
+    def test_replace_vacates_channels_no_longer_occupied(self):
+        store = CacheOccupancyStore()
+        store.set_many(["a", "b"], True)
+        store.set_many(["c"], True, app="app-a")
+        store.replace(["b", "d"])
+
+        self.assertEqual(store.get_many(["a", "b", "d", "e"]), {"a": False, "b": True, "d": True, "e": False})
+        self.assertEqual(store.get_many(["c", "e"], app="app-a"), {"c": True, "e": None})
+
+        store.set_many(["d"], False)
+        store.replace(["b"])
+        self.assertEqual(store.get_many(["d"]), {"d": False})
+
+
+class TestRedisOccupancyStore(OccupancyStoreTests, TestCase):
+    def get_store(self, **kwargs):
+        fakeredis = pytest.importorskip("fakeredis")
+        self.client = getattr(self, "client", None) or fakeredis.FakeRedis()
+        return RedisOccupancyStore(client=self.client, **kwargs)
+
+    def test_lookups_are_a_single_round_trip(self):
+        store = self.get_store()
+        store.replace(["a"])
+
+        with mock.patch.object(self.client, "execute_command", wraps=self.client.execute_command) as execute, \
+                mock.patch.object(self.client, "pipeline", wraps=self.client.pipeline) as pipeline:
+            self.assertEqual(store.get_many(["a", "b"]), {"a": True, "b": False})
+
+        self.assertFalse(execute.called)
+        pipeline.assert_called_once_with(transaction=False)
+
+    def test_channels_expire_on_their_own(self):
+        store = self.get_store(timeout=60)
+        store.set_many(["a"], True, timeout=None)
+        store.set_many(["b"], True, timeout=-1)
+
+        self.assertEqual(store.get_many(["a", "b"]), {"a": True, "b": None})
+        store.set_many(["c"], True)
+        self.assertEqual(self.client.zrange(store.get_key(), 0, -1), [b"c", b"a"])
+
+
+@mark.django_db
+class TestDatabaseOccupancyStore(OccupancyStoreTests, TestCase):
+    def get_store(self, **kwargs):
+        return DatabaseOccupancyStore(**kwargs)
+
+    def test_expired_rows_are_unknown(self):
+        store = self.get_store(timeout=-1)
+        store.set_many(["a"], True)
+
+        self.assertEqual(store.get_many(["a"]), {"a": None})
+
+    def test_set_many_updates_rows(self):
+        store = self.get_store()
+        store.set_many(["a"], True)
+        store.set_many(["a", "b"], False, timeout=None)
+
+        self.assertEqual(store.get_many(["a", "b"]), {"a": False, "b": False})
+        self.assertEqual(ChannelOccupancy.objects.filter(expires_at__isnull=True).count(), 2)
+
+
+@mark.django_db
+class TestProviderOccupancyStore(TestCase):
+    def setUp(self):
+        self.settings = override_settings(
+            DRF_MODEL_PUSHER_WEBHOOK_OPTIMISATION_ENABLED=True,
+            DRF_MODEL_PUSHER_OCCUPANCY_STORE="drf_model_pusher.occupancy.DatabaseOccupancyStore",
+        )
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+
+    @mock.patch("pusher.Pusher.channels_info")
+    @mock.patch("pusher.Pusher.trigger")
+    def test_synced_store_only_syncs_once(self, trigger: Mock, channels_info: Mock):
+        channels_info.return_value = {"channels": {"occupied": {}}}
+
+        PusherProvider().trigger(["occupied", "vacant"], "myevent", {"foo": "bar"})
+        PusherProvider().trigger(["occupied", "vacant"], "myevent", {"foo": "bar"})
+
+        self.assertEqual(channels_info.call_count, 1)
+        self.assertEqual(trigger.call_count, 2)
+        trigger.assert_called_with(["occupied"], "myevent", {"foo": "bar"}, None)
+
+
+class TestProviderCacheOccupancyStore(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(DRF_MODEL_PUSHER_WEBHOOK_OPTIMISATION_ENABLED=True)
+    @mock.patch("pusher.Pusher.channels_info")
+    @mock.patch("pusher.Pusher.trigger")
+    def test_synced_store_only_syncs_once(self, trigger: Mock, channels_info: Mock):
+        channels_info.return_value = {"channels": {"occupied": {}}}
+
+        for i in range(5):
+            PusherProvider().trigger(["vacant"], "myevent", {"foo": "bar"})
+
+        self.assertEqual(channels_info.call_count, 1)
+        self.assertFalse(trigger.called)
@@ -0,0 +1,93 @@
+from io import StringIO
+from unittest import TestCase, mock
+from unittest.mock import Mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+
+from drf_model_pusher.occupancy import get_channels_occupancy
+from drf_model_pusher.occupancy_sync import (
+    OccupancyRefresher,
+    ensure_occupancy_refresher,
+    stop_occupancy_refresher,
+    sync_occupancy,
+    warm_up_occupancy,
+)
+from drf_model_pusher.providers import PusherProvider
+
+PUSHER_APPS = {"app-a": {"app_id": "1", "key": "key-a", "secret": "secret-a"}}
+
+
+class TestOccupancySync(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(DRF_MODEL_PUSHER_APPS=PUSHER_APPS)
+    @mock.patch("pusher.Pusher.channels_info")
+    def test_sync_occupancy_syncs_every_app(self, channels_info: Mock):
+        channels_info.return_value = {"channels": {"my-channel": {}}}
+
+        synced = sync_occupancy()
+
+        self.assertEqual(synced, {None: {"my-channel"}, "app-a": {"my-channel"}})
+        self.assertEqual(get_channels_occupancy(["my-channel"], "app-a"), {"my-channel": True})
+
+    @mock.patch("pusher.Pusher.channels_info")
+    def test_command(self, channels_info: Mock):
+        channels_info.return_value = {"channels": {"my-channel": {}}}
+        stdout = StringIO()
+
+        call_command("pusher_sync_occupancy", stdout=stdout)
+
+        self.assertEqual(stdout.getvalue(), "Synced 1 occupied channels for the default app\n")
+        self.assertEqual(get_channels_occupancy(["my-channel"]), {"my-channel": True})
+
+    @override_settings(DRF_MODEL_PUSHER_WEBHOOK_OPTIMISATION_ENABLED=True, DRF_MODEL_PUSHER_OCCUPANCY_WARMUP=True)
+    @mock.patch("pusher.Pusher.channels_info")
+    def test_warm_up_logs_failures(self, channels_info: Mock):
+        channels_info.side_effect = ValueError("Pusher is down")
+
+        with self.assertLogs("drf_model_pusher.occupancy_sync", level="ERROR"):
+            warm_up_occupancy()
+
+        self.assertTrue(channels_info.called)
+
+    @override_settings(
+        DRF_MODEL_PUSHER_WEBHOOK_OPTIMISATION_ENABLED=True, DRF_MODEL_PUSHER_OCCUPANCY_REFRESH_INTERVAL=60
+    )
+    @mock.patch("pusher.Pusher.trigger")
+    @mock.patch("pusher.Pusher.channels_info")
+    def test_refresher_starts_on_first_occupancy_check(self, channels_info: Mock, trigger: Mock):
+        channels_info.return_value = {"channels": {}}
+        try:
+            with mock.patch("drf_model_pusher.occupancy_sync.OccupancyRefresher.start") as start:
+                warm_up_occupancy()
+                self.assertFalse(start.called)
+
+                PusherProvider().trigger(["my-channel"], "myevent", {"foo": "bar"})
+                start.assert_called_once_with()
+        finally:
+            stop_occupancy_refresher()
+
+    @mock.patch("pusher.Pusher.channels_info")
+    def test_refresher_syncs_periodically(self, channels_info: Mock):
+        refresher = OccupancyRefresher(interval=0.01)
+        with mock.patch("drf_model_pusher.occupancy_sync.sync_occupancy") as sync, \
+                mock.patch("drf_model_pusher.occupancy_sync.close_old_connections") as close_old_connections:
+            sync.side_effect = lambda apps: refresher.stop()
+            refresher.start()
+            refresher.join(timeout=1)
+
+        self.assertFalse(refresher.is_alive())
+        sync.assert_called_once_with(None)
+        self.assertEqual(close_old_connections.call_count, 2)
+
+    @override_settings(DRF_MODEL_PUSHER_OCCUPANCY_REFRESH_INTERVAL=60)
+    def test_one_refresher_per_process(self):
+        try:
+            refresher = ensure_occupancy_refresher()
+            self.assertTrue(refresher.is_alive())
+            self.assertIs(ensure_occupancy_refresher(), refresher)
+        finally:
+            stop_occupancy_refresher()
@@ -4,7 +4,12 @@ from unittest.mock import Mock
 from django.core.cache import cache
 from django.test import override_settings
 
-from drf_model_pusher.providers import PusherProvider
+from drf_model_pusher.providers import (
+    ConsistentHashRing,
+    PusherProvider,
+    ShardedPusherProvider,
+    get_occupied_cache_key,
+)
 
 
 class TestPusherProvider(TestCase):
@@ -45,3 +50,60 @@ class TestPusherProvider(TestCase):
         provider.trigger(["my-channel"], "myevent", {"foo": "bar"})
 
         self.assertTrue(cache.get("drf-model-pusher:occupied:my-channel"))
+
+
+PUSHER_APPS = {
+    "app-a": {"app_id": "1", "key": "key-a", "secret": "secret-a"},
+    "app-b": {"app_id": "2", "key": "key-b", "secret": "secret-b"},
+}
+
+
+def route_by_prefix(channel):
+    return "app-a" if channel.startswith("a-") else "app-b"
+
+
+class TestShardedPusherProvider(TestCase):
+    def setUp(self):
+        self.settings = override_settings(DRF_MODEL_PUSHER_APPS=PUSHER_APPS)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        cache.clear()
+
+    def test_hash_ring_is_stable(self):
+        ring = ConsistentHashRing(["app-a", "app-b"])
+        nodes = {ring.get_node("channel-{0}".format(i)) for i in range(100)}
+
+        self.assertEqual(nodes, {"app-a", "app-b"})
+        self.assertEqual(ring.get_node("channel-1"), ConsistentHashRing(["app-b", "app-a"]).get_node("channel-1"))
+
+    @override_settings(DRF_MODEL_PUSHER_APP_ROUTER="tests.test_providers.route_by_prefix")
+    @mock.patch("pusher.Pusher.trigger", autospec=True)
+    def test_channels_grouped_by_app(self, trigger: Mock):
+        provider = ShardedPusherProvider()
+        provider.trigger(["a-1", "b-1", "a-2"], "myevent", {"foo": "bar"})
+
+        sent = {call[0][0]._pusher_client.key: call[0][1] for call in trigger.call_args_list}
+        self.assertEqual(sent, {"key-a": ["a-1", "a-2"], "key-b": ["b-1"]})
+
+    def test_clients_are_pooled_per_app(self):
+        provider = ShardedPusherProvider()
+
+        self.assertIs(
+            provider.get_app_provider("app-a").client, ShardedPusherProvider().get_app_provider("app-a").client
+        )
+        self.assertIsNot(provider.get_app_provider("app-a").client, provider.get_app_provider("app-b").client)
+
+    @override_settings(
+        DRF_MODEL_PUSHER_APP_ROUTER="tests.test_providers.route_by_prefix",
+        DRF_MODEL_PUSHER_WEBHOOK_OPTIMISATION_ENABLED=True,
+    )
+    @mock.patch("pusher.Pusher.trigger")
+    def test_occupancy_cached_per_app(self, trigger: Mock):
+        cache.set(get_occupied_cache_key("a-1", "app-a"), True)
+        cache.set(get_occupied_cache_key("b-1", "app-b"), False)
+
+        ShardedPusherProvider().trigger(["a-1", "b-1"], "myevent", {"foo": "bar"})
+
+        trigger.assert_called_once_with(["a-1"], "myevent", {"foo": "bar"}, None)
@@ -0,0 +1,156 @@
+import io
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+from unittest.mock import Mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import override_settings
+
+from drf_model_pusher.publisher import (
+    PublisherClient,
+    PublisherServer,
+    SocketPublisherProvider,
+    encode_frame,
+    get_socket_path,
+    read_frame,
+)
+from drf_model_pusher.providers import PusherProvider
+from drf_model_pusher.receivers import get_provider_class
+
+
+class TestFraming(TestCase):
+    def test_frames_round_trip(self):
+        stream = io.BytesIO(
+            encode_frame([(["a"], "x.update", {"id": 1})], "1.2", "low") + encode_frame([(["b"], "x.delete", {})])
+        )
+
+        self.assertEqual(read_frame(stream), [[["a"], "x.update", {"id": 1}, "1.2", "low"]])
+        self.assertEqual(read_frame(stream), [[["b"], "x.delete", {}, None, None]])
+        self.assertIsNone(read_frame(stream))
+
+
+class TestPublisherServer(TestCase):
+    def setUp(self):
+        self.socket_path = os.path.join(tempfile.mkdtemp(), "publisher.sock")
+        self.provider_class = Mock()
+        self.server = PublisherServer(self.socket_path, provider_class=self.provider_class, flush_interval=0.01)
+        self.server.start()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+
+    def wait_until_sent(self, count):
+        deadline = time.monotonic() + 2
+        while self.server.sent < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_packets_from_many_clients_are_batched(self):
+        for i in range(3):
+            PublisherClient(self.socket_path).send([(["channel-{0}".format(i)], "x.update", {"i": i})])
+
+        self.wait_until_sent(3)
+
+        trigger_batch = self.provider_class.return_value.trigger_batch
+        packets = [packet for call in trigger_batch.call_args_list for packet in call[0][0]]
+        self.assertEqual(sorted(packets), [(["channel-{0}".format(i)], "x.update", {"i": i}) for i in range(3)])
+
+    def test_packets_grouped_by_socket_id(self):
+        client = PublisherClient(self.socket_path)
+        client.send([(["a"], "x.update", {})], "1.1")
+        client.send([(["b"], "x.update", {})], "1.1")
+
+        self.wait_until_sent(2)
+
+        calls = self.provider_class.return_value.trigger_batch.call_args_list
+        self.assertTrue(all(call[0][1] == "1.1" for call in calls))
+
+    def test_existing_paths_are_not_replaced(self):
+        server = PublisherServer(self.socket_path, provider_class=self.provider_class)
+
+        with self.assertRaises(ImproperlyConfigured):
+            server.start()
+        server.stop()
+        self.assertTrue(os.path.exists(self.socket_path))
+
+    def test_failed_reconnects_are_forgotten(self):
+        client = PublisherClient(self.socket_path)
+        client.send([(["a"], "x.update", {})])
+        broken = mock.Mock(**{"sendall.side_effect": BrokenPipeError})
+        client._local.sock = broken
+
+        with mock.patch("socket.socket.connect", side_effect=ConnectionRefusedError), \
+                self.assertRaises(ConnectionRefusedError):
+            client.send([(["a"], "x.update", {})])
+
+        self.assertIsNone(client._local.sock)
+
+
+class TestPublisherSocketPath(TestCase):
+    def test_directory_is_created_private(self):
+        socket_path = os.path.join(tempfile.mkdtemp(), "run", "publisher.sock")
+        server = PublisherServer(socket_path, provider_class=Mock())
+        server.start()
+        server.stop()
+
+        self.assertEqual(os.stat(os.path.dirname(socket_path)).st_mode & 0o777, 0o700)
+        self.assertFalse(os.path.exists(socket_path))
+
+    def test_shared_directories_are_refused(self):
+        directory = tempfile.mkdtemp()
+        os.chmod(directory, 0o777)
+
+        with self.assertRaises(ImproperlyConfigured):
+            PublisherServer(os.path.join(directory, "publisher.sock"), provider_class=Mock()).start()
+
+    def test_defaults_to_the_runtime_directory(self):
+        with mock.patch.dict(os.environ, {"XDG_RUNTIME_DIR": "/run/user/1000"}):
+            self.assertEqual(get_socket_path(), "/run/user/1000/drf-model-pusher/publisher.sock")
+
+        with mock.patch.dict(os.environ, clear=True), self.assertRaises(ImproperlyConfigured):
+            get_socket_path()
+
+
+class TestSocketPublisherProvider(TestCase):
+    @override_settings(DRF_MODEL_PUSHER_PUBLISHER_ENABLED=True)
+    def test_pusher_provider_routed_through_publisher(self):
+        self.assertIs(get_provider_class(PusherProvider), SocketPublisherProvider)
+        self.assertIs(get_provider_class(Mock), Mock)
+
+    @override_settings(DRF_MODEL_PUSHER_PUBLISHER_SOCKET="/nonexistent/publisher.sock")
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_falls_back_to_pusher_when_unavailable(self, trigger_batch: Mock):
+        SocketPublisherProvider().trigger(["my-channel"], "myevent", {"foo": "bar"})
+
+        trigger_batch.assert_called_once_with([{"channel": "my-channel", "name": "myevent", "data": {"foo": "bar"}}])
+
+
+class TestPublisherServerLanes(TestCase):
+    def test_updates_coalesced_by_id(self):
+        server = PublisherServer("publisher.sock", provider_class=Mock())
+        server.enqueue([["a"], "x.update", {"id": 1, "v": 1}, None, "low"])
+        server.enqueue([["a"], "x.update", {"id": 1, "v": 2}, None, "low"])
+        server.enqueue([["a"], "x.create", {"id": 2}, None, "high"])
+
+        self.assertEqual(
+            server.drain(),
+            [((["a"], "x.create", {"id": 2}, None), "high"), ((["a"], "x.update", {"id": 1, "v": 2}, None), "low")],
+        )
+
+    def test_packets_are_published_by_lane(self):
+        provider = Mock()
+        priorities = []
+        provider.trigger_batch.side_effect = lambda packets, socket_id: priorities.append(provider.priority)
+        server = PublisherServer("publisher.sock", provider_class=Mock(return_value=provider))
+        server.enqueue([["a"], "x.update", {"id": 1}, None, "low"])
+        server.enqueue([["a"], "x.create", {"id": 2}, None, "high"])
+
+        server.publish(server.drain())
+
+        self.assertEqual(priorities, ["high", "low"])
+        provider.trigger_batch.assert_called_with([(["a"], "x.update", {"id": 1})], None)
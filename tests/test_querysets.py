@@ -0,0 +1,165 @@
+from unittest import TestCase, mock
+from unittest.mock import Mock
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from pytest import mark
+
+from drf_model_pusher.config import connect_pusher_models, disconnect_pusher_models
+from drf_model_pusher.querysets import PusherQuerySet
+from example.models import MyBulkModel, MyChildModel, MyParentModel
+
+
+def batch_events(trigger_batch: Mock):
+    """Return every event sent across all trigger_batch calls"""
+    return [event for call in trigger_batch.call_args_list for event in call[0][0]]
+
+
+@mark.django_db
+class TestPusherQuerySet(TestCase):
+    def tearDown(self):
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            MyBulkModel.objects.all().delete()
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_bulk_create_is_pushed_in_batches(self, trigger_batch: Mock):
+        MyBulkModel.objects.bulk_create([MyBulkModel(name=str(i)) for i in range(15)])
+
+        self.assertEqual(trigger_batch.call_count, 2)
+        events = batch_events(trigger_batch)
+        self.assertEqual(len(events), 15)
+        self.assertEqual(
+            events[0], {"channel": "bulk-channel", "name": "mybulkmodel.create", "data": {"name": "0"}}
+        )
+
+    @override_settings(DRF_MODEL_PUSHER_CHUNK_SIZE=2)
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_update_pushes_updated_rows(self, trigger_batch: Mock):
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            MyBulkModel.objects.bulk_create([MyBulkModel(name=str(i)) for i in range(3)])
+
+        MyBulkModel.objects.filter(name__in=["0", "1", "2"]).update(name="updated")
+
+        self.assertEqual(trigger_batch.call_count, 2)
+        events = batch_events(trigger_batch)
+        self.assertEqual([event["name"] for event in events], ["mybulkmodel.update"] * 3)
+        self.assertEqual([event["data"] for event in events], [{"name": "updated"}] * 3)
+
+    @mock.patch("drf_model_pusher.querysets.get_models_pusher_backends", return_value=())
+    def test_models_without_backends_are_not_read(self, get_models_pusher_backends: Mock):
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            MyBulkModel.objects.bulk_create([MyBulkModel(name=str(i)) for i in range(3)])
+
+        with CaptureQueriesContext(connection) as queries:
+            MyBulkModel.objects.all().update(name="updated")
+            MyBulkModel.objects.bulk_update(list(MyBulkModel.objects.all()), ["name"])
+            MyBulkModel.objects.all().delete()
+
+        self.assertEqual([query["sql"].split()[0] for query in queries], ["UPDATE", "SELECT", "UPDATE", "DELETE"])
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_delete_pushes_deleted_rows(self, trigger_batch: Mock):
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            MyBulkModel.objects.bulk_create([MyBulkModel(name="a"), MyBulkModel(name="b")])
+        pks = list(MyBulkModel.objects.order_by("pk").values_list("pk", flat=True))
+
+        MyBulkModel.objects.all().delete()
+
+        events = batch_events(trigger_batch)
+        self.assertEqual([event["data"] for event in events], [{"id": pk} for pk in pks])
+        self.assertFalse(MyBulkModel.objects.exists())
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_delete_loads_only_delete_fields(self, trigger_batch: Mock):
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            MyBulkModel.objects.bulk_create([MyBulkModel(name="a")])
+
+        with mock.patch.object(PusherQuerySet, "only", autospec=True, side_effect=PusherQuerySet.only) as only:
+            MyBulkModel.objects.all().delete()
+
+        only.assert_called_once_with(mock.ANY, "pk")
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_serialized_deletes(self, trigger_batch: Mock):
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            MyBulkModel.objects.bulk_create([MyBulkModel(name="a")])
+
+        with mock.patch("example.pusher_backends.MyBulkModelBackend.serialize_deletes", True):
+            MyBulkModel.objects.all().delete()
+
+        self.assertEqual([event["data"] for event in batch_events(trigger_batch)], [{"name": "a"}])
+
+
+@mark.django_db
+class TestPusherQuerySetRelatedHints(TestCase):
+    def setUp(self):
+        self.parent = MyParentModel.objects.create(name="parent")
+
+    def tearDown(self):
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            MyChildModel.objects.all().delete()
+        MyParentModel.objects.all().delete()
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_bulk_create_reloads_each_chunk_once(self, trigger_batch: Mock):
+        children = [MyChildModel(name=str(i), parent_id=self.parent.pk) for i in range(5)]
+
+        with CaptureQueriesContext(connection) as queries:
+            MyChildModel.objects.bulk_create(children)
+
+        # The insert and a single query for the parents
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(
+            [event["data"] for event in batch_events(trigger_batch)],
+            [{"name": str(i), "parent_name": "parent"} for i in range(5)],
+        )
+
+    @override_settings(DRF_MODEL_PUSHER_CHUNK_SIZE=2)
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_update_fetches_rows_with_related_objects(self, trigger_batch: Mock):
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            MyChildModel.objects.bulk_create([MyChildModel(name=str(i), parent=self.parent) for i in range(3)])
+
+        with CaptureQueriesContext(connection) as queries:
+            MyChildModel.objects.all().update(name="updated")
+
+        # The pks, the update and one fetch per chunk
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(
+            [event["data"] for event in batch_events(trigger_batch)],
+            [{"name": "updated", "parent_name": "parent"}] * 3,
+        )
+
+
+@mark.django_db
+class TestModelSignals(TestCase):
+    def setUp(self):
+        connect_pusher_models(MyBulkModel)
+
+    def tearDown(self):
+        disconnect_pusher_models(MyBulkModel)
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            MyBulkModel.objects.all().delete()
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_saves_are_pushed(self, trigger_batch: Mock):
+        instance = MyBulkModel.objects.create(name="Henry")
+        instance.name = "Julie"
+        instance.save()
+
+        events = batch_events(trigger_batch)
+        self.assertEqual(
+            [(event["name"], event["data"]) for event in events],
+            [("mybulkmodel.create", {"name": "Henry"}), ("mybulkmodel.update", {"name": "Julie"})],
+        )
+
+    @mock.patch("pusher.Pusher.trigger_batch")
+    def test_deletes_are_pushed(self, trigger_batch: Mock):
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            instance = MyBulkModel.objects.create(name="Henry")
+
+        instance.delete()
+
+        events = batch_events(trigger_batch)
+        self.assertEqual([event["name"] for event in events], ["mybulkmodel.delete"])
@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import TestCase, mock
+from unittest.mock import Mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+
+from drf_model_pusher.dispatch import PusherDispatcher
+from drf_model_pusher.providers import PusherProvider
+from drf_model_pusher.recording import (
+    RecordingProvider,
+    StandInPusher,
+    StandInPusherProvider,
+    read_recording,
+    replay_recording,
+    restore_packet,
+)
+
+
+class TestRecording(TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "recording.log")
+
+    def record(self, **options):
+        with override_settings(DRF_MODEL_PUSHER_RECORDING=dict(path=self.path, **options)):
+            provider = RecordingProvider(PusherProvider())
+            provider.priority = "low"
+            with mock.patch("pusher.Pusher.trigger") as trigger, mock.patch("pusher.Pusher.trigger_batch"):
+                provider.trigger(["a", "b"], "mymodel.update", {"name": "Henry"})
+                provider.trigger_batch([(["c"], "mymodel.create", {"name": "Julie"})])
+        return trigger
+
+    def test_triggers_are_recorded_and_sent(self):
+        trigger = self.record(redact=False)
+
+        trigger.assert_called_once_with(["a", "b"], "mymodel.update", {"name": "Henry"}, None)
+        records = read_recording(self.path)
+        self.assertEqual([record[1:] for record in records], [
+            ("t", "low", [[["a", "b"], "mymodel.update", 16, {"name": "Henry"}]]),
+            ("b", "low", [[["c"], "mymodel.create", 16, {"name": "Julie"}]]),
+        ])
+
+    def test_payloads_are_redacted_by_default(self):
+        self.record()
+
+        packet = read_recording(self.path)[0][3][0]
+        self.assertIsNone(packet[3])
+        channels, event_name, data = restore_packet(*packet)
+        self.assertEqual(len(json.dumps(data, separators=(",", ":"))), 16)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+    @mock.patch("pusher.Pusher.trigger")
+    def test_every_provider_is_wrapped(self, trigger: Mock):
+        with override_settings(DRF_MODEL_PUSHER_RECORDING={"path": self.path}):
+            provider = PusherDispatcher().get_provider(PusherProvider, priority="high")
+            provider.trigger(["a"], "mymodel.update", {"name": "Henry"})
+
+        self.assertIsInstance(provider, RecordingProvider)
+        self.assertEqual(provider.provider.priority, "high")
+        self.assertTrue(trigger.called)
+        self.assertEqual(read_recording(self.path)[0][2], "high")
+
+    def test_triggers_are_sampled(self):
+        self.record(sample_rate=0.0)
+
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TestReplay(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.path = os.path.join(tempfile.mkdtemp(), "recording.log")
+        with open(self.path, "w") as f:
+            f.write('[100.2,"b",null,[[["c"],"x.create",2,{}],[["d","e"],"x.create",2,{}]]]\n')
+            f.write('[100.0,"t","high",[[["a","b"],"x.update",2,{}]]]\n')
+
+    def test_replay_keeps_recorded_timing(self):
+        stand_in = StandInPusher()
+
+        stats = replay_recording(read_recording(self.path), lambda: StandInPusherProvider(stand_in=stand_in))
+
+        self.assertEqual((stats["triggers"], stats["packets"]), (2, 3))
+        self.assertGreaterEqual(stats["duration"], 0.2)
+        self.assertEqual((stand_in.requests, stand_in.events), (2, 5))
+
+    def test_command_reports_throughput_and_latency(self):
+        stdout = StringIO()
+
+        call_command("pusher_replay", self.path, "--speed", "0", "--workers", "2", stdout=stdout)
+
+        lines = stdout.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("Replayed 2 triggers of 3 packets"))
+        self.assertTrue(lines[1].startswith("The stand-in received 2 requests of 5 events"))
+        self.assertTrue(lines[2].startswith("Latency p50"))
+
+    @override_settings(DRF_MODEL_PUSHER_WEBHOOK_OPTIMISATION_ENABLED=True)
+    def test_recorded_channels_are_occupied_for_the_stand_in(self):
+        stdout = StringIO()
+
+        call_command("pusher_replay", self.path, "--speed", "0", stdout=stdout)
+
+        self.assertTrue(stdout.getvalue().splitlines()[1].startswith("The stand-in received 2 requests of 5 events"))
+
+    def test_command_replays_through_a_provider(self):
+        provider_class = Mock()
+
+        with mock.patch("drf_model_pusher.management.commands.pusher_replay.import_string") as import_string:
+            import_string.return_value = provider_class
+            call_command("pusher_replay", self.path, "--speed", "0", "--provider", "my.Provider", stdout=StringIO())
+
+        provider_class.return_value.trigger.assert_called_once_with(["a", "b"], "x.update", {})
+        self.assertTrue(provider_class.return_value.trigger_batch.called)
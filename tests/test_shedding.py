@@ -0,0 +1,110 @@
+from unittest import TestCase, mock
+from unittest.mock import Mock
+
+from django.test import override_settings
+
+from drf_model_pusher.lanes import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL
+from drf_model_pusher.providers import PusherProvider, ShardedPusherProvider
+from drf_model_pusher.shedding import OverloadController, get_overload_controller, get_shedding_level
+
+
+class TestOverloadController(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("drf_model_pusher.shedding.time.monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_level_rises_with_latency_and_recovers(self):
+        controller = OverloadController(latency=(0.5, 1.0), recovery_time=5, window=10)
+
+        controller.record_latency(1.5)
+        self.assertEqual(controller.level, 2)
+
+        # The slow publish leaves the window, then the level falls one step per recovery time
+        self.now += 11
+        self.assertEqual(controller.update(), 2)
+        self.now += 5
+        self.assertEqual(controller.update(), 1)
+        self.now += 5
+        self.assertEqual(controller.update(), 0)
+
+    def test_level_rises_with_backlog(self):
+        controller = OverloadController(backlog=(10, 100))
+
+        controller.record_backlog(50)
+
+        self.assertEqual(controller.snapshot()["level"], 1)
+
+    def test_sheds_by_priority(self):
+        controller = OverloadController(backlog=(1,), sample_rates={1: {PRIORITY_LOW: 0.0}})
+        controller.record_backlog(1)
+        send = Mock()
+
+        self.assertEqual(controller.filter_channels(["a"], "model.create", {}, None, PRIORITY_LOW, send), [])
+        self.assertEqual(controller.filter_channels(["a"], "model.create", {}, None, PRIORITY_NORMAL, send), ["a"])
+        self.assertEqual(controller.filter_channels(["a"], "model.create", {}, None, PRIORITY_HIGH, send), ["a"])
+        self.assertEqual(controller.snapshot()["shed"], 1)
+
+    def test_updates_are_coalesced(self):
+        controller = OverloadController(backlog=(1, 2), sample_rates={}, coalesce_level=2)
+        controller.record_backlog(2)
+        send = Mock()
+
+        with mock.patch("drf_model_pusher.shedding.threading.Thread") as thread:
+            controller.filter_channels(["a"], "model.update", {"id": 1, "v": 1}, None, None, send)
+            self.assertEqual(controller.filter_channels(["a"], "model.update", {"id": 1, "v": 2}, None, None, send), [])
+            self.assertEqual(controller.filter_channels(["b"], "model.update", {"id": 1, "v": 2}, None, None, send), [])
+            self.assertEqual(controller.filter_channels(["a"], "model.create", {"id": 2}, None, None, send), ["a"])
+
+        # A single flusher sends every coalesced event
+        self.assertEqual(thread.call_count, 1)
+        self.assertEqual(controller.flush_coalesced(), 2)
+        send.assert_has_calls(
+            [
+                mock.call(["a"], "model.update", {"id": 1, "v": 2}, None),
+                mock.call(["b"], "model.update", {"id": 1, "v": 2}, None),
+            ]
+        )
+
+
+class TestProviderShedding(TestCase):
+    @override_settings(DRF_MODEL_PUSHER_SHEDDING={"backlog": (0,), "sample_rates": {1: {PRIORITY_NORMAL: 0.0}}})
+    @mock.patch("pusher.Pusher.trigger")
+    def test_provider_sheds_events(self, trigger: Mock):
+        provider = PusherProvider()
+        provider.trigger(["my-channel"], "model.create", {"foo": "bar"})
+
+        self.assertFalse(trigger.called)
+        self.assertEqual(get_shedding_level(), 1)
+
+        provider.priority = PRIORITY_HIGH
+        provider.trigger(["my-channel"], "model.create", {"foo": "bar"})
+        self.assertTrue(trigger.called)
+
+    @override_settings(
+        DRF_MODEL_PUSHER_APPS={"app-a": {"app_id": "1", "key": "key-a", "secret": "secret-a"}},
+        DRF_MODEL_PUSHER_SHEDDING={
+            "backlog": (0, 0, 0),
+            "sample_rates": {3: {PRIORITY_LOW: 0.0, PRIORITY_NORMAL: 0.0}},
+        },
+    )
+    @mock.patch("pusher.Pusher.trigger_batch")
+    @mock.patch("pusher.Pusher.trigger")
+    def test_sharded_provider_keeps_priority(self, trigger: Mock, trigger_batch: Mock):
+        get_overload_controller().update()
+        self.assertEqual(get_shedding_level(), 3)
+
+        provider = ShardedPusherProvider()
+        provider.trigger(["my-channel"], "model.update", {"foo": "bar"})
+        self.assertFalse(trigger.called)
+
+        provider.priority = PRIORITY_HIGH
+        provider.trigger(["my-channel"], "model.delete", {"foo": "bar"})
+        provider.trigger_batch([(["my-channel"], "model.delete", {"foo": "baz"})])
+        self.assertEqual(trigger.call_count, 1)
+        self.assertEqual(trigger_batch.call_count, 1)
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(get_overload_controller())
+        self.assertEqual(get_shedding_level(), 0)
@@ -0,0 +1,101 @@
+import threading
+from unittest import TestCase, mock
+from unittest.mock import Mock
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from drf_model_pusher.providers import PusherProvider
+from drf_model_pusher.throttling import ChannelThrottle, TokenBucket, get_throttle, parse_rate
+
+
+class TestTokenBucket(TestCase):
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("10/s"), (10, 10))
+        self.assertEqual(parse_rate("60/min"), (1, 60))
+
+    def test_bucket_refills_over_time(self):
+        bucket = TokenBucket(rate=1, capacity=1)
+        now = bucket.updated
+
+        self.assertEqual(bucket.consume(now), 0)
+        self.assertAlmostEqual(bucket.consume(now), 1)
+        self.assertEqual(bucket.consume(now + 1), 0)
+
+
+class TestChannelThrottle(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_drops_events_over_channel_rate(self):
+        throttle = ChannelThrottle(channel_rates={"noisy-*": "2/m"})
+        send = Mock()
+
+        results = [throttle.filter_channels(["noisy-1", "quiet"], "a.update", {}, None, send) for _ in range(3)]
+
+        self.assertEqual(results, [["noisy-1", "quiet"], ["noisy-1", "quiet"], ["quiet"]])
+        self.assertEqual(throttle.metrics["drop"], 1)
+
+    def test_event_rates_are_per_channel_and_event_name(self):
+        throttle = ChannelThrottle(event_rates={"*.update": "1/m"})
+
+        self.assertEqual(throttle.filter_channels(["a", "b"], "x.update", {}, None, Mock()), ["a", "b"])
+        self.assertEqual(throttle.filter_channels(["a", "b"], "x.update", {}, None, Mock()), [])
+        self.assertEqual(throttle.filter_channels(["a", "b"], "x.create", {}, None, Mock()), ["a", "b"])
+
+    def test_coalesces_to_latest_event(self):
+        throttle = ChannelThrottle(channel_rates={"*": "1/m"}, action="coalesce")
+        send = Mock()
+
+        with mock.patch.object(throttle, "call_later") as call_later:
+            throttle.filter_channels(["a"], "x.update", {"v": 1}, None, send)
+            throttle.filter_channels(["a"], "x.update", {"v": 2}, None, send)
+            throttle.filter_channels(["a"], "x.update", {"v": 3}, None, send)
+
+        self.assertEqual(call_later.call_count, 1)
+        self.assertEqual(throttle.metrics["coalesce"], 2)
+
+        with mock.patch.object(throttle, "consume", return_value=0):
+            throttle._flush("a", "x.update", send)
+        send.assert_called_once_with(["a"], "x.update", {"v": 3}, None)
+
+    def test_delayed_events_are_sent_by_the_scheduler(self):
+        throttle = ChannelThrottle(channel_rates={"a": "2/s"}, action="delay", max_delay=1.0)
+        sent = threading.Event()
+        send = Mock(side_effect=lambda *args: sent.set())
+
+        throttle.filter_channels(["a"], "x.update", {}, None, send)
+        throttle.filter_channels(["a"], "x.update", {}, None, send)
+        self.assertEqual(throttle.filter_channels(["a", "b"], "x.update", {"v": 1}, None, send), ["b"])
+
+        self.assertTrue(sent.wait(2))
+        send.assert_called_once_with(["a"], "x.update", {"v": 1}, None)
+        self.assertEqual(throttle.metrics["delay"], 1)
+
+    def test_buckets_are_bounded(self):
+        throttle = ChannelThrottle(channel_rates={"*": "1/m"}, max_keys=2)
+
+        for channel in ("a", "b", "c"):
+            throttle.filter_channels([channel], "x.update", {}, None, Mock())
+
+        self.assertEqual(list(throttle.store._buckets), ["channel:b", "channel:c"])
+        self.assertEqual(len(throttle._rates), 2)
+
+    def test_shared_buckets_use_the_cache(self):
+        throttle = ChannelThrottle(channel_rates={"*": "1/m"}, shared=True)
+        other_worker = ChannelThrottle(channel_rates={"*": "1/m"}, shared=True)
+
+        self.assertEqual(throttle.filter_channels(["a"], "x.update", {}, None, Mock()), ["a"])
+        self.assertEqual(other_worker.filter_channels(["a"], "x.update", {}, None, Mock()), [])
+
+
+class TestPusherProviderThrottling(TestCase):
+    @override_settings(DRF_MODEL_PUSHER_THROTTLE_RATES={"channels": {"my-channel": "1/m"}})
+    @mock.patch("pusher.Pusher.trigger")
+    def test_trigger_drops_throttled_channels(self, trigger: Mock):
+        provider = PusherProvider()
+        provider.trigger(["my-channel"], "myevent", {"foo": "bar"})
+        provider.trigger(["my-channel"], "myevent", {"foo": "bar"})
+
+        self.assertEqual(trigger.call_count, 1)
+        self.assertEqual(get_throttle().metrics["drop"], 1)
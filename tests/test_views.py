@@ -1,14 +1,29 @@
+import json
 from unittest import TestCase, mock
 from unittest.mock import Mock
 
+from django.contrib.auth.models import User
 from django.core.cache import cache
+from django.test import override_settings
+from pusher import Pusher
 from pytest import mark
 from rest_framework import status
-from rest_framework.test import APIRequestFactory
-
-from drf_model_pusher.views import ChannelExistenceWebhook
-from example.models import MyPublicModel, MyPrivateModel, MyPresenceModel
-from example.serializers import MyPublicModelSerializer, MyPrivateModelSerializer, MyPresenceModelSerializer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from drf_model_pusher.backends import PusherBackend, pusher_backend_registry
+from drf_model_pusher.channel_auth import AuthenticatedChannelPermission, ChannelPermission
+from drf_model_pusher.providers import get_occupied_cache_key
+from drf_model_pusher.event_log import ChannelEventLog
+from drf_model_pusher.signals import view_post_save
+from drf_model_pusher.views import ChannelAuthView, ChannelExistenceWebhook, ChannelSnapshotView
+from example.models import MyBulkModel, MyPublicModel, MyPrivateModel, MyPresenceModel
+from example.serializers import (
+    MyBulkModelSerializer,
+    MyPublicModelSerializer,
+    MyPrivateModelSerializer,
+    MyPresenceModelSerializer,
+)
+from example.pusher_backends import MyPublicModelPusherBackend
 from example.views import MyPublicModelViewSet, MyPrivateModelViewSet, MyPresenceModelViewSet
 
 
@@ -67,7 +82,7 @@ class TestModelPusherViewMixinPublicChannels(TestCase):
             instance = MyPublicModel.objects.get(pk=instance.pk)
 
         trigger.assert_called_once_with(
-            ["channel"], "mypublicmodel.delete", MyPublicModelSerializer(instance=instance).data, None
+            ["channel"], "mypublicmodel.delete", {"id": instance.pk}, None
         )
 
 
@@ -126,7 +141,7 @@ class TestModelPusherViewMixinPrivateChannels(TestCase):
             instance = MyPrivateModel.objects.get(pk=instance.pk)
 
         trigger.assert_called_once_with(
-            ["private-channel"], "myprivatemodel.delete", MyPrivateModelSerializer(instance=instance).data, None
+            ["private-channel"], "myprivatemodel.delete", {"id": instance.pk}, None
         )
 
 
@@ -185,7 +200,7 @@ class TestModelPusherViewMixinPresenceChannels(TestCase):
             instance = MyPresenceModel.objects.get(pk=instance.pk)
 
         trigger.assert_called_once_with(
-            ["presence-channel"], "mypresencemodel.delete", MyPresenceModelSerializer(instance=instance).data, None
+            ["presence-channel"], "mypresencemodel.delete", {"id": instance.pk}, None
         )
 
 
@@ -323,3 +338,300 @@ class TestChannelExistenceWebhook(TestCase):
         self.assertTrue(validate_webhook.called)
         self.assertFalse(cache.get("drf-model-pusher:occupied:my-channel"))
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class TestModelPusherViewMixinBackendResolution(TestCase):
+    """Test how the mixin resolves and reuses pusher backends."""
+
+    def test_model_resolved_from_serializer_without_queryset(self):
+        class MyView(MyPublicModelViewSet):
+            queryset = None
+
+            def get_queryset(self):
+                raise AssertionError("get_queryset should not be called")
+
+        view = MyView()
+        self.assertEqual(view.get_pusher_model(), MyPublicModel)
+        self.assertEqual(len(view.pusher_backends), 1)
+
+    def test_backends_resolved_once_per_view_class(self):
+        with mock.patch("drf_model_pusher.views.get_models_pusher_backends") as get_backends:
+            get_backends.return_value = []
+
+            class MyView(MyPublicModelViewSet):
+                pass
+
+            MyView()
+            MyView()
+
+        self.assertEqual(get_backends.call_count, 1)
+
+    def test_backend_instances_reused_within_a_request(self):
+        view = MyPublicModelViewSet()
+        view.request = APIRequestFactory().get("/mymodels/")
+
+        self.assertIs(view.get_pusher_backends()[0], view.get_pusher_backends()[0])
+
+
+class TestChannelExistenceWebhookPerApp(TestCase):
+    """Test the ChannelExistenceWebhook for apps configured in DRF_MODEL_PUSHER_APPS"""
+    def tearDown(self):
+        cache.clear()
+
+    @mock.patch("pusher.Pusher.validate_webhook")
+    def test_occupied_channel_stored_in_app_cache(self, validate_webhook: Mock):
+        data = {
+            "time_ms": 123456789,
+            "events": [
+                {"name": "channel_occupied", "channel": "my-channel"}
+            ]
+        }
+
+        headers = dict(
+            HTTP_X_PUSHER_KEY="key-a",
+            HTTP_X_PUSHER_SIGNATURE="123456789"
+        )
+
+        apps = {"app-a": {"app_id": "1", "key": "key-a", "secret": "secret-a"}}
+        with override_settings(DRF_MODEL_PUSHER_APPS=apps):
+            request_factory = APIRequestFactory()
+            create_request = request_factory.post(path="/pusher/channel-existence/", data=data, **headers)
+            view = ChannelExistenceWebhook.as_view(pusher_app="app-a")
+            response = view(create_request)
+
+        self.assertTrue(validate_webhook.called)
+        self.assertTrue(cache.get(get_occupied_cache_key("my-channel", "app-a")))
+        self.assertIsNone(cache.get(get_occupied_cache_key("my-channel")))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+@mark.django_db
+class TestModelPusherViewMixinFanOut(TestCase):
+    """Test merging identical packets from several backends."""
+
+    @mock.patch("pusher.Pusher.trigger")
+    def test_identical_payloads_are_merged(self, trigger: Mock):
+        class MyOtherChannelBackend(PusherBackend):
+            serializer_class = MyPublicModelSerializer
+
+            def get_channels(self, instance=None):
+                return ["other-channel", "channel"]
+
+        try:
+            view = MyPublicModelViewSet.as_view({"post": "create"})
+            view(APIRequestFactory().post(path="/mymodels/", data={"name": "Henry"}))
+        finally:
+            pusher_backend_registry.unregister(MyOtherChannelBackend)
+
+        trigger.assert_called_once_with(
+            ["channel", "other-channel"], "mypublicmodel.create", {"name": "Henry"}, None
+        )
+
+    @mock.patch("pusher.Pusher.trigger")
+    def test_merged_packets_are_sent_by_the_first_backend(self, trigger: Mock):
+        class MyOtherChannelBackend(PusherBackend):
+            serializer_class = MyPublicModelSerializer
+
+            def get_channels(self, instance=None):
+                return ["other-channel", "other-channel"]
+
+        senders = []
+
+        def receiver(sender, **kwargs):
+            senders.append(sender)
+
+        view_post_save.connect(receiver)
+        try:
+            view = MyPublicModelViewSet.as_view({"post": "create"})
+            view(APIRequestFactory().post(path="/mymodels/", data={"name": "Henry"}))
+        finally:
+            view_post_save.disconnect(receiver)
+            pusher_backend_registry.unregister(MyOtherChannelBackend)
+
+        self.assertEqual(senders, [MyPublicModelPusherBackend])
+        trigger.assert_called_once_with(
+            ["channel", "other-channel"], "mypublicmodel.create", {"name": "Henry"}, None
+        )
+
+    @override_settings(DRF_MODEL_PUSHER_MAX_CHANNELS=2)
+    @mock.patch("pusher.Pusher.trigger")
+    def test_merged_channels_are_chunked(self, trigger: Mock):
+        class MyManyChannelsViewSet(MyPublicModelViewSet):
+            def get_pusher_channels(self):
+                return ["a", "b", "c"]
+
+        view = MyManyChannelsViewSet.as_view({"post": "create"})
+        view(APIRequestFactory().post(path="/mymodels/", data={"name": "Henry"}))
+
+        self.assertEqual([call[0][0] for call in trigger.call_args_list], [["a", "b"], ["c"]])
+
+
+class TeamChannelPermission(ChannelPermission):
+    pattern = r"^private-team-(\d+)-"
+    cache_timeout = 60
+    checked = []
+
+    def has_permission(self, request, channel, match):
+        self.checked.append(channel)
+        return match.group(1) == "1"
+
+
+@mark.django_db
+class TestChannelAuthView(TestCase):
+    def setUp(self):
+        cache.clear()
+        TeamChannelPermission.checked = []
+        self.user = User.objects.create(username="henry")
+
+    def tearDown(self):
+        self.user.delete()
+
+    def post(self, data, format=None, **view_kwargs):
+        request = APIRequestFactory().post("/pusher/auth/", data, format=format)
+        force_authenticate(request, user=self.user)
+        view_kwargs.setdefault("channel_permission_classes", [AuthenticatedChannelPermission])
+        return ChannelAuthView.as_view(**view_kwargs)(request)
+
+    def test_single_channel(self):
+        response = self.post({"socket_id": "1234.1234", "channel_name": "private-a"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data, Pusher(app_id="123456", key="ok", secret="ok").authenticate("private-a", "1234.1234")
+        )
+
+    def test_presence_channel(self):
+        response = self.post({"socket_id": "1234.1234", "channel_name": "presence-a"})
+
+        self.assertEqual(json.loads(response.data["channel_data"]), {"user_id": str(self.user.pk)})
+        self.assertEqual(
+            response.data,
+            Pusher(app_id="123456", key="ok", secret="ok").authenticate(
+                "presence-a", "1234.1234", json.loads(response.data["channel_data"])
+            ),
+        )
+
+    def test_single_channel_denied(self):
+        response = self.post({"socket_id": "1234.1234", "channel_name": "public-a"})
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_channels_are_denied_by_default(self):
+        response = self.post({"socket_id": "1234.1234", "channel_name": "private-a"}, channel_permission_classes=[])
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_invalid_socket_id(self):
+        response = self.post({"socket_id": "1234", "channel_name": "private-a"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batched_channels(self):
+        response = self.post(
+            {
+                "socket_id": "1234.1234",
+                "channel_name[0]": "private-team-1-a",
+                "channel_name[1]": "private-team-1-b",
+                "channel_name[2]": "private-team-2-a",
+            },
+            channel_permission_classes=[TeamChannelPermission],
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data), ["private-team-1-a", "private-team-1-b", "private-team-2-a"])
+        self.assertEqual(response.data["private-team-1-b"]["status"], 200)
+        self.assertEqual(response.data["private-team-2-a"], {"status": 403})
+        self.assertEqual(TeamChannelPermission.checked, ["private-team-1-a", "private-team-1-b", "private-team-2-a"])
+
+    def test_permissions_are_cached_across_requests(self):
+        data = {"socket_id": "1234.1234", "channel_name": ["private-team-1-a", "private-team-1-b"]}
+        self.post(data, format="json", channel_permission_classes=[TeamChannelPermission])
+        response = self.post(data, format="json", channel_permission_classes=[TeamChannelPermission])
+
+        self.assertEqual(response.data["private-team-1-b"]["status"], 200)
+        self.assertEqual(TeamChannelPermission.checked, ["private-team-1-a", "private-team-1-b"])
+
+
+class MyLoggedBulkModelBackend(PusherBackend):
+    serializer_class = MyBulkModelSerializer
+    event_log_class = ChannelEventLog
+
+    class Meta:
+        auto_register = False
+
+
+class MyBulkSnapshotView(ChannelSnapshotView):
+    pusher_backend = MyLoggedBulkModelBackend
+    chunk_size = 2
+
+    def get_snapshot_queryset(self, request, channel):
+        return MyBulkModel.objects.order_by("pk")
+
+
+@mark.django_db
+class TestChannelSnapshotView(TestCase):
+    def setUp(self):
+        cache.clear()
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            MyBulkModel.objects.bulk_create([MyBulkModel(name=str(i)) for i in range(5)])
+
+    def tearDown(self):
+        with mock.patch("pusher.Pusher.trigger_batch"):
+            MyBulkModel.objects.all().delete()
+
+    def get(self, channel="bulk-channel", user=None, **headers):
+        request = APIRequestFactory().get("/snapshot/", {"channel": channel}, **headers)
+        if user is not None:
+            force_authenticate(request, user=user)
+        return MyBulkSnapshotView.as_view()(request)
+
+    def test_snapshot_is_streamed(self):
+        ChannelEventLog().append("bulk-channel", "mybulkmodel.update", {})
+
+        response = self.get()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            json.loads(b"".join(response.streaming_content)),
+            {"channel": "bulk-channel", "seq": 1, "results": [{"name": str(i)} for i in range(5)]},
+        )
+
+    def test_unchanged_snapshots_are_not_modified(self):
+        ChannelEventLog().append("bulk-channel", "mybulkmodel.update", {})
+        etag = self.get()["ETag"]
+
+        with mock.patch.object(MyBulkSnapshotView, "get_snapshot_queryset") as get_snapshot_queryset:
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(get_snapshot_queryset.called)
+
+        ChannelEventLog().append("bulk-channel", "mybulkmodel.update", {})
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_snapshots_are_private_to_each_user(self):
+        ChannelEventLog().append("bulk-channel", "mybulkmodel.update", {})
+        user = User.objects.create(username="henry")
+        try:
+            response = self.get(user=user)
+            self.assertEqual(response["Cache-Control"], "private, no-cache")
+            self.assertIn("Authorization, Cookie", response["Vary"])
+
+            # Another user's ETag doesn't match
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response["ETag"]).status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                self.get(user=user, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, status.HTTP_304_NOT_MODIFIED
+            )
+        finally:
+            user.delete()
+
+    def test_channels_without_events_have_no_etag(self):
+        response = self.get()
+
+        self.assertFalse(response.has_header("ETag"))
+        self.assertEqual(json.loads(b"".join(response.streaming_content))["seq"], 0)
+
+    def test_private_channels_are_denied(self):
+        self.assertEqual(self.get("private-channel").status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,187 @@
+import hashlib
+import hmac
+import json
+import time
+from unittest import TestCase, mock
+
+from django.core.cache import cache
+from django.test import override_settings
+from pytest import mark
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from drf_model_pusher.occupancy import get_channels_occupancy
+from drf_model_pusher.views import DeferredPusherWebhook
+from drf_model_pusher.webhooks import (
+    WebhookChanges,
+    WebhookIngestor,
+    get_subscription_count,
+    is_presence_member,
+    parse_webhook,
+)
+
+
+def webhook_request(data, secret="ok", key="ok"):
+    body = json.dumps(data).encode("utf-8")
+    signature = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return APIRequestFactory().post(
+        "/pusher/webhooks/",
+        data=body,
+        content_type="application/json",
+        HTTP_X_PUSHER_KEY=key,
+        HTTP_X_PUSHER_SIGNATURE=signature,
+    )
+
+
+@mark.django_db
+class TestDeferredPusherWebhook(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(DRF_MODEL_PUSHER_WEBHOOK_FLUSH_INTERVAL=None)
+    def test_events_are_applied(self):
+        data = {"time_ms": 1, "events": [{"name": "channel_occupied", "channel": "my-channel"}]}
+
+        response = DeferredPusherWebhook.as_view()(webhook_request(data))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(get_channels_occupancy(["my-channel"]), {"my-channel": True})
+
+    def test_events_are_deferred(self):
+        data = {"time_ms": 1, "events": [{"name": "channel_occupied", "channel": "my-channel"}]}
+
+        with override_settings(DRF_MODEL_PUSHER_WEBHOOK_FLUSH_INTERVAL=0.01):
+            response = DeferredPusherWebhook.as_view()(webhook_request(data))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            for _ in range(100):
+                if get_channels_occupancy(["my-channel"])["my-channel"]:
+                    break
+                time.sleep(0.01)
+
+        self.assertEqual(get_channels_occupancy(["my-channel"]), {"my-channel": True})
+
+    def test_invalid_signature_is_rejected(self):
+        data = {"time_ms": 1, "events": [{"name": "channel_occupied", "channel": "my-channel"}]}
+
+        response = DeferredPusherWebhook.as_view()(webhook_request(data, secret="wrong"))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(get_channels_occupancy(["my-channel"]), {"my-channel": None})
+
+    def test_invalid_body_is_rejected(self):
+        response = DeferredPusherWebhook.as_view()(webhook_request({"events": []}))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestWebhookIngestor(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_parse_webhook_skips_unknown_events(self):
+        body = json.dumps(
+            {
+                "time_ms": 1,
+                "events": [{"name": "client_event", "channel": "a"}, {"name": "channel_vacated", "channel": "b"}],
+            }
+        ).encode("utf-8")
+
+        self.assertEqual(parse_webhook(body), (1, [{"name": "channel_vacated", "channel": "b"}]))
+
+    def test_parse_webhook_rejects_events_without_a_channel(self):
+        with self.assertRaises(ValueError):
+            parse_webhook(b'{"time_ms": 1, "events": [{"name": "channel_vacated"}]}')
+
+    def test_batches_keep_the_latest_state(self):
+        ingestor = WebhookIngestor()
+        ingestor.submit(None, 2, [{"name": "channel_vacated", "channel": "my-channel"}])
+        ingestor.submit(None, 1, [{"name": "channel_occupied", "channel": "my-channel"}])
+        ingestor.submit(None, 1, [{"name": "channel_occupied", "channel": "other-channel"}])
+
+        with mock.patch("drf_model_pusher.webhooks.set_channels_occupancy") as set_channels_occupancy:
+            self.assertEqual(ingestor.flush(), 3)
+        ingestor.stop()
+
+        set_channels_occupancy.assert_has_calls(
+            [mock.call(["my-channel"], False, app=None), mock.call(["other-channel"], True, app=None)], any_order=True
+        )
+        self.assertEqual(set_channels_occupancy.call_count, 2)
+
+    def test_subscription_counts(self):
+        changes = WebhookChanges()
+        changes.add("app-a", 1, [{"name": "subscription_count", "channel": "my-channel", "subscription_count": 3}])
+        changes.add("app-a", 2, [{"name": "subscription_count", "channel": "other-channel", "subscription_count": 0}])
+
+        WebhookIngestor(flush_interval=None).apply(changes)
+
+        self.assertEqual(get_subscription_count("my-channel", "app-a"), 3)
+        self.assertEqual(
+            get_channels_occupancy(["my-channel", "other-channel"], "app-a"),
+            {"my-channel": True, "other-channel": False},
+        )
+
+    def test_presence_members(self):
+        ingestor = WebhookIngestor(flush_interval=None)
+        ingestor.submit(
+            None,
+            1,
+            [
+                {"name": "member_added", "channel": "presence-channel", "user_id": "1"},
+                {"name": "member_added", "channel": "presence-channel", "user_id": "2"},
+                {"name": "member_removed", "channel": "presence-channel", "user_id": "1"},
+            ],
+        )
+        self.assertFalse(is_presence_member("presence-channel", 1))
+        self.assertTrue(is_presence_member("presence-channel", 2))
+        self.assertEqual(get_channels_occupancy(["presence-channel"]), {"presence-channel": True})
+
+        ingestor.submit(None, 2, [{"name": "channel_vacated", "channel": "presence-channel"}])
+        self.assertFalse(is_presence_member("presence-channel", 2))
+        self.assertEqual(get_subscription_count("presence-channel"), 0)
+
+        ingestor.submit(None, 3, [{"name": "member_added", "channel": "presence-channel", "user_id": "2"}])
+        self.assertTrue(is_presence_member("presence-channel", 2))
+
+    def test_members_are_updated_separately(self):
+        ingestor = WebhookIngestor(flush_interval=None)
+        first, second = WebhookChanges(), WebhookChanges()
+        first.add(None, 1, [{"name": "member_added", "channel": "presence-channel", "user_id": "1"}])
+        second.add(None, 1, [{"name": "member_added", "channel": "presence-channel", "user_id": "2"}])
+
+        # Batches of concurrent workers don't overwrite each other's members
+        ingestor.apply(first)
+        ingestor.apply(second)
+
+        self.assertTrue(is_presence_member("presence-channel", 1))
+        self.assertTrue(is_presence_member("presence-channel", 2))
+
+    def test_older_webhooks_are_ignored_across_batches(self):
+        ingestor = WebhookIngestor(flush_interval=None)
+        ingestor.submit(None, 2, [{"name": "channel_vacated", "channel": "my-channel"}])
+        ingestor.submit(None, 1, [{"name": "channel_occupied", "channel": "my-channel"}])
+        ingestor.submit(None, 3, [{"name": "subscription_count", "channel": "my-channel", "subscription_count": 2}])
+        ingestor.submit(None, 1, [{"name": "subscription_count", "channel": "my-channel", "subscription_count": 5}])
+        ingestor.submit(None, 4, [{"name": "member_removed", "channel": "presence-channel", "user_id": "1"}])
+        ingestor.submit(None, 3, [{"name": "member_added", "channel": "presence-channel", "user_id": "1"}])
+
+        self.assertEqual(get_channels_occupancy(["my-channel"]), {"my-channel": True})
+        self.assertEqual(get_subscription_count("my-channel"), 2)
+        self.assertFalse(is_presence_member("presence-channel", 1))
+
+    @override_settings(DRF_MODEL_PUSHER_OCCUPANCY_TIMEOUT=60)
+    def test_state_expires_with_occupancy(self):
+        changes = WebhookChanges()
+        changes.add(
+            None,
+            1,
+            [
+                {"name": "subscription_count", "channel": "my-channel", "subscription_count": 2},
+                {"name": "channel_vacated", "channel": "presence-channel"},
+                {"name": "member_added", "channel": "other-presence-channel", "user_id": "1"},
+            ],
+        )
+
+        with mock.patch("drf_model_pusher.webhooks.cache.set_many") as set_many:
+            WebhookIngestor(flush_interval=None).apply(changes)
+
+        self.assertEqual({call[1]["timeout"] for call in set_many.call_args_list}, {60})